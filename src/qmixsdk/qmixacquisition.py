@@ -0,0 +1,149 @@
+import os
+import ctypes
+import threading
+import numpy as np
+from collections import namedtuple
+from . import qmixbus
+from . import qmixanalogio
+from . import qmixcontroller
+from . import qmixtelemetry
+
+
+AcquisitionStatistics = namedtuple("acquisition_statistics", ["count", "missed", "rate_hz",
+    "jitter_mean_ms", "jitter_p50_ms", "jitter_p99_ms", "jitter_max_ms", "overruns",
+    "read_p50_ms", "read_p99_ms", "read_max_ms"])
+
+
+class AcquisitionEngine:
+    """
+    Samples analog input channels and the actual values of controller
+    channels at a fixed rate in a dedicated thread.
+
+    Each period starts at an absolute deadline of a drift free timer that
+    sleeps until shortly before the deadline and busy waits for the spin
+    time. The library writes the values directly into a preallocated sample
+    array, which is appended together with a DeadlineTimer.get_nsecs()
+    timestamp, i.e. the clock of the timer, to a preallocated ring buffer
+    with one column per channel - the analog inputs first, then the
+    controllers. A sample is an overrun if reading
+    all channels took longer than one period. Optionally the thread is
+    pinned to a set of CPUs (Linux only). If reading a channel fails, the
+    engine stops and the error is raised by stop().
+    """
+    def __init__(self, analog_inputs = (), controllers = (), rate_hz = 100,
+        capacity = 100000, spin_s = 0.002, cpus = None, sinks = ()):
+        if cpus is not None and not hasattr(os, "sched_setaffinity"):
+            raise ValueError("CPU pinning is not supported on this platform")
+        self.analog_inputs = list(analog_inputs)
+        self.controllers = list(controllers)
+        self.names = [channel.get_name() for channel in self.analog_inputs] \
+            + [channel.get_name() for channel in self.controllers]
+        self.period_s = 1.0 / rate_hz
+        self.cpus = None if cpus is None else set(cpus)
+        self.sinks = list(sinks)
+        self.buffer = qmixtelemetry.RingBuffer(capacity, len(self.names))
+        self.timer = qmixbus.DeadlineTimer(self.period_s, spin_s)
+        self.statistics = qmixbus.LoopStatistics(self.period_s)
+        # Duration of reading all channels of a sample
+        self.read_time = qmixbus.DurationStatistics()
+        self.overruns = 0
+        self.error = None
+        self._sample = np.zeros(len(self.names))
+        values = (ctypes.c_double * len(self.names)).from_buffer(self._sample)
+        refs = [ctypes.byref(values, i * ctypes.sizeof(ctypes.c_double))
+            for i in range(len(self.names))]
+        reads = [(qmixanalogio.analogio_api.LCAIO_ReadInput, channel.handle,
+            "LCAIO_ReadInput") for channel in self.analog_inputs] \
+            + [(qmixcontroller.ctrl_api.LCC_ReadActualValue, channel.handle,
+            "LCC_ReadActualValue") for channel in self.controllers]
+        self._reads = [(read, handle, ref, api_name)
+            for (read, handle, api_name), ref in zip(reads, refs)]
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """
+        Starts the acquisition thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self.overruns = 0
+        self.statistics.reset()
+        self.read_time.reset()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the acquisition thread. If the acquisition thread terminated
+        with an error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def is_running(self):
+        """
+        Returns true if the acquisition thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample_once(self):
+        """
+        Reads all channels once and appends the sample to the ring buffer
+        """
+        throw_on_error = qmixbus.throw_on_error
+        timestamp = self.timer.get_nsecs()
+        for read, handle, ref, api_name in self._reads:
+            throw_on_error(read(handle, ref), api_name)
+        self.buffer.append(timestamp, self._sample)
+        for sink in self.sinks:
+            sink.append(timestamp, self._sample)
+
+    def _run(self):
+        """
+        Thread function of the acquisition engine
+        """
+        timer = self.timer
+        get_nsecs = timer.get_nsecs
+        period_ns = timer.period_ns
+        try:
+            if self.cpus is not None:
+                os.sched_setaffinity(0, self.cpus)
+            timer.start()
+            while not self._stop_event.is_set():
+                started = get_nsecs()
+                self.sample_once()
+                read_ns = get_nsecs() - started
+                self.read_time.add(read_ns)
+                if read_ns > period_ns:
+                    self.overruns += 1
+                tick = timer.tick
+                lateness = timer.wait_next()
+                self.statistics.add(lateness, timer.tick - tick - 1)
+        except (qmixbus.DeviceError, OSError) as e:
+            self.error = e
+
+    def get_window(self, n = None):
+        """
+        Returns the timestamps and the values of the latest n samples as
+        named tuple of NumPy views. The values have one column per channel.
+        """
+        timestamps, values = self.buffer.latest(n)
+        window = namedtuple("window", ["timestamps_ns", "values"])
+        return window(timestamps, values)
+
+    def get_statistics(self):
+        """
+        Returns the achieved rate, the jitter statistics, the number of
+        overruns and the time required to read all channels as named tuple.
+        All times are given in milliseconds.
+        """
+        read_time = self.read_time.get_statistics()
+        return AcquisitionStatistics(*self.statistics.get_statistics(), self.overruns,
+            read_time.p50_ms, read_time.p99_ms, read_time.max_ms)
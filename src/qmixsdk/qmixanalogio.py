@@ -224,3 +224,139 @@ class AnalogOutChannel(AnalogChannel):
         qmixbus.throw_on_error(result)
         scaling = namedtuple("scaling", ["factor", "offset"])
         return scaling(factor.value, offset.value)
+
+
+
+class AnalogInputScanner:
+    """
+    Reads a list of analog input channels into a preallocated NumPy array.
+
+    The values are written by the library directly into the memory of the
+    preallocated arrays of the scanner, so a scan requires no Python objects
+    per channel. The scaling Scaled Value = (Process Value * Factor) + Offset
+    is applied to all channels in one vectorized operation. Disable the
+    software scaling of the library for the channels, i.e. with
+    use_channel_scaling(), to avoid scaling the values twice. A block of
+    several scans can be read into a 2D array with one row per scan. This
+    class requires NumPy.
+    """
+    def __init__(self, channels, factors = 1.0, offsets = 0.0, block_size = 1):
+        import numpy as np
+        self.channels = list(channels)
+        count = len(self.channels)
+        self.factors = np.broadcast_to(np.asarray(factors, dtype=np.float64), count).copy()
+        self.offsets = np.broadcast_to(np.asarray(offsets, dtype=np.float64), count).copy()
+        self.values = np.zeros(count)
+        self.block = np.zeros((block_size, count))
+        self._handles = [channel.handle for channel in self.channels]
+        self._value_refs = self._element_refs(self.values)
+        self._block_refs = [self._element_refs(row) for row in self.block]
+        self._value = ctypes.c_double()
+        self._value_ref = ctypes.byref(self._value)
+
+
+    @staticmethod
+    def _element_refs(array):
+        """
+        Returns ctypes references to all elements of a contiguous float64 array
+        """
+        buffer = (ctypes.c_double * len(array)).from_buffer(array)
+        return [ctypes.byref(buffer, i * ctypes.sizeof(ctypes.c_double))
+            for i in range(len(array))]
+
+
+    def use_channel_scaling(self):
+        """
+        Takes over the software scaling parameters of all channels and
+        disables the software scaling of the library for these channels
+        """
+        for i, channel in enumerate(self.channels):
+            scaling = channel.get_scaling_param()
+            self.factors[i] = scaling.factor
+            self.offsets[i] = scaling.offset
+            channel.enable_software_scaling(False)
+
+
+    def _read_into(self, refs):
+        """
+        Reads all channels into the array elements of the given references
+        """
+        read_input = analogio_api.LCAIO_ReadInput
+        throw_on_error = qmixbus.throw_on_error
+        for handle, ref in zip(self._handles, refs):
+            throw_on_error(read_input(handle, ref), "LCAIO_ReadInput")
+
+
+    def _read_copy(self, out):
+        """
+        Reads all channels into an arbitrary output array
+        """
+        read_input = analogio_api.LCAIO_ReadInput
+        throw_on_error = qmixbus.throw_on_error
+        value = self._value
+        for i, handle in enumerate(self._handles):
+            throw_on_error(read_input(handle, self._value_ref), "LCAIO_ReadInput")
+            out[i] = value.value
+
+
+    def read_raw(self, out = None):
+        """
+        Reads the unscaled values of all channels.
+
+        The values are written into the given array or into the internal
+        array of this scanner that is returned. The internal array is
+        overwritten by the next scan.
+        """
+        if out is None:
+            self._read_into(self._value_refs)
+            return self.values
+        self._read_copy(out)
+        return out
+
+
+    def scan(self, out = None):
+        """
+        Reads and scales the values of all channels.
+
+        The values are written into the given array or into the internal
+        array of this scanner that is returned.
+        """
+        values = self.read_raw(out)
+        values *= self.factors
+        values += self.offsets
+        return values
+
+
+    def scan_block(self, count = None, period_s = None, out = None):
+        """
+        Reads count scans of all channels into a 2D array with one row per
+        scan and scales the whole block at once.
+
+        If count is None, the block size of the scanner is used. If a period
+        is given, the scans are started on a drift free time grid with this
+        period, otherwise the scans are read back to back. The values are
+        written into the given array or into the internal block array of
+        this scanner that is returned.
+        """
+        if out is None:
+            count = len(self.block) if count is None else count
+            if count > len(self.block):
+                raise ValueError("Block size {} exceeds the block size {} of the "
+                    "scanner".format(count, len(self.block)))
+            block = self.block[:count]
+        else:
+            block = out if count is None else out[:count]
+        timer = None
+        if period_s is not None:
+            timer = qmixbus.DeadlineTimer(period_s)
+            timer.start()
+        for i in range(len(block)):
+            if timer is not None and i > 0:
+                timer.wait_next()
+            if out is None:
+                self._read_into(self._block_refs[i])
+            else:
+                self._read_copy(block[i])
+        block *= self.factors
+        block += self.offsets
+        return block
@@ -1,7 +1,7 @@
 import ctypes
 import time
 from enum import Enum
-from collections import namedtuple
+from collections import namedtuple, deque
 from . import _qmixloadlib
 
 bus_api = _qmixloadlib.load_lib("labbCAN_Bus_API")
@@ -176,6 +176,181 @@ class PollingTimer:
 
 
 
+class DeadlineTimer:
+    """
+    Drift free periodic timer.
+
+    The deadline of each period is computed from the absolute start time of
+    the timer and not from the time the previous period ended. So the
+    timing error of a single period does not accumulate over time. The
+    timer sleeps until shortly before the deadline and busy waits for the
+    remaining spin time to reduce the wake up jitter of the operating system
+    sleep function.
+    """
+    def __init__(self, period_s, spin_s = 0.0):
+        self.period_ns = int(period_s * 1e9)
+        self.spin_ns = int(spin_s * 1e9)
+        self.start_ns = 0
+        self.tick = 0
+
+    @staticmethod
+    def get_nsecs():
+        """
+        Helper function that returns a monotonic high resolution nanosecond
+        clock value
+        """
+        return time.perf_counter_ns()
+
+    def start(self, start_ns = None):
+        """
+        Starts the timer. The first deadline is one period after start_ns.
+        """
+        self.start_ns = self.get_nsecs() if start_ns is None else start_ns
+        self.tick = 0
+
+    def get_deadline_ns(self):
+        """
+        Returns the absolute deadline of the current tick
+        """
+        return self.start_ns + self.tick * self.period_ns
+
+    def elapsed_secs(self):
+        """
+        Returns the number of seconds since the timer was started
+        """
+        return (self.get_nsecs() - self.start_ns) / 1e9
+
+    def wait_next(self):
+        """
+        Waits for the next deadline and returns the lateness in nanoseconds.
+
+        If one or more deadlines have already been missed, the function does
+        not wait and the timer skips the missed ticks so that it stays aligned
+        to the original time grid. Use the tick attribute to detect skipped
+        ticks.
+        """
+        self.tick += 1
+        deadline = self.get_deadline_ns()
+        now = self.get_nsecs()
+        if now >= deadline:
+            if now - deadline >= self.period_ns:
+                self.tick += (now - deadline) // self.period_ns
+            return now - deadline
+        remaining = deadline - now - self.spin_ns
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+        now = self.get_nsecs()
+        while now < deadline:
+            now = self.get_nsecs()
+        return now - deadline
+
+
+
+def _percentile_ms(values, p):
+    """
+    Returns the p-th percentile of the sorted nanosecond values in milliseconds
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] / 1e6
+
+
+
+class LoopStatistics:
+    """
+    Collects timing statistics of a periodic loop.
+
+    The lateness of each loop iteration relative to its deadline is stored
+    in a bounded history that is used to compute jitter percentiles.
+    """
+    def __init__(self, period_s, history = 10000):
+        self.period_s = period_s
+        self.lateness_ns = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all collected statistics
+        """
+        self.lateness_ns.clear()
+        self.count = 0
+        self.missed = 0
+        self.start_ns = None
+        self.last_ns = None
+
+    def add(self, lateness_ns, missed = 0, timestamp_ns = None):
+        """
+        Adds the lateness of one loop iteration and the number of deadlines
+        that have been missed before this iteration.
+        """
+        timestamp_ns = DeadlineTimer.get_nsecs() if timestamp_ns is None else timestamp_ns
+        if self.start_ns is None:
+            self.start_ns = timestamp_ns
+        self.last_ns = timestamp_ns
+        self.lateness_ns.append(lateness_ns)
+        self.count += 1
+        self.missed += missed
+
+    def get_statistics(self):
+        """
+        Returns the loop timing statistics as named tuple.
+
+        All jitter values are given in milliseconds. The rate is the
+        achieved number of loop iterations per second.
+        """
+        values = sorted(self.lateness_ns)
+        duration_ns = 0 if self.start_ns is None else self.last_ns - self.start_ns
+        rate = (self.count - 1) / (duration_ns / 1e9) if duration_ns > 0 else 0.0
+        statistics = namedtuple("statistics", ["count", "missed", "rate_hz",
+            "jitter_mean_ms", "jitter_p50_ms", "jitter_p99_ms", "jitter_max_ms"])
+        return statistics(self.count, self.missed, rate,
+            sum(values) / len(values) / 1e6 if values else 0.0,
+            _percentile_ms(values, 50), _percentile_ms(values, 99),
+            values[-1] / 1e6 if values else 0.0)
+
+
+
+class DurationStatistics:
+    """
+    Collects statistics of measured durations, e.g. the latency of a
+    command or the time required to read a set of channels.
+
+    The durations are stored in a bounded history that is used to compute
+    the percentiles.
+    """
+    def __init__(self, history = 10000):
+        self.durations_ns = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        """
+        Clears all collected durations
+        """
+        self.durations_ns.clear()
+        self.count = 0
+
+    def add(self, duration_ns):
+        """
+        Adds one measured duration given in nanoseconds
+        """
+        self.durations_ns.append(duration_ns)
+        self.count += 1
+
+    def get_statistics(self):
+        """
+        Returns the number of measured durations and the mean, median, 99th
+        percentile and maximum duration as named tuple. All durations are
+        given in milliseconds.
+        """
+        values = sorted(self.durations_ns)
+        statistics = namedtuple("statistics", ["count", "mean_ms", "p50_ms", "p99_ms",
+            "max_ms"])
+        return statistics(self.count, sum(values) / len(values) / 1e6 if values else 0.0,
+            _percentile_ms(values, 50), _percentile_ms(values, 99),
+            values[-1] / 1e6 if values else 0.0)
+
+
+
 class HandleOwner:
     """
     Base class for all Qmix devices and channels that use a device handle
@@ -0,0 +1,280 @@
+import ctypes
+import threading
+import time
+from enum import Enum
+from collections import namedtuple
+from . import qmixbus
+from . import qmixpump
+
+
+class ChannelState(Enum):
+    """
+    State identifiers of a single syringe pump channel of a continuous flow
+    engine
+    """
+    idle = 0
+    switching_to_inlet = 1
+    refilling = 2
+    switching_to_outlet = 3
+    ready = 4
+    dispensing = 5
+
+
+class ContiFlowChannel:
+    """
+    A syringe pump with its valve that is used by the continuous flow engine.
+
+    The channel runs through the refill cycle (switch valve to inlet,
+    aspirate, switch valve to outlet) without blocking. The engine calls
+    update() periodically to advance the cycle.
+    """
+    def __init__(self, pump : qmixpump.Pump, inlet_position, outlet_position):
+        if not pump.has_valve():
+            raise ValueError("Pump {} has no valve".format(pump.get_pump_name()))
+        self.pump = pump
+        self.valve = pump.get_valve()
+        self.inlet_position = inlet_position
+        self.outlet_position = outlet_position
+        self.state = ChannelState.idle
+        self.volume_max = pump.get_volume_max()
+        self.refill_flow = 0
+
+
+    def start_refill(self, refill_flow):
+        """
+        Starts a new refill cycle by switching the valve to the inlet.
+        """
+        self.refill_flow = refill_flow
+        self.valve.switch_valve_to_position(self.inlet_position)
+        self.state = ChannelState.switching_to_inlet
+
+
+    def update(self):
+        """
+        Advances the refill cycle if the current phase has finished.
+        """
+        if self.state == ChannelState.switching_to_inlet:
+            if self.valve.actual_valve_position() == self.inlet_position:
+                self.pump.set_fill_level(self.volume_max, self.refill_flow)
+                self.state = ChannelState.refilling
+        elif self.state == ChannelState.refilling:
+            if not self.pump.is_pumping():
+                self.valve.switch_valve_to_position(self.outlet_position)
+                self.state = ChannelState.switching_to_outlet
+        elif self.state == ChannelState.switching_to_outlet:
+            if self.valve.actual_valve_position() == self.outlet_position:
+                self.state = ChannelState.ready
+
+
+
+class ContinuousFlowEngine:
+    """
+    Generates a continuous flow with two or more alternating syringe pumps.
+
+    One pump dispenses while the others refill. When the fill level of the
+    dispensing pump drops below the switchover level, the next ready pump
+    is started and the previous pump is stopped immediately afterwards.
+    The refill of the previous pump then overlaps with the dispensing of
+    the next one. The engine runs in its own thread and samples the total
+    flow of all dispensing pumps to compute achieved flow statistics and
+    the gaps that occur at switchovers.
+    """
+    def __init__(self, pumps, flow, inlet_positions, outlet_positions,
+        refill_flow = None, switchover_level = None, poll_period_s = 0.01,
+        gap_tolerance = 0.05):
+        if len(pumps) < 2:
+            raise ValueError("A continuous flow requires at least two pumps")
+        if flow <= 0:
+            raise ValueError("The flow needs to be a positive dispense flow")
+        if isinstance(inlet_positions, int):
+            inlet_positions = [inlet_positions] * len(pumps)
+        if isinstance(outlet_positions, int):
+            outlet_positions = [outlet_positions] * len(pumps)
+        self.channels = [ContiFlowChannel(pump, inlet, outlet) for pump, inlet, outlet
+            in zip(pumps, inlet_positions, outlet_positions)]
+        self.flow = flow
+        flow_max = min(pump.get_flow_rate_max() for pump in pumps)
+        if flow > flow_max:
+            raise ValueError("Flow {} exceeds maximum flow rate {}".format(flow, flow_max))
+        self.refill_flow = flow_max if refill_flow is None else refill_flow
+        if self.refill_flow * (len(pumps) - 1) <= flow:
+            raise ValueError("Refill flow {} is too low to sustain a flow of {}".format(
+                self.refill_flow, flow))
+        volume_max = min(channel.volume_max for channel in self.channels)
+        self.switchover_level = volume_max * 0.05 if switchover_level is None \
+            else switchover_level
+        self.poll_period_s = poll_period_s
+        self.gap_tolerance = gap_tolerance
+        self.error = None
+        self._active = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._reset_statistics()
+
+
+    def _reset_statistics(self):
+        """
+        Resets all flow and switchover statistics
+        """
+        self._sample_count = 0
+        self._flow_sum = 0.0
+        self._flow_min = float("inf")
+        self._flow_max = float("-inf")
+        self._gap_start_ns = None
+        self._start_ns = None
+        self.switchover_count = 0
+        self.switchover_gaps_ms = []
+        self.starvation_count = 0
+
+
+    def start(self):
+        """
+        Starts the refill of all pumps and the continuous flow thread.
+
+        The flow starts as soon as the first pump is refilled.
+        """
+        if self.is_running():
+            return
+        self._reset_statistics()
+        self.error = None
+        self._active = None
+        self._stop_event.clear()
+        for channel in self.channels:
+            channel.start_refill(self.refill_flow)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Stops the continuous flow thread and all pumps of this engine.
+
+        If the engine thread terminated with an error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for channel in self.channels:
+            channel.pump.stop_pumping()
+            channel.state = ChannelState.idle
+        if self.error is not None:
+            raise self.error
+
+
+    def is_running(self):
+        """
+        Returns true if the continuous flow thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+
+    def _next_ready_channel(self):
+        """
+        Returns the next ready channel after the active channel in round
+        robin order or None if no channel is ready.
+        """
+        start = 0 if self._active is None else self.channels.index(self._active) + 1
+        count = len(self.channels)
+        for i in range(count):
+            channel = self.channels[(start + i) % count]
+            if channel.state == ChannelState.ready:
+                return channel
+        return None
+
+
+    def _switch_over(self, channel):
+        """
+        Starts dispensing with the given channel and stops the active channel.
+
+        Both commands are issued back to back to keep the switchover gap small.
+        """
+        flow = ctypes.c_double(self.flow)
+        result = qmixpump.pump_api.LCP_GenerateFlow(channel.pump.handle, flow)
+        previous = self._active
+        if previous is not None:
+            previous.pump.stop_pumping()
+        qmixbus.throw_on_error(result, "LCP_GenerateFlow")
+        channel.state = ChannelState.dispensing
+        self._active = channel
+        if previous is not None:
+            self.switchover_count += 1
+            previous.start_refill(self.refill_flow)
+
+
+    def _sample_flow(self, now_ns):
+        """
+        Samples the total flow of all dispensing pumps and tracks flow gaps.
+        """
+        flow = sum(channel.pump.get_flow_is() for channel in self.channels
+            if channel.state == ChannelState.dispensing)
+        with self._lock:
+            self._sample_count += 1
+            self._flow_sum += flow
+            self._flow_min = min(self._flow_min, flow)
+            self._flow_max = max(self._flow_max, flow)
+            if flow < self.flow * (1 - self.gap_tolerance):
+                if self._gap_start_ns is None:
+                    self._gap_start_ns = now_ns
+            elif self._gap_start_ns is not None:
+                self.switchover_gaps_ms.append((now_ns - self._gap_start_ns) / 1e6)
+                self._gap_start_ns = None
+
+
+    def _run(self):
+        """
+        Thread function of the continuous flow engine
+        """
+        try:
+            while not self._stop_event.is_set():
+                for channel in self.channels:
+                    channel.update()
+                active = self._active
+                if active is None:
+                    channel = self._next_ready_channel()
+                    if channel is not None:
+                        self._switch_over(channel)
+                        self._start_ns = time.monotonic_ns()
+                elif active.pump.get_fill_level() <= self.switchover_level \
+                    or not active.pump.is_pumping():
+                    channel = self._next_ready_channel()
+                    if channel is not None:
+                        self._switch_over(channel)
+                    elif not active.pump.is_pumping():
+                        # No pump is ready and the active pump ran empty - the
+                        # flow is interrupted until the next pump is refilled
+                        self.starvation_count += 1
+                        self._active = None
+                        active.start_refill(self.refill_flow)
+                if self._start_ns is not None:
+                    self._sample_flow(time.monotonic_ns())
+                time.sleep(self.poll_period_s)
+        except qmixbus.DeviceError as e:
+            self.error = e
+            for channel in self.channels:
+                try:
+                    channel.pump.stop_pumping()
+                except qmixbus.DeviceError:
+                    pass
+
+
+    def get_statistics(self):
+        """
+        Returns the achieved flow statistics as named tuple.
+
+        The flow values are computed from the sampled actual flow of all
+        dispensing pumps since the flow started. The gap values are the
+        durations in milliseconds where the total flow was below the
+        requested flow minus the gap tolerance.
+        """
+        with self._lock:
+            count = self._sample_count
+            gaps = list(self.switchover_gaps_ms)
+            statistics = namedtuple("statistics", ["flow_mean", "flow_min", "flow_max",
+                "samples", "switchovers", "starvations", "gaps_ms", "gap_max_ms"])
+            return statistics(self._flow_sum / count if count else 0.0,
+                self._flow_min if count else 0.0,
+                self._flow_max if count else 0.0,
+                count, self.switchover_count, self.starvation_count,
+                gaps, max(gaps) if gaps else 0.0)
@@ -0,0 +1,561 @@
+import math
+import time
+from collections import namedtuple
+
+
+TimelineEvent = namedtuple("timeline_event", ["start_s", "end_s", "device", "command", "args"])
+DryRunResult = namedtuple("dry_run_result", ["duration_s", "bus_calls", "timeline"])
+
+# Default valve switch duration if the valve has not been switched before
+DEFAULT_VALVE_SWITCH_S = 0.5
+
+
+def measure_call_latency(function, count = 100):
+    """
+    Returns the mean duration in seconds of a device function call without
+    parameters, i.e. the bound is_pumping() function of a real pump.
+    """
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return (time.perf_counter() - start) / count
+
+
+
+class PumpModel:
+    """
+    Kinematic model of a pump for dry runs.
+
+    All volumes and flows are given in the volume and flow units of the
+    pump. seconds_per_volume is the time in seconds that is required to dose
+    one volume unit with a flow of one flow unit. fill_level is the initial
+    fill level of the simulated pump.
+    """
+    def __init__(self, name, flow_max, volume_max, seconds_per_volume = 1.0,
+        syringe = None, has_valve = False, fill_level = 0.0):
+        self.name = name
+        self.flow_max = flow_max
+        self.volume_max = volume_max
+        self.seconds_per_volume = seconds_per_volume
+        self.syringe = syringe
+        self.has_valve = has_valve
+        self.fill_level = fill_level
+
+    @classmethod
+    def from_pump(cls, pump):
+        """
+        Creates the model of a real pump from its flow and volume limits, its
+        syringe parameters, its units and its actual fill level
+        """
+        return cls(pump.get_pump_name(), pump.get_flow_rate_max(), pump.get_volume_max(),
+            pump.estimate_dosing_duration(1.0, 1.0), pump.get_syringe_param(),
+            pump.has_valve(), pump.get_fill_level())
+
+    def with_syringe(self, inner_diameter_mm, max_piston_stroke_mm):
+        """
+        Returns the model of the same pump with another syringe.
+
+        The maximum volume scales with the piston area and stroke and the
+        maximum flow scales with the piston area because the maximum piston
+        velocity of the pump stays the same. The fill level scales with the
+        piston area because the piston position stays the same.
+        """
+        if self.syringe is None:
+            raise ValueError("The model has no syringe parameters")
+        area_ratio = (inner_diameter_mm / self.syringe.inner_diameter_mm) ** 2
+        stroke_ratio = max_piston_stroke_mm / self.syringe.max_piston_stroke_mm
+        syringe = type(self.syringe)(inner_diameter_mm, max_piston_stroke_mm)
+        return PumpModel(self.name, self.flow_max * area_ratio,
+            self.volume_max * area_ratio * stroke_ratio, self.seconds_per_volume,
+            syringe, self.has_valve, self.fill_level * area_ratio)
+
+
+
+class AxisModel:
+    """
+    Kinematic model of an axis for dry runs.
+
+    Positions and velocities are given in the position and velocity units
+    of the axis. seconds_per_distance is the time in seconds that is required
+    to move one position unit with a velocity of one velocity unit.
+    Acceleration phases are not modelled.
+    """
+    def __init__(self, name, velocity_max, position_min, position_max,
+        seconds_per_distance = 1.0, position = None):
+        self.name = name
+        self.velocity_max = velocity_max
+        self.position_min = position_min
+        self.position_max = position_max
+        self.seconds_per_distance = seconds_per_distance
+        self.position = position_min if position is None else position
+
+    @classmethod
+    def from_axis(cls, axis):
+        """
+        Creates the model of a real axis from its velocity and position
+        limits, its units and its actual position
+        """
+        return cls(axis.get_device_name(), axis.get_velocity_max(), axis.get_position_min(),
+            axis.get_position_max(), axis.estimate_move_duration(1.0, 1.0),
+            axis.get_actual_position())
+
+
+
+class ValveModel:
+    """
+    Model of a valve for dry runs
+    """
+    def __init__(self, name, position_count, switch_duration_s = DEFAULT_VALVE_SWITCH_S,
+        position = 0):
+        self.name = name
+        self.position_count = position_count
+        self.switch_duration_s = switch_duration_s
+        self.position = position
+
+    @classmethod
+    def from_valve(cls, valve):
+        """
+        Creates the model of a real valve. The switch duration measured by
+        Valve.switch_and_wait() is used if available.
+        """
+        duration = valve.switch_duration_s
+        return cls(valve.get_device_name(), valve.number_of_valve_positions(),
+            DEFAULT_VALVE_SWITCH_S if duration is None else duration,
+            valve.actual_valve_position())
+
+
+
+class DryRun:
+    """
+    Runs a protocol script against simulated devices in virtual time.
+
+    The simulated devices provide the command and status functions of the
+    qmixpump, qmixvalve and qmixmotion device classes. Each function call
+    advances the virtual clock by the bus latency, i.e. measured with
+    measure_call_latency() on the real system. Waiting in the script needs
+    to use sleep() and monotonic() of the dry run instead of the time module,
+    so the script runs as fast as possible. Each command is recorded in the
+    timeline with its start time and its modelled end time. A command ends
+    early if its device is stopped or receives another command before the
+    modelled end time.
+    """
+    def __init__(self, latency_s = 0.0):
+        self.latency_s = latency_s
+        self.now = 0.0
+        self.bus_calls = 0
+        self.timeline = []
+
+    def monotonic(self):
+        """
+        Returns the virtual time in seconds
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Advances the virtual time
+        """
+        self.now += max(0.0, seconds)
+
+    def _call(self):
+        """
+        Accounts for one bus call and returns the virtual time after the call
+        """
+        self.bus_calls += 1
+        self.now += self.latency_s
+        return self.now
+
+    def _record(self, device, command, duration_s, *args):
+        """
+        Records a command that has been issued at the current virtual time and
+        returns the index of its timeline event
+        """
+        self.timeline.append(TimelineEvent(self.now, self.now + duration_s, device,
+            command, args))
+        return len(self.timeline) - 1
+
+    def _interrupt(self, index):
+        """
+        Ends the timeline event with the given index at the current virtual
+        time if it is still running, i.e. if the device is stopped or receives
+        a new command
+        """
+        if index is not None and self.timeline[index].end_s > self.now:
+            self.timeline[index] = self.timeline[index]._replace(end_s=self.now)
+
+    def add_pump(self, model : PumpModel, valve_model : ValveModel = None):
+        """
+        Returns a simulated pump. If a valve model is given, the pump has a
+        simulated valve.
+        """
+        valve = SimulatedValve(self, valve_model) if valve_model is not None else None
+        return SimulatedPump(self, model, valve)
+
+    def add_valve(self, model : ValveModel):
+        """
+        Returns a simulated valve
+        """
+        return SimulatedValve(self, model)
+
+    def add_axis(self, model : AxisModel):
+        """
+        Returns a simulated axis
+        """
+        return SimulatedAxis(self, model)
+
+    def add_axis_system(self, name, axis_models):
+        """
+        Returns a simulated XY axis system with the given X and Y axis models
+        """
+        return SimulatedAxisSystem(self, name, [SimulatedAxis(self, model)
+            for model in axis_models])
+
+    def run(self, script, *args):
+        """
+        Calls the script function with the given arguments, i.e. the
+        simulated devices, and returns the estimated duration, the number of
+        bus calls and the timeline.
+
+        The duration includes commands that are still running when the
+        script returns.
+        """
+        script(*args)
+        end = max([self.now] + [event.end_s for event in self.timeline])
+        return DryRunResult(end, self.bus_calls, sorted(self.timeline,
+            key=lambda event: event.start_s))
+
+
+
+class SimulatedPump:
+    """
+    Simulated pump with the qmixpump.Pump functions used by protocol scripts.
+
+    The fill level changes linearly with the flow. A zero flow, flows above
+    the maximum flow of the model and fill levels outside of the syringe
+    volume raise a ValueError.
+    """
+    def __init__(self, dry_run : DryRun, model : PumpModel, valve = None):
+        self.dry_run = dry_run
+        self.model = model
+        self.valve = valve
+        self._level = model.fill_level
+        self._flow = 0.0
+        self._start = 0.0
+        self._end = 0.0
+        self._event = None
+
+    def _update(self):
+        """
+        Updates the fill level to the current virtual time
+        """
+        now = self.dry_run.now
+        if not self._flow:
+            return
+        end = min(now, self._end)
+        self._level -= self._flow * (end - self._start) / self.model.seconds_per_volume
+        self._start = end
+        if now >= self._end:
+            self._flow = 0.0
+
+    def _start_flow(self, command, volume, flow):
+        """
+        Starts dosing of a signed volume (positive for dispensing)
+        """
+        self.dry_run._call()
+        self._update()
+        if not flow:
+            raise ValueError("Flow of pump {} needs to be non-zero".format(self.model.name))
+        if abs(flow) > self.model.flow_max:
+            raise ValueError("Flow {} exceeds maximum flow rate {} of pump {}".format(
+                flow, self.model.flow_max, self.model.name))
+        level = self._level - volume
+        if math.isfinite(volume) and not -1e-9 <= level <= self.model.volume_max + 1e-9:
+            raise ValueError("Fill level {} of pump {} out of range".format(level,
+                self.model.name))
+        duration = abs(volume / flow) * self.model.seconds_per_volume
+        self.dry_run._interrupt(self._event)
+        self._flow = math.copysign(abs(flow), volume)
+        self._start = self.dry_run.now
+        self._end = self._start + duration
+        self._event = self.dry_run._record(self.model.name, command, duration, volume, flow)
+
+    def get_pump_name(self):
+        return self.model.name
+
+    def get_flow_rate_max(self):
+        self.dry_run._call()
+        return self.model.flow_max
+
+    def get_volume_max(self):
+        self.dry_run._call()
+        return self.model.volume_max
+
+    def estimate_dosing_duration(self, volume, flow):
+        return abs(volume / flow) * self.model.seconds_per_volume
+
+    def has_valve(self):
+        return self.valve is not None
+
+    def get_valve(self):
+        return self.valve
+
+    def aspirate(self, volume, flow):
+        self._start_flow("aspirate", -abs(volume), flow)
+
+    def dispense(self, volume, flow):
+        self._start_flow("dispense", abs(volume), flow)
+
+    def pump_volume(self, volume, flow):
+        self._start_flow("pump_volume", volume, flow)
+
+    def set_fill_level(self, level, flow):
+        self._update()
+        self._start_flow("set_fill_level", self._level - level, flow)
+
+    def generate_flow(self, flow):
+        self._update()
+        volume = self._level if flow > 0 else self._level - self.model.volume_max
+        self._start_flow("generate_flow", volume, flow)
+
+    def stop_pumping(self):
+        self.dry_run._call()
+        self._update()
+        self._flow = 0.0
+        self._end = self.dry_run.now
+        self.dry_run._interrupt(self._event)
+        self._event = None
+        self.dry_run._record(self.model.name, "stop_pumping", 0.0)
+
+    def is_pumping(self):
+        self.dry_run._call()
+        self._update()
+        return self._flow != 0.0
+
+    def get_fill_level(self):
+        self.dry_run._call()
+        self._update()
+        return self._level
+
+    def get_flow_is(self):
+        self.dry_run._call()
+        self._update()
+        return self._flow
+
+
+
+class SimulatedValve:
+    """
+    Simulated valve with the qmixvalve.Valve functions used by protocol
+    scripts
+    """
+    def __init__(self, dry_run : DryRun, model : ValveModel):
+        self.dry_run = dry_run
+        self.model = model
+        self._position = model.position
+        self._target = model.position
+        self._end = 0.0
+        self._event = None
+
+    def get_device_name(self):
+        return self.model.name
+
+    def number_of_valve_positions(self):
+        self.dry_run._call()
+        return self.model.position_count
+
+    def switch_valve_to_position(self, logical_valve_position, force = False):
+        self.dry_run._call()
+        if not 0 <= logical_valve_position < self.model.position_count:
+            raise ValueError("Invalid position {} of valve {}".format(
+                logical_valve_position, self.model.name))
+        if logical_valve_position == self._target and not force:
+            return False
+        self._position = self._get_position()
+        self._target = logical_valve_position
+        self._end = self.dry_run.now + self.model.switch_duration_s
+        self.dry_run._interrupt(self._event)
+        self._event = self.dry_run._record(self.model.name, "switch_valve_to_position",
+            self.model.switch_duration_s, logical_valve_position)
+        return True
+
+    def _get_position(self):
+        """
+        Returns the position at the current virtual time
+        """
+        if self.dry_run.now >= self._end:
+            self._position = self._target
+        return self._position
+
+    def actual_valve_position(self):
+        self.dry_run._call()
+        return self._get_position()
+
+    def switch_and_wait(self, logical_valve_position, timeout_s = 5, min_poll_s = 0.005,
+        max_poll_s = 0.1):
+        self.switch_valve_to_position(logical_valve_position)
+        self.dry_run.now = max(self.dry_run.now, min(self._end, self.dry_run.now + timeout_s))
+        return self.actual_valve_position() == logical_valve_position
+
+
+
+class SimulatedAxis:
+    """
+    Simulated axis with the qmixmotion.Axis functions used by protocol
+    scripts. Velocities above the maximum velocity are limited to the
+    maximum velocity. Positions outside of the position limits and moves
+    with a velocity that is not positive raise a ValueError.
+    """
+    def __init__(self, dry_run : DryRun, model : AxisModel):
+        self.dry_run = dry_run
+        self.model = model
+        self._position = model.position
+        self._target = model.position
+        self._velocity = 0.0
+        self._start = 0.0
+        self._end = 0.0
+        self._event = None
+
+    def _get_position(self):
+        """
+        Returns the position at the current virtual time
+        """
+        now = self.dry_run.now
+        if now >= self._end:
+            return self._target
+        return self._target - self._velocity * (self._end - now) \
+            / self.model.seconds_per_distance
+
+    def _move(self, command, target, velocity, duration = None):
+        """
+        Starts a move to the target position
+        """
+        if not self.model.position_min <= target <= self.model.position_max:
+            raise ValueError("Position {} out of range of axis {}".format(target,
+                self.model.name))
+        velocity = min(velocity, self.model.velocity_max)
+        position = self._get_position()
+        if duration is None:
+            if velocity <= 0 and target != position:
+                raise ValueError("Velocity {} of axis {} needs to be positive".format(
+                    velocity, self.model.name))
+            duration = abs(target - position) / velocity * self.model.seconds_per_distance \
+                if target != position else 0.0
+        self._position = position
+        self._target = target
+        self._velocity = math.copysign(velocity, target - position)
+        self._start = self.dry_run.now
+        self._end = self._start + duration
+        self.dry_run._interrupt(self._event)
+        self._event = self.dry_run._record(self.model.name, command, duration, target,
+            velocity)
+
+    def get_device_name(self):
+        return self.model.name
+
+    def get_velocity_max(self):
+        self.dry_run._call()
+        return self.model.velocity_max
+
+    def get_position_min(self):
+        self.dry_run._call()
+        return self.model.position_min
+
+    def get_position_max(self):
+        self.dry_run._call()
+        return self.model.position_max
+
+    def estimate_move_duration(self, distance, velocity):
+        return abs(distance / velocity) * self.model.seconds_per_distance
+
+    def move_to_position(self, position, velocity):
+        self.dry_run._call()
+        self._move("move_to_position", position, velocity)
+
+    def move_distance(self, distance, velocity):
+        self.dry_run._call()
+        self._move("move_distance", self._get_position() + distance, velocity)
+
+    def move_with_velocity(self, velocity):
+        if velocity == 0:
+            self.stop_move()
+            return
+        self.dry_run._call()
+        limit = self.model.position_max if velocity > 0 else self.model.position_min
+        self._move("move_with_velocity", limit, abs(velocity))
+
+    def stop_move(self):
+        self.dry_run._call()
+        position = self._get_position()
+        self._position = self._target = position
+        self._end = self.dry_run.now
+        self.dry_run._interrupt(self._event)
+        self._event = None
+        self.dry_run._record(self.model.name, "stop_move", 0.0)
+
+    def get_actual_position(self):
+        self.dry_run._call()
+        return self._get_position()
+
+    def get_actual_velocity(self):
+        self.dry_run._call()
+        return self._velocity if self.dry_run.now < self._end else 0.0
+
+    def is_target_position_reached(self):
+        self.dry_run._call()
+        return self.dry_run.now >= self._end
+
+
+
+class SimulatedAxisSystem:
+    """
+    Simulated XY axis system with the qmixmotion.AxisSystem functions used
+    by protocol scripts.
+
+    XY moves follow a straight line. The path velocity is limited so that
+    no axis exceeds its maximum velocity.
+    """
+    def __init__(self, dry_run : DryRun, name, axes):
+        self.dry_run = dry_run
+        self.name = name
+        self.axes = axes
+
+    def get_device_name(self):
+        return self.name
+
+    def get_axes_count(self):
+        return len(self.axes)
+
+    def get_axis_device(self, index):
+        return self.axes[index]
+
+    def move_to_postion_xy(self, position_x, position_y, velocity):
+        self.dry_run._call()
+        axis_x, axis_y = self.axes[0], self.axes[1]
+        dx = position_x - axis_x._get_position()
+        dy = position_y - axis_y._get_position()
+        distance = math.hypot(dx, dy)
+        if velocity <= 0 and distance:
+            raise ValueError("Velocity {} of axis system {} needs to be positive".format(
+                velocity, self.name))
+        if dx:
+            velocity = min(velocity, axis_x.model.velocity_max * distance / abs(dx))
+        if dy:
+            velocity = min(velocity, axis_y.model.velocity_max * distance / abs(dy))
+        duration = distance / velocity * axis_x.model.seconds_per_distance if distance else 0.0
+        axis_x._move("move_to_postion_xy", position_x, velocity * abs(dx) / distance
+            if distance else 0.0, duration)
+        axis_y._move("move_to_postion_xy", position_y, velocity * abs(dy) / distance
+            if distance else 0.0, duration)
+
+    def stop_move(self):
+        for axis in self.axes:
+            axis.stop_move()
+
+    def get_actual_position_xy(self):
+        self.dry_run._call()
+        position = namedtuple("position", ["x", "y"])
+        return position(self.axes[0]._get_position(), self.axes[1]._get_position())
+
+    def is_target_position_reached(self):
+        self.dry_run._call()
+        return all(self.dry_run.now >= axis._end for axis in self.axes)
@@ -0,0 +1,114 @@
+import time
+from collections import namedtuple
+from . import qmixbus
+from . import qmixmotion
+
+
+HomingResult = namedtuple("homing_result", ["device", "action", "finished", "duration_s"])
+
+
+class HomingOrchestrator:
+    """
+    Homes a number of axis systems and single axes concurrently.
+
+    At most max_concurrent homing moves run at the same time. If a saved
+    position counter is available for each axis of a device, the device is
+    not homed and the position counters are restored with
+    restore_position_counter() instead. The saved counters are a
+    dictionary that maps axis names to counter values that have been read
+    with Axis.get_position_counter(), i.e. the axes of the snapshot restored
+    by a qmixpersist.PositionCounterStore. The caller is responsible for
+    passing only counters that are still valid.
+    """
+    def __init__(self, devices, max_concurrent = 2, saved_counters = None,
+        timeout_s = 120, poll_s = 0.05, total_timeout_s = None):
+        if max_concurrent < 1:
+            raise ValueError("At least one concurrent homing move is required")
+        self.devices = list(devices)
+        self.max_concurrent = max_concurrent
+        self.saved_counters = {} if saved_counters is None else dict(saved_counters)
+        self.timeout_s = timeout_s
+        self.poll_s = poll_s
+        self.total_timeout_s = total_timeout_s
+
+    @staticmethod
+    def _get_axes(device):
+        """
+        Returns the axes of an axis system or a list with the single axis
+        """
+        if isinstance(device, qmixmotion.AxisSystem):
+            return device.get_axes()
+        return [device]
+
+    def _restore(self, device):
+        """
+        Restores the saved position counters of all axes of the device.
+        Returns false if a counter is missing for one of the axes.
+        """
+        axes = self._get_axes(device)
+        names = [axis.get_device_name() for axis in axes]
+        if not all(name in self.saved_counters for name in names):
+            return False
+        for axis, name in zip(axes, names):
+            axis.restore_position_counter(self.saved_counters[name])
+        return True
+
+    def run(self):
+        """
+        Restores or homes all devices and returns one result per device in
+        the order of the devices.
+
+        The action of a result is "restored", "homed" or "skipped". Each
+        homing move has its own timeout that starts when its find_home()
+        command is sent. A move that does not finish within this timeout is
+        stopped and the finished field of its result is False. If the
+        optional total timeout expires, all running homing moves are stopped
+        and the devices that are still queued are "skipped". If a command
+        raises an error, all running homing moves are stopped before the
+        error is propagated.
+        """
+        results = {}
+        waiting = []
+        for device in self.devices:
+            started = time.monotonic()
+            if self._restore(device):
+                results[id(device)] = HomingResult(device.get_device_name(), "restored",
+                    True, time.monotonic() - started)
+            else:
+                waiting.append(device)
+        total_deadline = None if self.total_timeout_s is None \
+            else time.monotonic() + self.total_timeout_s
+        running = {}
+        try:
+            while waiting or running:
+                while waiting and len(running) < self.max_concurrent:
+                    device = waiting.pop(0)
+                    running[id(device)] = (device, time.monotonic())
+                    device.find_home()
+                now = time.monotonic()
+                timed_out = total_deadline is not None and now >= total_deadline
+                for key, (device, started) in list(running.items()):
+                    if device.is_homing_position_attained():
+                        finished = True
+                    elif timed_out or now - started >= self.timeout_s:
+                        device.stop_move()
+                        finished = False
+                    else:
+                        continue
+                    results[key] = HomingResult(device.get_device_name(), "homed",
+                        finished, time.monotonic() - started)
+                    del running[key]
+                if timed_out:
+                    for device in waiting:
+                        results[id(device)] = HomingResult(device.get_device_name(),
+                            "skipped", False, 0.0)
+                    break
+                if running:
+                    time.sleep(self.poll_s)
+        finally:
+            for device, _ in running.values():
+                try:
+                    device.stop_move()
+                except qmixbus.DeviceError:
+                    pass
+        return [results[id(device)] for device in self.devices]
@@ -0,0 +1,153 @@
+import threading
+from collections import namedtuple
+from . import qmixbus
+
+
+JogStatistics = namedtuple("jog_statistics", ["count", "missed", "rate_hz",
+    "jitter_mean_ms", "jitter_p50_ms", "jitter_p99_ms", "jitter_max_ms", "updates",
+    "commands", "watchdog_stops", "latency_p50_ms", "latency_p99_ms", "latency_max_ms"])
+
+
+class JogController:
+    """
+    Streams velocity setpoints to an axis via move_with_velocity().
+
+    New velocities are passed via set_velocity() from any thread or are read
+    from a source function in each period. The control thread runs with a
+    drift free deadline timer and only applies the latest velocity - older
+    updates are coalesced. The velocity is clamped to the maximum velocity
+    of the axis and set to zero if the axis would leave its position limits
+    within the next period. A command is only sent if the velocity changed.
+    If no update arrived within the watchdog timeout, the axis is stopped
+    with stop_move() until the next update arrives. The axis is always
+    stopped when the controller stops.
+    """
+    def __init__(self, axis, update_rate_hz = 50, watchdog_s = 0.2, source = None,
+        position_margin = 0.0, spin_s = 0.001):
+        self.axis = axis
+        self.period_s = 1.0 / update_rate_hz
+        self.watchdog_ns = int(watchdog_s * 1e9)
+        self.source = source
+        self.velocity_max = axis.get_velocity_max()
+        self.position_min = axis.get_position_min() + position_margin
+        self.position_max = axis.get_position_max() - position_margin
+        self.distance_per_period = self.period_s / axis.estimate_move_duration(1.0, 1.0)
+        self.timer = qmixbus.DeadlineTimer(self.period_s, spin_s)
+        self.statistics = qmixbus.LoopStatistics(self.period_s)
+        # Latency between an update and the issue of its command
+        self.latency = qmixbus.DurationStatistics()
+        self.update_count = 0
+        self.command_count = 0
+        self.watchdog_stops = 0
+        self.error = None
+        self._latest = (0.0, None)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def set_velocity(self, velocity):
+        """
+        Sets the new velocity. Only the latest velocity is applied in the
+        next period.
+        """
+        self._latest = (float(velocity), qmixbus.DeadlineTimer.get_nsecs())
+        self.update_count += 1
+
+    def start(self):
+        """
+        Starts the control thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self._latest = (0.0, None)
+        self.statistics.reset()
+        self.latency.reset()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the control thread and the axis. If the control thread
+        terminated with an error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def is_running(self):
+        """
+        Returns true if the control thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def clamp(self, velocity, position):
+        """
+        Returns the velocity limited to the maximum velocity and to zero if
+        the axis would leave its position limits within the next period
+        """
+        velocity = max(-self.velocity_max, min(self.velocity_max, velocity))
+        next_position = position + velocity * self.distance_per_period
+        if (velocity > 0 and next_position > self.position_max) or \
+            (velocity < 0 and next_position < self.position_min):
+            return 0.0
+        return velocity
+
+    def _run(self):
+        """
+        Thread function of the jog controller
+        """
+        axis = self.axis
+        timer = self.timer
+        get_nsecs = timer.get_nsecs
+        sent = 0.0
+        applied_ns = None
+        try:
+            timer.start()
+            while not self._stop_event.is_set():
+                if self.source is not None:
+                    self.set_velocity(self.source())
+                velocity, update_ns = self._latest
+                now = get_nsecs()
+                if update_ns is None or now - update_ns > self.watchdog_ns:
+                    if sent != 0.0:
+                        axis.stop_move()
+                        self.watchdog_stops += 1
+                        sent = 0.0
+                else:
+                    velocity = self.clamp(velocity, axis.get_actual_position())
+                    if velocity != sent:
+                        if velocity == 0.0:
+                            axis.stop_move()
+                        else:
+                            axis.move_with_velocity(velocity)
+                        sent = velocity
+                        self.command_count += 1
+                    if update_ns != applied_ns:
+                        issued_ns = get_nsecs()
+                        self.latency.add(issued_ns - update_ns)
+                        applied_ns = update_ns
+                tick = timer.tick
+                lateness = timer.wait_next()
+                self.statistics.add(lateness, timer.tick - tick - 1)
+        except qmixbus.DeviceError as e:
+            self.error = e
+        finally:
+            try:
+                axis.stop_move()
+            except qmixbus.DeviceError:
+                pass
+
+    def get_statistics(self):
+        """
+        Returns the loop jitter statistics and the latency between an update
+        and the issue of its command as named tuple. All times are given in
+        milliseconds.
+        """
+        latency = self.latency.get_statistics()
+        return JogStatistics(*self.statistics.get_statistics(), self.update_count,
+            self.command_count, self.watchdog_stops, latency.p50_ms,
+            latency.p99_ms, latency.max_ms)
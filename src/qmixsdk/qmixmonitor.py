@@ -0,0 +1,209 @@
+import heapq
+import queue
+import threading
+import time
+from collections import namedtuple
+from . import qmixbus
+
+
+StateChange = namedtuple("state_change", ["timestamp_ns", "device", "field", "old", "new"])
+
+
+class WatchedField:
+    """
+    A device state value that is watched for changes.
+
+    The field is polled with an adaptive period. After a change, the field
+    is polled with the minimum period. Each poll without change doubles the
+    period up to the maximum period.
+    """
+    def __init__(self, device, field, read_function, min_period_s = 0.05,
+        max_period_s = 1.0):
+        self.device = device
+        self.field = field
+        self.read_function = read_function
+        self.min_period_s = min_period_s
+        self.max_period_s = max_period_s
+        self.period_s = min_period_s
+        self.value = None
+        self.poll_count = 0
+
+    def poll(self):
+        """
+        Reads the field and adapts the poll period.
+
+        Returns a StateChange if the value changed (or if the field has been
+        read the first time) or None.
+        """
+        value = self.read_function()
+        self.poll_count += 1
+        if self.poll_count > 1 and value == self.value:
+            self.period_s = min(self.period_s * 2, self.max_period_s)
+            return None
+        old = self.value
+        self.value = value
+        self.period_s = self.min_period_s
+        return StateChange(time.monotonic_ns(), self.device, self.field, old, value)
+
+
+
+def pump_fields(pump, **kwargs):
+    """
+    Returns the pumping and fault state fields of a pump
+    """
+    name = pump.get_pump_name()
+    return [WatchedField(name, "is_pumping", pump.is_pumping, **kwargs),
+        WatchedField(name, "is_in_fault_state", pump.is_in_fault_state, **kwargs)]
+
+
+def valve_fields(valve, **kwargs):
+    """
+    Returns the actual valve position field of a valve
+    """
+    return [WatchedField(valve.get_device_name(), "actual_valve_position",
+        valve.actual_valve_position, **kwargs)]
+
+
+def axis_fields(axis, **kwargs):
+    """
+    Returns the target position reached and fault state fields of an axis
+    """
+    name = axis.get_device_name()
+    return [WatchedField(name, "is_target_position_reached",
+        axis.is_target_position_reached, **kwargs),
+        WatchedField(name, "is_in_fault_state", axis.is_in_fault_state, **kwargs)]
+
+
+def digital_in_fields(channel, **kwargs):
+    """
+    Returns the input state field of a digital input channel
+    """
+    return [WatchedField(channel.get_name(), "is_on", channel.is_on, **kwargs)]
+
+
+def controller_fields(channel, **kwargs):
+    """
+    Returns the status field of a controller channel
+    """
+    return [WatchedField(channel.get_name(), "read_status", channel.read_status, **kwargs)]
+
+
+
+class StateChangeMonitor:
+    """
+    Polls device state fields in a background thread and emits only the
+    state transitions.
+
+    Each field is polled with its own adaptive period. Detected changes are
+    passed as StateChange named tuples (timestamp_ns, device, field, old,
+    new) to all registered listener functions and into an event queue that
+    can be read with get_change(). The first poll of each field emits a
+    change with old value None. Device errors while polling a field are
+    counted and the field is polled again after its maximum period. Any
+    other error, i.e. of a listener, stops the monitor thread. The error is
+    stored in the error attribute and raised by stop().
+    """
+    def __init__(self, fields, queue_size = 10000):
+        self.fields = list(fields)
+        self.listeners = []
+        self.changes = queue.Queue(queue_size)
+        self.poll_count = 0
+        self.error_count = 0
+        self.dropped_count = 0
+        self.last_error = None
+        self.error = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def add_listener(self, listener):
+        """
+        Registers a function that is called with each StateChange from the
+        monitor thread
+        """
+        self.listeners.append(listener)
+
+    def start(self):
+        """
+        Starts the monitor thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the monitor thread. If the monitor thread terminated with an
+        error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def is_running(self):
+        """
+        Returns true if the monitor thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_change(self, timeout_s = None):
+        """
+        Returns the next state change or None if no change arrived within the
+        timeout
+        """
+        try:
+            return self.changes.get(timeout=timeout_s)
+        except queue.Empty:
+            return None
+
+    def _emit(self, change):
+        """
+        Passes a change to all listeners and into the change queue
+        """
+        for listener in self.listeners:
+            listener(change)
+        try:
+            self.changes.put_nowait(change)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def _run(self):
+        """
+        Thread function of the monitor
+        """
+        try:
+            self._poll_fields()
+        except Exception as e:
+            self.error = e
+
+    def _poll_fields(self):
+        """
+        Polls the field that is due next until the monitor is stopped
+        """
+        now = time.monotonic()
+        schedule = [(now, i) for i in range(len(self.fields))]
+        heapq.heapify(schedule)
+        while schedule and not self._stop_event.is_set():
+            due, i = schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            field = self.fields[i]
+            try:
+                change = field.poll()
+                self.poll_count += 1
+                if change is not None:
+                    self._emit(change)
+                period = field.period_s
+            except qmixbus.DeviceError as e:
+                self.error_count += 1
+                self.last_error = e
+                period = field.max_period_s
+            # Schedule relative to the due time to avoid drift but never
+            # into the past
+            heapq.heapreplace(schedule, (max(due + period, time.monotonic()), i))
@@ -19,6 +19,43 @@ class PositionUnit(Enum):
     device = 0
 
 
+AxisState = namedtuple("state", ["position", "velocity", "target_reached", "stopped",
+    "enabled", "fault"])
+
+
+class _StateBuffers:
+    """
+    Preallocated ctypes buffers for reading the axis state
+    """
+    def __init__(self):
+        self.position = ctypes.c_double()
+        self.velocity = ctypes.c_double()
+        self.position_ref = ctypes.byref(self.position)
+        self.velocity_ref = ctypes.byref(self.velocity)
+
+
+def _read_axis_state(handle, buffers):
+    """
+    Reads all state values of an axis into the given buffers and returns them
+    as tuple in the field order of AxisState.
+    """
+    throw_on_error = qmixbus.throw_on_error
+    throw_on_error(motion_api.LCA_GetAxisPosIs(handle, buffers.position_ref),
+        "LCA_GetAxisPosIs")
+    throw_on_error(motion_api.LCA_GetAxisVelIs(handle, buffers.velocity_ref),
+        "LCA_GetAxisVelIs")
+    reached = motion_api.LCA_IsAxisTargetPosReached(handle)
+    throw_on_error(reached, "LCA_IsAxisTargetPosReached")
+    stopped = motion_api.LCA_IsAxisStopped(handle)
+    throw_on_error(stopped, "LCA_IsAxisStopped")
+    enabled = motion_api.LCA_IsAxisEnabled(handle)
+    throw_on_error(enabled, "LCA_IsAxisEnabled")
+    fault = motion_api.LCA_IsAxisInFaultState(handle)
+    throw_on_error(fault, "LCA_IsAxisInFaultState")
+    return (buffers.position.value, buffers.velocity.value, reached > 0, stopped > 0,
+        enabled > 0, fault > 0)
+
+
 class Axis(qmixbus.Device):  
     """
     An QmixSDK axis instance
@@ -177,6 +214,8 @@ class Axis(qmixbus.Device):
         """
         result = motion_api.LCA_SetDefaultPosUnit(self.handle, prefix.value, unit.value)
         qmixbus.throw_on_error(result)
+        position_unit = namedtuple("unit", ["prefix", "unitid"])
+        self.position_unit = position_unit(prefix, unit)
 
     
     def get_position_unit(self):
@@ -189,7 +228,8 @@ class Axis(qmixbus.Device):
             ctypes.byref(position_unit))
         qmixbus.throw_on_error(result)
         unit = namedtuple("unit", ["prefix", "unitid"])
-        return unit(UnitPrefix(prefix.value), PositionUnit(position_unit.value))   
+        self.position_unit = unit(UnitPrefix(prefix.value), PositionUnit(position_unit.value))
+        return self.position_unit
 
 
     def set_velocity_unit(self, prefix : qmixbus.UnitPrefix, unit : PositionUnit,
@@ -200,6 +240,8 @@ class Axis(qmixbus.Device):
         result = motion_api.LCA_SetDefaultVelUnit(self.handle, prefix.value, unit.value,
             time_unit.value)
         qmixbus.throw_on_error(result)
+        velocity_unit = namedtuple("unit", ["prefix", "unitid", "time_unitid"])
+        self.velocity_unit = velocity_unit(prefix, unit, time_unit)
 
 
     def get_velocity_unit(self):
@@ -213,7 +255,9 @@ class Axis(qmixbus.Device):
             ctypes.byref(pos_unit), ctypes.byref(time_unit))
         qmixbus.throw_on_error(result)
         unit = namedtuple("unit", ["prefix", "unitid", "time_unitid"])
-        return unit(UnitPrefix(prefix.value), PositionUnit(pos_unit.value), TimeUnit(time_unit.value))
+        self.velocity_unit = unit(UnitPrefix(prefix.value), PositionUnit(pos_unit.value),
+            TimeUnit(time_unit.value))
+        return self.velocity_unit
    
 
     def get_position_min(self):
@@ -327,6 +371,36 @@ class Axis(qmixbus.Device):
         return result > 0
 
 
+    def read_state(self):
+        """
+        Reads the complete axis state in one call.
+
+        Returns the state as named tuple with the fields position, velocity,
+        target_reached, stopped, enabled and fault.
+        """
+        if not hasattr(self, "_state_buffers"):
+            self._state_buffers = _StateBuffers()
+        return AxisState(*_read_axis_state(self.handle, self._state_buffers))
+
+
+    def estimate_move_duration(self, distance, velocity):
+        """
+        Returns the expected duration in seconds for moving the given distance
+        with the given velocity.
+
+        The distance is given in the position unit and the velocity in the
+        velocity unit of this axis. Acceleration and deceleration phases are
+        not taken into account. The units are always read from the device
+        because the cached units of this object are stale if the units have
+        been changed via another axis object or another application.
+        """
+        position_unit = self.get_position_unit()
+        velocity_unit = self.get_velocity_unit()
+        seconds_per_distance = 10.0 ** (position_unit.prefix.value
+            - velocity_unit.prefix.value) * velocity_unit.time_unitid.value
+        return abs(distance / velocity) * seconds_per_distance
+
+
 
 class AxisSystem(qmixbus.Device):
     """
@@ -377,13 +451,27 @@ class AxisSystem(qmixbus.Device):
 
     def get_axis_device(self, index):
         """
-        Returns the axis device for the given index
+        Returns the axis device for the given index.
+
+        The axis objects are created on the first call and then reused.
         """
-        handle = ctypes.c_longlong()
-        result = motion_api.LCA_GetAxisHandle(self.handle, ctypes.c_uint8(index),
-            ctypes.byref(handle))
-        qmixbus.throw_on_error(result)
-        return Axis(handle)
+        if not hasattr(self, "_axes"):
+            self._axes = {}
+        axis = self._axes.get(index)
+        if axis is None:
+            handle = ctypes.c_longlong()
+            result = motion_api.LCA_GetAxisHandle(self.handle, ctypes.c_uint8(index),
+                ctypes.byref(handle))
+            qmixbus.throw_on_error(result)
+            axis = self._axes[index] = Axis(handle)
+        return axis
+
+
+    def get_axes(self):
+        """
+        Returns the list of all axis devices of this axis system
+        """
+        return [self.get_axis_device(i) for i in range(self.get_axes_count())]
 
 
     #-------------------------------------------------------------------------
@@ -453,7 +541,7 @@ class AxisSystem(qmixbus.Device):
             ctypes.byref(x), ctypes.byref(y))
         qmixbus.throw_on_error(result)
         position = namedtuple("position", ["x", "y"])
-        return position(x.va, y.value)
+        return position(x.value, y.value)
 
 
     def is_target_position_reached(self):
@@ -471,3 +559,46 @@ class AxisSystem(qmixbus.Device):
     # will be implemented on request    
 
         
+
+
+
+class AxisStateReader:
+    """
+    Reads the state of all axes of a number of axis systems or single axes
+    into a NumPy structured array.
+
+    The axis objects, the ctypes buffers and the result array are created
+    once and reused for each read. The fields of the array are the fields of
+    the named tuple returned by Axis.read_state(). The system index of each
+    row is the index of the axis system (or single axis) in the list passed
+    to the constructor. This class requires NumPy.
+    """
+    def __init__(self, devices):
+        import numpy as np
+        self.axes = []
+        system_index = []
+        for i, device in enumerate(devices):
+            axes = device.get_axes() if isinstance(device, AxisSystem) else [device]
+            self.axes.extend(axes)
+            system_index.extend([i] * len(axes))
+        self.system_index = np.array(system_index, dtype=np.intp)
+        self.dtype = np.dtype([("position", "f8"), ("velocity", "f8"),
+            ("target_reached", "?"), ("stopped", "?"), ("enabled", "?"), ("fault", "?")])
+        self.states = np.zeros(len(self.axes), dtype=self.dtype)
+        self._handles = [axis.handle for axis in self.axes]
+        self._buffers = _StateBuffers()
+
+
+    def read(self, out = None):
+        """
+        Reads the state of all axes.
+
+        The states are written into the given structured array or into the
+        internal array of this reader that is returned. The internal array
+        is overwritten by the next call to read().
+        """
+        states = self.states if out is None else out
+        buffers = self._buffers
+        for i, handle in enumerate(self._handles):
+            states[i] = _read_axis_state(handle, buffers)
+        return states
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import namedtuple
+from . import qmixbus
+
+
+VERSION = 1
+
+CounterSnapshot = namedtuple("counter_snapshot", ["timestamp", "clean", "pumps", "axes"])
+
+
+def _checksum(payload):
+    """
+    Returns the SHA-256 checksum of the canonical JSON form of the payload
+    """
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class PositionCounterStore:
+    """
+    Crash safe persistence of the position counters of pump drives and axes.
+
+    The counters are written periodically by a background thread and on
+    stop() into a small JSON file. Each file is written to a temporary file
+    first and then atomically renamed, so the file always contains a
+    complete snapshot. A checksum detects corrupted files. The snapshot
+    written by stop() is marked as clean. After a crash or power loss the
+    latest snapshot is not clean because the drives may have moved after
+    it was taken. So by default only clean snapshots are restored and the
+    drives need to be calibrated or homed otherwise. The axes may be given
+    as single axes or as axis systems.
+    """
+    def __init__(self, path, pumps = (), axes = (), interval_s = 10.0):
+        self.path = path
+        self.pumps = list(pumps)
+        self.axes = []
+        for device in axes:
+            self.axes.extend(device.get_axes() if hasattr(device, "get_axes") else [device])
+        self.interval_s = interval_s
+        self.write_count = 0
+        self.error = None
+        self._last_counters = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def read_counters(self):
+        """
+        Reads the position counters of all drives. Returns a tuple of two
+        dictionaries that map pump names and axis names to counter values.
+        """
+        pumps = {pump.get_pump_name(): pump.get_position_counter_value()
+            for pump in self.pumps}
+        axes = {axis.get_device_name(): axis.get_position_counter() for axis in self.axes}
+        return pumps, axes
+
+    def save(self, clean = False):
+        """
+        Reads all position counters and writes them into the file if they
+        changed since the last write or if the clean flag is set
+        """
+        pumps, axes = self.read_counters()
+        if not clean and (pumps, axes) == self._last_counters:
+            return False
+        payload = {"version": VERSION, "timestamp": time.time(), "clean": clean,
+            "pumps": pumps, "axes": axes}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"payload": payload, "checksum": _checksum(payload)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._last_counters = (pumps, axes)
+        self.write_count += 1
+        return True
+
+    def load(self, require_clean = True, max_age_s = None):
+        """
+        Returns the saved snapshot as named tuple or None if there is no
+        valid snapshot.
+
+        A snapshot is invalid if the file is missing or corrupted, if it has
+        not been written by a clean shutdown and require_clean is set or if
+        it is older than max_age_s seconds.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            payload = data["payload"]
+            if data["checksum"] != _checksum(payload) or payload["version"] != VERSION:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if require_clean and not payload["clean"]:
+            return None
+        if max_age_s is not None and time.time() - payload["timestamp"] > max_age_s:
+            return None
+        return CounterSnapshot(payload["timestamp"], payload["clean"], payload["pumps"],
+            payload["axes"])
+
+    def restore(self, require_clean = True, max_age_s = None):
+        """
+        Restores the saved position counters of all drives with a saved
+        counter and returns the snapshot or None if there is no valid
+        snapshot. The snapshot axes can be passed as saved counters to a
+        qmixhoming.HomingOrchestrator.
+        """
+        snapshot = self.load(require_clean, max_age_s)
+        if snapshot is None:
+            return None
+        for pump in self.pumps:
+            counter = snapshot.pumps.get(pump.get_pump_name())
+            if counter is not None:
+                pump.restore_position_counter_value(counter)
+        for axis in self.axes:
+            counter = snapshot.axes.get(axis.get_device_name())
+            if counter is not None:
+                axis.restore_position_counter(counter)
+        return snapshot
+
+    def start(self):
+        """
+        Writes a first snapshot, which marks the file as not clean, and
+        starts the periodic snapshot thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self._last_counters = None
+        self.save()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the snapshot thread and writes a clean snapshot. If the
+        snapshot thread terminated with an error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+        self.save(clean=True)
+
+    def is_running(self):
+        """
+        Returns true if the snapshot thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        """
+        Thread function that writes a snapshot in each interval
+        """
+        try:
+            while not self._stop_event.wait(self.interval_s):
+                self.save()
+        except (qmixbus.DeviceError, OSError) as e:
+            self.error = e
@@ -0,0 +1,325 @@
+import ctypes
+import threading
+import numpy as np
+from collections import namedtuple
+from . import qmixbus
+from . import qmixpump
+from .qmixbus import TimeUnit
+
+
+class FlowProfile:
+    """
+    A piecewise linear flow versus time curve.
+
+    The profile is defined by a number of (time, flow) points with
+    ascending time values in seconds. The flow between two points is
+    linearly interpolated and the flow after the last point is the flow
+    of the last point.
+    """
+    def __init__(self, times, flows):
+        self.times = np.asarray(times, dtype=np.float64)
+        self.flows = np.asarray(flows, dtype=np.float64)
+        if self.times.ndim != 1 or self.times.shape != self.flows.shape:
+            raise ValueError("Times and flows need to be one dimensional arrays of equal size")
+        if self.times.size == 0:
+            raise ValueError("A flow profile requires at least one point")
+        if np.any(np.diff(self.times) < 0):
+            raise ValueError("The times of a flow profile need to be ascending")
+
+    @staticmethod
+    def from_points(points):
+        """
+        Creates a flow profile from a list of (time, flow) tuples or from a
+        NumPy array with two columns.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2:
+            raise ValueError("Flow profile points need to be (time, flow) pairs")
+        return FlowProfile(points[:, 0], points[:, 1])
+
+    @staticmethod
+    def ramp(start_flow, end_flow, duration_s):
+        """
+        Creates a linear flow ramp
+        """
+        return FlowProfile([0, duration_s], [start_flow, end_flow])
+
+    def get_duration(self):
+        """
+        Returns the duration of the profile in seconds
+        """
+        return float(self.times[-1])
+
+    def flow_at(self, t):
+        """
+        Returns the interpolated flow for the given time or array of times
+        """
+        return np.interp(t, self.times, self.flows)
+
+
+
+def _update_times(duration_s, update_rate_hz):
+    """
+    Returns the array of update times for the given duration and update rate
+    """
+    period_s = 1.0 / update_rate_hz
+    return np.arange(int(round(duration_s / period_s)) + 1) * period_s
+
+
+
+def _interpolate_rows(t, times, values):
+    """
+    Linear interpolation of all columns of values at once.
+
+    Returns an array with one row for each time in t. Times outside of the
+    given time range use the first or last row of values.
+    """
+    if times.size == 1:
+        return np.repeat(values, t.size, axis=0)
+    index = np.clip(np.searchsorted(times, t, side="right"), 1, times.size - 1)
+    span = times[index] - times[index - 1]
+    weight = np.divide(t - times[index - 1], span, out=np.ones_like(t), where=span > 0)
+    weight = np.clip(weight, 0.0, 1.0)[:, np.newaxis]
+    return values[index - 1] * (1.0 - weight) + values[index] * weight
+
+
+
+class FlowProfilePlayer:
+    """
+    Streams the flow profiles of one or more pumps via generate_flow().
+
+    All setpoints are computed in advance for a fixed update rate. The
+    player thread uses a drift free deadline timer and sends a new setpoint
+    to a pump only if it differs from the last one sent. For each update,
+    the commanded and the measured flow (get_flow_is()) are recorded into
+    preallocated arrays. If the player falls behind, missed updates are
+    skipped so that the profile stays aligned to wall clock time.
+    """
+    def __init__(self, pumps, profiles, update_rate_hz = 10, measure_flow = True,
+        stop_at_end = True, spin_s = 0.002):
+        if isinstance(profiles, FlowProfile):
+            profiles = [profiles] * len(pumps)
+        if len(profiles) != len(pumps):
+            raise ValueError("One flow profile is required for each pump")
+        duration = max(profile.get_duration() for profile in profiles)
+        times = _update_times(duration, update_rate_hz)
+        commanded = np.column_stack([profile.flow_at(times) for profile in profiles])
+        self._setup(pumps, update_rate_hz, commanded, measure_flow, stop_at_end, spin_s)
+
+    def _setup(self, pumps, update_rate_hz, commanded, measure_flow, stop_at_end, spin_s):
+        """
+        Initializes the player with the precomputed setpoints.
+
+        The commanded array contains one row per update and one column per pump.
+        """
+        self.pumps = list(pumps)
+        self.period_s = 1.0 / update_rate_hz
+        tick_count = commanded.shape[0]
+        self.times = np.arange(tick_count) * self.period_s
+        self.commanded = commanded
+        self.measured = np.full_like(self.commanded, np.nan)
+        self.issue_times = np.full(tick_count, np.nan)
+        self.measure_flow = measure_flow
+        self.stop_at_end = stop_at_end
+        self.timer = qmixbus.DeadlineTimer(self.period_s, spin_s)
+        self.statistics = qmixbus.LoopStatistics(self.period_s)
+        self.error = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def check_limits(self):
+        """
+        Raises a ValueError if a commanded flow exceeds the maximum flow
+        rate of its pump.
+        """
+        for i, pump in enumerate(self.pumps):
+            flow_max = pump.get_flow_rate_max()
+            peak = np.abs(self.commanded[:, i]).max()
+            if peak > flow_max:
+                raise ValueError("Flow {} exceeds maximum flow rate {} of pump {}".format(
+                    peak, flow_max, pump.get_pump_name()))
+
+    def start(self, check_limits = True):
+        """
+        Starts playing the flow profiles in the player thread
+        """
+        if self.is_running():
+            return
+        if check_limits:
+            self.check_limits()
+        self.error = None
+        self.measured.fill(np.nan)
+        self.issue_times.fill(np.nan)
+        self.statistics.reset()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the player thread. If the player thread terminated with an
+        error, this error is raised.
+        """
+        self._stop_event.set()
+        self.wait_finished()
+        if self.error is not None:
+            raise self.error
+
+    def wait_finished(self, timeout_s = None):
+        """
+        Waits until the player finished playing the profiles or until the
+        timeout occurs. Returns true if the player finished.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+        return not self.is_running()
+
+    def is_running(self):
+        """
+        Returns true if the player thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        """
+        Thread function of the flow profile player
+        """
+        generate_flow = qmixpump.pump_api.LCP_GenerateFlow
+        handles = [pump.handle for pump in self.pumps]
+        flow_is = [ctypes.c_double() for pump in self.pumps]
+        flow_is_refs = [ctypes.byref(flow) for flow in flow_is]
+        get_flow_is = qmixpump.pump_api.LCP_GetFlowIs
+        last = [None] * len(self.pumps)
+        commanded = self.commanded.tolist()
+        tick_count = len(commanded)
+        timer = self.timer
+        try:
+            timer.start()
+            tick = 0
+            while not self._stop_event.is_set():
+                setpoints = commanded[tick]
+                for i, handle in enumerate(handles):
+                    if setpoints[i] != last[i]:
+                        qmixbus.throw_on_error(generate_flow(handle,
+                            ctypes.c_double(setpoints[i])), "LCP_GenerateFlow")
+                        last[i] = setpoints[i]
+                self.issue_times[tick] = timer.elapsed_secs()
+                if self.measure_flow:
+                    for i, handle in enumerate(handles):
+                        qmixbus.throw_on_error(get_flow_is(handle, flow_is_refs[i]))
+                        self.measured[tick, i] = flow_is[i].value
+                if tick + 1 >= tick_count:
+                    break
+                lateness = timer.wait_next()
+                self.statistics.add(lateness, timer.tick - tick - 1)
+                tick = min(timer.tick, tick_count - 1)
+        except qmixbus.DeviceError as e:
+            self.error = e
+        finally:
+            if self.stop_at_end or self.error is not None:
+                for pump in self.pumps:
+                    try:
+                        pump.stop_pumping()
+                    except qmixbus.DeviceError:
+                        pass
+
+    def get_record(self):
+        """
+        Returns the recorded profile data as named tuple of NumPy arrays.
+
+        The rows of the commanded and measured arrays correspond to the
+        update times and the columns to the pumps. Updates that have been
+        skipped contain NaN values in the measured and issue_times arrays.
+        """
+        record = namedtuple("record", ["times", "issue_times", "commanded", "measured"])
+        return record(self.times, self.issue_times, self.commanded, self.measured)
+
+    def get_timing_statistics(self):
+        """
+        Returns the jitter and missed deadline statistics of the player loop
+        """
+        return self.statistics.get_statistics()
+
+
+
+class GradientMixer(FlowProfilePlayer):
+    """
+    Mixes the fluids of N pumps according to a composition program.
+
+    The composition program defines the fraction of the total flow that is
+    delivered by each pump at certain points in time. Fractions between two
+    points are linearly interpolated. The total flow may be a constant
+    value or a FlowProfile. All per pump flow schedules are computed
+    vectorized in advance and checked against the flow rate and volume
+    limits of each pump before any fluid is moved. The pumps are then
+    driven in lockstep by the flow profile player.
+    """
+    def __init__(self, pumps, total_flow, times, compositions, update_rate_hz = 10,
+        measure_flow = True, stop_at_end = True, spin_s = 0.002):
+        times = np.asarray(times, dtype=np.float64)
+        compositions = np.asarray(compositions, dtype=np.float64)
+        if times.size == 0:
+            raise ValueError("A composition program requires at least one point")
+        if compositions.ndim != 2 or compositions.shape != (times.size, len(pumps)):
+            raise ValueError("Compositions require one row per time and one column per pump")
+        if np.any(np.diff(times) < 0):
+            raise ValueError("The times of a composition program need to be ascending")
+        if np.any(compositions < 0) or not np.allclose(compositions.sum(axis=1), 1.0):
+            raise ValueError("The fractions of each composition need to add up to 1")
+        duration = times[-1]
+        if isinstance(total_flow, FlowProfile):
+            duration = max(duration, total_flow.get_duration())
+        update_times = _update_times(duration, update_rate_hz)
+        fractions = _interpolate_rows(update_times, times, compositions)
+        if isinstance(total_flow, FlowProfile):
+            total = total_flow.flow_at(update_times)
+        else:
+            total = np.full(update_times.size, float(total_flow))
+        self.fractions = fractions
+        self._setup(pumps, update_rate_hz, fractions * total[:, np.newaxis],
+            measure_flow, stop_at_end, spin_s)
+
+    def get_volume_schedule(self, time_unit : TimeUnit = TimeUnit.per_second):
+        """
+        Returns the cumulative volume of each pump at each update time.
+
+        The time unit is the time unit of the pump flow unit and the volumes
+        are given in the volume unit of the pump flow unit. A positive
+        volume means dispensed fluid and a negative volume means aspirated
+        fluid.
+        """
+        volumes = np.empty_like(self.commanded)
+        volumes[0] = 0.0
+        np.cumsum(self.commanded[:-1] * (self.period_s / time_unit.value), axis=0,
+            out=volumes[1:])
+        return volumes
+
+    def check_limits(self, check_volume = True):
+        """
+        Raises a ValueError if the flow of a pump exceeds its maximum flow
+        rate or if the fill level of a pump leaves the range between 0 and
+        its maximum volume.
+        """
+        super().check_limits()
+        if not check_volume:
+            return
+        for i, pump in enumerate(self.pumps):
+            flow_unit = pump.get_flow_unit()
+            volume_unit = pump.get_volume_unit()
+            scale = 10.0 ** (flow_unit.prefix.value - volume_unit.prefix.value)
+            volumes = self.get_volume_schedule(flow_unit.time_unitid)[:, i] * scale
+            levels = pump.get_fill_level() - volumes
+            volume_max = pump.get_volume_max()
+            if levels.min() < 0 or levels.max() > volume_max:
+                raise ValueError("Fill level of pump {} leaves the range 0 - {} "
+                    "(required range {} - {})".format(pump.get_pump_name(), volume_max,
+                    levels.min(), levels.max()))
+
+    def start(self, check_limits = True):
+        """
+        Starts the mixing program. The limits of all pumps are checked before
+        the first pump is started.
+        """
+        if check_limits and not self.is_running():
+            self.check_limits()
+        super().start(check_limits=False)
@@ -0,0 +1,455 @@
+import math
+import time
+from collections import namedtuple
+from . import qmixbus
+
+
+StepTiming = namedtuple("step_timing", ["start_s", "end_s", "duration_s", "estimated_s"])
+ProgramResult = namedtuple("program_result", ["finished", "total_s", "estimated_s",
+    "critical_path", "steps"])
+
+# Default valve switch duration if the valve has not been switched before
+DEFAULT_VALVE_SWITCH_S = 0.5
+
+
+class Step:
+    """
+    Base class of all program steps.
+
+    A step uses a number of devices and may depend on other steps given by
+    name in after. start() issues the device command without blocking and
+    is_finished() checks if the command has finished. The step does not
+    need to be checked before next_poll_time. If estimate_s is None, the
+    step estimates its duration from its parameters.
+    """
+    def __init__(self, name, devices = (), after = (), estimate_s = None, poll_s = 0.01):
+        self.name = name
+        self.devices = [device for device in devices if device is not None]
+        self.after = list(after)
+        self.estimate_s = estimate_s
+        self.poll_s = poll_s
+        self.next_poll_time = 0.0
+
+    def estimate(self, context):
+        """
+        Returns the estimated duration in seconds.
+
+        The context dictionary is shared by all steps of a program while it
+        is compiled, i.e. to track the commanded positions of axes.
+        """
+        return 0.0 if self.estimate_s is None else self.estimate_s
+
+    def start(self, now):
+        """
+        Issues the device command of this step
+        """
+
+    def is_finished(self):
+        """
+        Returns true if the device command has finished
+        """
+        return True
+
+    def abort(self):
+        """
+        Stops the device command of this step
+        """
+
+
+
+class DosingStep(Step):
+    """
+    Aspirates or dispenses a certain volume with a pump.
+
+    If the valve of the pump has been requested via Pump.get_valve(), the
+    valve is used by this step too, so that valve switches and dosing of
+    the same pump are never executed concurrently.
+    """
+    def __init__(self, name, pump, volume, flow, aspirate = False, **kwargs):
+        super().__init__(name, [pump, getattr(pump, "valve", None)], **kwargs)
+        self.pump = pump
+        self.volume = volume
+        self.flow = flow
+        self.aspirate = aspirate
+
+    def estimate(self, context):
+        if self.estimate_s is not None:
+            return self.estimate_s
+        return self.pump.estimate_dosing_duration(self.volume, self.flow)
+
+    def start(self, now):
+        if self.aspirate:
+            self.pump.aspirate(self.volume, self.flow)
+        else:
+            self.pump.dispense(self.volume, self.flow)
+        self.next_poll_time = now + 0.9 * self.pump.estimate_dosing_duration(
+            self.volume, self.flow)
+
+    def is_finished(self):
+        return not self.pump.is_pumping()
+
+    def abort(self):
+        self.pump.stop_pumping()
+
+
+
+class ValveStep(Step):
+    """
+    Switches a valve to a certain logical valve position
+    """
+    def __init__(self, name, valve, position, **kwargs):
+        super().__init__(name, [valve], **kwargs)
+        self.valve = valve
+        self.position = position
+
+    def estimate(self, context):
+        if self.estimate_s is not None:
+            return self.estimate_s
+        duration = getattr(self.valve, "switch_duration_s", None)
+        return DEFAULT_VALVE_SWITCH_S if duration is None else duration
+
+    def start(self, now):
+        self.valve.switch_valve_to_position(self.position)
+
+    def is_finished(self):
+        return self.valve.actual_valve_position() == self.position
+
+
+
+class AxisMoveStep(Step):
+    """
+    Moves a single axis to a certain position
+    """
+    def __init__(self, name, axis, position, velocity, **kwargs):
+        super().__init__(name, [axis], **kwargs)
+        self.axis = axis
+        self.position = position
+        self.velocity = velocity
+
+    def estimate(self, context):
+        key = id(self.axis)
+        if key not in context:
+            context[key] = self.axis.get_actual_position()
+        distance = abs(self.position - context[key])
+        context[key] = self.position
+        if self.estimate_s is not None:
+            return self.estimate_s
+        return distance / abs(self.velocity)
+
+    def start(self, now):
+        self.axis.move_to_position(self.position, self.velocity)
+
+    def is_finished(self):
+        return self.axis.is_target_position_reached()
+
+    def abort(self):
+        self.axis.stop_move()
+
+
+
+class AxisSystemMoveStep(Step):
+    """
+    Moves an XY axis system to a certain XY position
+    """
+    def __init__(self, name, axis_system, position_x, position_y, velocity, **kwargs):
+        super().__init__(name, [axis_system], **kwargs)
+        self.axis_system = axis_system
+        self.position_x = position_x
+        self.position_y = position_y
+        self.velocity = velocity
+
+    def estimate(self, context):
+        key = id(self.axis_system)
+        if key not in context:
+            context[key] = tuple(self.axis_system.get_actual_position_xy())
+        x, y = context[key]
+        distance = math.hypot(self.position_x - x, self.position_y - y)
+        context[key] = (self.position_x, self.position_y)
+        if self.estimate_s is not None:
+            return self.estimate_s
+        return distance / abs(self.velocity)
+
+    def start(self, now):
+        self.axis_system.move_to_postion_xy(self.position_x, self.position_y,
+            self.velocity)
+
+    def is_finished(self):
+        return self.axis_system.is_target_position_reached()
+
+    def abort(self):
+        self.axis_system.stop_move()
+
+
+
+class SetpointStep(Step):
+    """
+    Writes a new setpoint to a controller channel
+    """
+    def __init__(self, name, channel, setpoint, **kwargs):
+        super().__init__(name, [channel], **kwargs)
+        self.channel = channel
+        self.setpoint = setpoint
+
+    def start(self, now):
+        self.channel.write_setpoint(self.setpoint)
+
+
+
+class DigitalOutStep(Step):
+    """
+    Switches a digital output channel on or off
+    """
+    def __init__(self, name, channel, on, **kwargs):
+        super().__init__(name, [channel], **kwargs)
+        self.channel = channel
+        self.on = on
+
+    def start(self, now):
+        self.channel.write_on(self.on)
+
+
+
+class WaitStep(Step):
+    """
+    Waits until a condition function without parameters returns true.
+
+    The step uses the given devices, i.e. the channel that is read by the
+    condition. Use estimate_s to give the expected waiting time for the
+    critical path estimation.
+    """
+    def __init__(self, name, condition, devices = (), **kwargs):
+        super().__init__(name, devices, **kwargs)
+        self.condition = condition
+
+    def is_finished(self):
+        return bool(self.condition())
+
+
+
+class DosingProgram:
+    """
+    A dosing protocol described declaratively as a list of steps.
+
+    compile() turns the step list into a dependency graph. Each step depends
+    on the steps given in its after list and on the previous step that
+    uses one of its devices. All other steps are independent and run()
+    executes them concurrently - each step is started as soon as all steps
+    it depends on have finished. The static critical path estimate is the
+    longest chain of dependent step duration estimates. run() records the
+    achieved start and end time of each step.
+    """
+    def __init__(self, steps = ()):
+        self.steps = []
+        self._names = {}
+        self._dependencies = None
+        self._estimates = None
+        self._order = None
+        for step in steps:
+            self.add(step)
+
+    def add(self, step : Step):
+        """
+        Appends a step to the program and returns its name
+        """
+        if step.name in self._names:
+            raise ValueError("Duplicate step name {}".format(step.name))
+        self._names[step.name] = step
+        self.steps.append(step)
+        self._dependencies = None
+        return step.name
+
+    def aspirate(self, name, pump, volume, flow, **kwargs):
+        """
+        Appends a step that aspirates a certain volume with a pump
+        """
+        return self.add(DosingStep(name, pump, volume, flow, True, **kwargs))
+
+    def dispense(self, name, pump, volume, flow, **kwargs):
+        """
+        Appends a step that dispenses a certain volume with a pump
+        """
+        return self.add(DosingStep(name, pump, volume, flow, False, **kwargs))
+
+    def switch_valve(self, name, valve, position, **kwargs):
+        """
+        Appends a step that switches a valve to a logical valve position
+        """
+        return self.add(ValveStep(name, valve, position, **kwargs))
+
+    def move_axis(self, name, axis, position, velocity, **kwargs):
+        """
+        Appends a step that moves a single axis to a position
+        """
+        return self.add(AxisMoveStep(name, axis, position, velocity, **kwargs))
+
+    def move_xy(self, name, axis_system, position_x, position_y, velocity, **kwargs):
+        """
+        Appends a step that moves an XY axis system to a position
+        """
+        return self.add(AxisSystemMoveStep(name, axis_system, position_x, position_y,
+            velocity, **kwargs))
+
+    def write_setpoint(self, name, channel, setpoint, **kwargs):
+        """
+        Appends a step that writes a controller setpoint
+        """
+        return self.add(SetpointStep(name, channel, setpoint, **kwargs))
+
+    def write_digital_output(self, name, channel, on, **kwargs):
+        """
+        Appends a step that switches a digital output on or off
+        """
+        return self.add(DigitalOutStep(name, channel, on, **kwargs))
+
+    def wait_until(self, name, condition, devices = (), **kwargs):
+        """
+        Appends a step that waits until the condition function returns true
+        """
+        return self.add(WaitStep(name, condition, devices, **kwargs))
+
+    def compile(self):
+        """
+        Builds the dependency graph and estimates the duration of each step.
+
+        Raises a ValueError if a step depends on an unknown step or if the
+        dependencies contain a cycle.
+        """
+        dependencies = {}
+        last_user = {}
+        for step in self.steps:
+            depends = set()
+            for name in step.after:
+                if name not in self._names:
+                    raise ValueError("Step {} depends on unknown step {}".format(
+                        step.name, name))
+                depends.add(name)
+            for device in step.devices:
+                previous = last_user.get(id(device))
+                if previous is not None:
+                    depends.add(previous)
+                last_user[id(device)] = step.name
+            depends.discard(step.name)
+            dependencies[step.name] = depends
+        order = _topological_order(self.steps, dependencies)
+        context = {}
+        self._estimates = {step.name: step.estimate(context) for step in self.steps}
+        self._dependencies = dependencies
+        self._order = order
+
+    def get_dependencies(self):
+        """
+        Returns a dictionary that maps each step name to the set of names of
+        the steps it depends on
+        """
+        if self._dependencies is None:
+            self.compile()
+        return self._dependencies
+
+    def get_critical_path(self):
+        """
+        Returns the estimated duration of the whole program and the list of
+        step names of the critical path
+        """
+        dependencies = self.get_dependencies()
+        finish = {}
+        previous = {}
+        for name in self._order:
+            latest = max(dependencies[name], key=finish.get, default=None)
+            previous[name] = latest
+            start = 0.0 if latest is None else finish[latest]
+            finish[name] = start + self._estimates[name]
+        if not finish:
+            return 0.0, []
+        name = max(finish, key=finish.get)
+        duration = finish[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return duration, path[::-1]
+
+    def run(self, timeout_s = None):
+        """
+        Executes the program and returns the achieved timing of all steps.
+
+        If the program did not finish within the timeout, all running steps
+        are aborted and the finished field of the result is False. If a
+        device error occurs, all running steps are aborted and the error is
+        raised.
+        """
+        dependencies = self.get_dependencies()
+        estimated_s, critical_path = self.get_critical_path()
+        start_time = time.monotonic()
+        deadline = math.inf if timeout_s is None else start_time + timeout_s
+        started = {}
+        ended = {}
+        waiting = list(self._order)
+        running = []
+        try:
+            while waiting or running:
+                now = time.monotonic()
+                for step in running:
+                    if now >= step.next_poll_time:
+                        if step.is_finished():
+                            ended[step.name] = time.monotonic()
+                        else:
+                            step.next_poll_time = now + step.poll_s
+                running = [step for step in running if step.name not in ended]
+                ready = [name for name in waiting if dependencies[name].issubset(ended)]
+                for name in ready:
+                    step = self._names[name]
+                    now = time.monotonic()
+                    started[name] = now
+                    step.next_poll_time = now
+                    step.start(now)
+                    running.append(step)
+                    waiting.remove(name)
+                if not ready and running:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        break
+                    next_poll = min(step.next_poll_time for step in running)
+                    time.sleep(max(0.0, min(next_poll, deadline) - now))
+                elif not running and waiting:
+                    break
+        except qmixbus.DeviceError:
+            self._abort(running)
+            raise
+        self._abort(running)
+        end_time = time.monotonic()
+        steps = {}
+        for step in self.steps:
+            start = started.get(step.name, math.nan) - start_time
+            end = ended.get(step.name, math.nan) - start_time
+            steps[step.name] = StepTiming(start, end, end - start, self._estimates[step.name])
+        finished = len(ended) == len(self.steps)
+        return ProgramResult(finished, end_time - start_time, estimated_s, critical_path,
+            steps)
+
+    @staticmethod
+    def _abort(steps):
+        """
+        Aborts the given running steps
+        """
+        for step in steps:
+            step.abort()
+
+
+
+def _topological_order(steps, dependencies):
+    """
+    Returns the step names in an order where each step follows all steps it
+    depends on. Steps keep their program order where possible. Raises a
+    ValueError if the dependencies contain a cycle.
+    """
+    order = []
+    done = set()
+    remaining = [step.name for step in steps]
+    while remaining:
+        ready = [name for name in remaining if dependencies[name].issubset(done)]
+        if not ready:
+            raise ValueError("The step dependencies contain a cycle: {}".format(remaining))
+        order.extend(ready)
+        done.update(ready)
+        remaining = [name for name in remaining if name not in done]
+    return order
@@ -1,4 +1,7 @@
 import ctypes
+import math
+import numbers
+import time
 from . import qmixbus
 from . import qmixvalve
 from enum import Enum
@@ -13,6 +16,51 @@ class VolumeUnit(Enum):
     litres = 68
 
 
+PumpState = namedtuple("state", ["pumping", "enabled", "fault", "calibration_finished",
+    "fill_level", "flow_is", "dosed_volume", "target_volume"])
+
+
+class _StateBuffers:
+    """
+    Preallocated ctypes buffers for reading the pump state
+    """
+    def __init__(self):
+        self.fill_level = ctypes.c_double()
+        self.flow_is = ctypes.c_double()
+        self.dosed_volume = ctypes.c_double()
+        self.target_volume = ctypes.c_double()
+        self.fill_level_ref = ctypes.byref(self.fill_level)
+        self.flow_is_ref = ctypes.byref(self.flow_is)
+        self.dosed_volume_ref = ctypes.byref(self.dosed_volume)
+        self.target_volume_ref = ctypes.byref(self.target_volume)
+
+
+def _read_pump_state(handle, buffers):
+    """
+    Reads all state values of a pump into the given buffers and returns them
+    as tuple in the field order of PumpState.
+    """
+    throw_on_error = qmixbus.throw_on_error
+    pumping = pump_api.LCP_IsPumping(handle)
+    throw_on_error(pumping, "LCP_IsPumping")
+    enabled = pump_api.LCP_IsEnabled(handle)
+    throw_on_error(enabled, "LCP_IsEnabled")
+    fault = pump_api.LCP_IsInFaultState(handle)
+    throw_on_error(fault, "LCP_IsInFaultState")
+    calibrated = pump_api.LCP_IsCalibrationFinished(handle)
+    throw_on_error(calibrated, "LCP_IsCalibrationFinished")
+    throw_on_error(pump_api.LCP_GetFillLevel(handle, buffers.fill_level_ref),
+        "LCP_GetFillLevel")
+    throw_on_error(pump_api.LCP_GetFlowIs(handle, buffers.flow_is_ref), "LCP_GetFlowIs")
+    throw_on_error(pump_api.LCP_GetDosedVolume(handle, buffers.dosed_volume_ref),
+        "LCP_GetDosedVolume")
+    throw_on_error(pump_api.LCP_GetTargetVolume(handle, buffers.target_volume_ref),
+        "LCP_GetTargetVolume")
+    return (pumping > 0, enabled > 0, fault > 0, calibrated > 0,
+        buffers.fill_level.value, buffers.flow_is.value,
+        buffers.dosed_volume.value, buffers.target_volume.value)
+
+
 class Pump(qmixbus.Device):
     """
     A pump presents the QmixSDK pump API as a python class
@@ -60,6 +108,8 @@ class Pump(qmixbus.Device):
         """
         result = pump_api.LCP_SetVolumeUnit(self.handle, prefix.value, volume_unit.value)
         qmixbus.throw_on_error(result)
+        unit = namedtuple("unit", ["prefix", "unitid"])
+        self.volume_unit = unit(prefix, volume_unit)
 
 
     def get_volume_unit(self):
@@ -72,7 +122,8 @@ class Pump(qmixbus.Device):
         result = pump_api.LCP_GetVolumeUnit(self.handle, ctypes.byref(prefix), ctypes.byref(volume_unit))
         qmixbus.throw_on_error(result)
         unit = namedtuple("unit", ["prefix", "unitid"])
-        return unit(UnitPrefix(prefix.value), VolumeUnit(volume_unit.value))
+        self.volume_unit = unit(UnitPrefix(prefix.value), VolumeUnit(volume_unit.value))
+        return self.volume_unit
 
 
     def set_flow_unit(self, prefix : UnitPrefix, volume_unit : VolumeUnit, time_unit : TimeUnit):
@@ -85,6 +136,8 @@ class Pump(qmixbus.Device):
         result = pump_api.LCP_SetFlowUnit(self.handle, prefix.value, volume_unit.value,
             time_unit.value)
         qmixbus.throw_on_error(result)
+        unit = namedtuple("unit", ["prefix", "unitid", "time_unitid"])
+        self.flow_unit = unit(prefix, volume_unit, time_unit)
 
 
     def get_flow_unit(self):
@@ -99,7 +152,9 @@ class Pump(qmixbus.Device):
             ctypes.byref(volume_unit), ctypes.byref(time_unit))
         qmixbus.throw_on_error(result)
         unit = namedtuple("unit", ["prefix", "unitid", "time_unitid"])
-        return unit(UnitPrefix(prefix.value), VolumeUnit(volume_unit.value), TimeUnit(time_unit.value))
+        self.flow_unit = unit(UnitPrefix(prefix.value), VolumeUnit(volume_unit.value),
+            TimeUnit(time_unit.value))
+        return self.flow_unit
 
     
     def get_flow_rate_max(self):
@@ -380,6 +435,19 @@ class Pump(qmixbus.Device):
         qmixbus.throw_on_error(result)
 
 
+    def read_state(self):
+        """
+        Reads the complete pump state in one call.
+
+        Returns the state as named tuple with the fields pumping, enabled,
+        fault, calibration_finished, fill_level, flow_is, dosed_volume and
+        target_volume.
+        """
+        if not hasattr(self, "_state_buffers"):
+            self._state_buffers = _StateBuffers()
+        return PumpState(*_read_pump_state(self.handle, self._state_buffers))
+
+
     def get_pump_name(self):
         """
         Returns the device name of the pump
@@ -412,3 +480,409 @@ class Pump(qmixbus.Device):
             qmixbus.throw_on_error(result)
             self.valve = qmixvalve.Valve(valve_handle)
         return self.valve
+
+
+    def estimate_dosing_duration(self, volume, flow):
+        """
+        Returns the expected duration in seconds for dosing the given volume
+        with the given flow.
+
+        The volume is given in the volume unit and the flow in the flow unit
+        of this pump. The units are always read from the device because the
+        cached units of this object are stale if the units have been changed
+        via another pump object or another application.
+        """
+        volume_unit = self.get_volume_unit()
+        flow_unit = self.get_flow_unit()
+        seconds_per_volume = 10.0 ** (volume_unit.prefix.value - flow_unit.prefix.value) \
+            * flow_unit.time_unitid.value
+        return abs(volume / flow) * seconds_per_volume
+
+
+    #-------------------------------------------------------------------------
+    # Fluid transfer
+    def transfer(self, volume, flow, inlet_position, outlet_position,
+        aspirate_flow = None, timeout_s = None):
+        """
+        Transfers a certain volume from the valve inlet to the valve outlet.
+
+        The valve is switched to the inlet position, the volume is aspirated,
+        the valve is switched to the outlet position and the volume is
+        dispensed. Each phase is started as soon as the previous phase has
+        finished. Returns the timing breakdown of all phases as named tuple.
+        If the transfer did not finish within the timeout, pumping is stopped
+        and the finished field of the result is False. By default the timeout
+        is derived from the estimated dosing durations (see run_transfers()).
+        """
+        operation = TransferOperation(self, volume, flow, inlet_position,
+            outlet_position, aspirate_flow)
+        return run_transfers([operation], timeout_s)[0]
+
+
+
+TransferTiming = namedtuple("transfer_timing", ["finished", "switch_inlet_s",
+    "aspirate_s", "switch_outlet_s", "dispense_s", "total_s"])
+
+
+class TransferOperation:
+    """
+    Non blocking state machine of a fluid transfer of a single pump.
+
+    The phases of the transfer are switching the valve to the inlet,
+    aspirating, switching the valve to the outlet and dispensing. poll()
+    checks if the current phase has finished and immediately starts the
+    next phase. For the dosing phases the expected duration is computed
+    from volume and flow, so the driver loop does not need to poll the
+    device before the dosing is nearly finished.
+    """
+    PHASES = ["switch_inlet", "aspirate", "switch_outlet", "dispense"]
+
+    def __init__(self, pump : Pump, volume, flow, inlet_position, outlet_position,
+        aspirate_flow = None, min_poll_s = 0.005):
+        self.pump = pump
+        self.valve = pump.get_valve()
+        self.volume = volume
+        self.flow = flow
+        self.aspirate_flow = flow if aspirate_flow is None else aspirate_flow
+        self.inlet_position = inlet_position
+        self.outlet_position = outlet_position
+        self.min_poll_s = min_poll_s
+        self.phase = -1
+        self.phase_times = [0.0] * len(self.PHASES)
+        self.next_poll_time = 0.0
+        self._start_time = None
+        self._end_time = None
+        self._phase_start = None
+
+    def _start_phase(self, phase, now):
+        """
+        Starts the given phase and computes the time of the next poll
+        """
+        self.phase = phase
+        self._phase_start = now
+        self.next_poll_time = now
+        name = self.PHASES[phase]
+        if name == "switch_inlet":
+            self.valve.switch_valve_to_position(self.inlet_position)
+        elif name == "switch_outlet":
+            self.valve.switch_valve_to_position(self.outlet_position)
+        elif name == "aspirate":
+            self.pump.aspirate(self.volume, self.aspirate_flow)
+            self.next_poll_time = now + 0.9 * self.pump.estimate_dosing_duration(self.volume,
+                self.aspirate_flow)
+        else:
+            self.pump.dispense(self.volume, self.flow)
+            self.next_poll_time = now + 0.9 * self.pump.estimate_dosing_duration(self.volume,
+                self.flow)
+
+    def _is_phase_finished(self):
+        """
+        Returns true if the current phase has finished
+        """
+        name = self.PHASES[self.phase]
+        if name == "switch_inlet":
+            return self.valve.actual_valve_position() == self.inlet_position
+        if name == "switch_outlet":
+            return self.valve.actual_valve_position() == self.outlet_position
+        return not self.pump.is_pumping()
+
+    def estimate_duration(self):
+        """
+        Returns the estimated duration of both dosing phases in seconds
+        """
+        return self.pump.estimate_dosing_duration(self.volume, self.aspirate_flow) \
+            + self.pump.estimate_dosing_duration(self.volume, self.flow)
+
+    def is_finished(self):
+        """
+        Returns true if all phases have finished
+        """
+        return self.phase >= len(self.PHASES)
+
+    def poll(self, now = None):
+        """
+        Advances the transfer. Starts the first phase on the first call and
+        the next phase if the current one has finished.
+        """
+        now = time.monotonic() if now is None else now
+        if self.phase < 0:
+            self._start_time = now
+            self._start_phase(0, now)
+            return
+        if self.is_finished() or not self._is_phase_finished():
+            self.next_poll_time = now + self.min_poll_s
+            return
+        now = time.monotonic()
+        self.phase_times[self.phase] = now - self._phase_start
+        if self.phase + 1 < len(self.PHASES):
+            self._start_phase(self.phase + 1, now)
+        else:
+            self.phase += 1
+            self._end_time = now
+
+    def get_timing(self):
+        """
+        Returns the timing breakdown of the transfer as named tuple
+        """
+        finished = self.is_finished()
+        end_time = self._end_time if finished else time.monotonic()
+        total = 0.0 if self._start_time is None else end_time - self._start_time
+        return TransferTiming(finished, *self.phase_times, total)
+
+
+
+# Factor and margin in seconds applied to the estimated duration of the
+# longest transfer if no timeout is given - the margin covers the valve
+# switches
+TRANSFER_TIMEOUT_FACTOR = 1.5
+TRANSFER_TIMEOUT_MARGIN_S = 10.0
+
+
+def run_transfers(operations, timeout_s = None):
+    """
+    Runs a number of transfer operations of different pumps concurrently.
+
+    All operations are advanced in one loop, so the valve switches and
+    dosing phases of the different pumps overlap. The loop sleeps until the
+    next operation needs to be polled. If the operations did not finish
+    within the timeout, the pumps of the unfinished operations are stopped.
+    If no timeout is given, it is derived from the estimated duration of the
+    longest operation. Returns the list of timing breakdowns.
+    """
+    if timeout_s is None:
+        timeout_s = TRANSFER_TIMEOUT_FACTOR * max([operation.estimate_duration()
+            for operation in operations], default=0.0) + TRANSFER_TIMEOUT_MARGIN_S
+    deadline = time.monotonic() + timeout_s
+    pending = list(operations)
+    while pending:
+        now = time.monotonic()
+        for operation in pending:
+            if now >= operation.next_poll_time:
+                operation.poll(now)
+        pending = [operation for operation in pending if not operation.is_finished()]
+        if not pending:
+            break
+        now = time.monotonic()
+        if now >= deadline:
+            for operation in pending:
+                operation.pump.stop_pumping()
+            break
+        next_poll = min(operation.next_poll_time for operation in pending)
+        time.sleep(max(0.0, min(next_poll, deadline) - now))
+    return [operation.get_timing() for operation in operations]
+
+
+
+class PumpGroup:
+    """
+    A group of pumps that are started and stopped together.
+
+    All arguments are validated and converted into ctypes values before the
+    first device is accessed. The API calls are then issued back to back from
+    the calling thread so that the start skew between the first and the last
+    pump of the group is as small as possible. The issue time stamps of the
+    last group command are recorded and the achieved skew is returned by each
+    group command.
+    """
+    def __init__(self, pumps):
+        self.pumps = list(pumps)
+        count = len(self.pumps)
+        self.issue_timestamps_ns = [0] * count
+        self._results = [0] * count
+        self._stop_calls = [(pump_api.LCP_StopPumping, (pump.handle,))
+            for pump in self.pumps]
+
+
+    def _broadcast(self, values, name):
+        """
+        Returns a list with one float value per pump.
+
+        A scalar value is used for all pumps of the group.
+        """
+        if isinstance(values, numbers.Real):
+            values = [values] * len(self.pumps)
+        values = [float(value) for value in values]
+        if len(values) != len(self.pumps):
+            raise ValueError("{} requires {} values but {} were given".format(
+                name, len(self.pumps), len(values)))
+        for value in values:
+            if not math.isfinite(value):
+                raise ValueError("{} contains a non finite value".format(name))
+        return values
+
+
+    def _check_flows(self, flows):
+        """
+        Checks the given flows against the maximum flow rate of each pump.
+        """
+        for pump, flow in zip(self.pumps, flows):
+            flow_max = pump.get_flow_rate_max()
+            if abs(flow) > flow_max:
+                raise ValueError("Flow {} exceeds maximum flow rate {} of pump {}".format(
+                    flow, flow_max, pump.get_pump_name()))
+
+
+    def _fire(self, calls, api_function):
+        """
+        Issues the prepared calls back to back and returns the start skew.
+
+        The error codes are checked after all calls have been issued. If one
+        of the calls failed, all pumps of the group are stopped before the
+        error is raised.
+        """
+        timestamps = self.issue_timestamps_ns
+        results = self._results
+        clock = time.perf_counter_ns
+        for i, (function, args) in enumerate(calls):
+            timestamps[i] = clock()
+            results[i] = function(*args)
+        for result in results:
+            if result < 0:
+                if calls is not self._stop_calls:
+                    self.stop_pumping()
+                qmixbus.throw_on_error(result, api_function)
+        return self.get_start_skew_ms()
+
+
+    def _start(self, api_function, volumes, flows, check_limits):
+        """
+        Prepares and issues a dosing command with volume and flow parameters.
+        """
+        volumes = self._broadcast(volumes, "volumes")
+        flows = self._broadcast(flows, "flows")
+        if check_limits:
+            self._check_flows(flows)
+        function = getattr(pump_api, api_function)
+        calls = [(function, (pump.handle, ctypes.c_double(volume), ctypes.c_double(flow)))
+            for pump, volume, flow in zip(self.pumps, volumes, flows)]
+        return self._fire(calls, api_function)
+
+
+    def pump_volume(self, volumes, flows, check_limits = True):
+        """
+        Pump a certain volume with a certain flow rate on all pumps.
+
+        Volumes and flows may be scalars or sequences with one value per pump.
+        Returns the achieved start skew in milliseconds.
+        """
+        return self._start("LCP_PumpVolume", volumes, flows, check_limits)
+
+
+    def dispense(self, volumes, flows, check_limits = True):
+        """
+        Dispense a certain volume with a certain flow rate on all pumps.
+
+        Volumes and flows may be scalars or sequences with one value per pump.
+        Returns the achieved start skew in milliseconds.
+        """
+        return self._start("LCP_Dispense", volumes, flows, check_limits)
+
+
+    def aspirate(self, volumes, flows, check_limits = True):
+        """
+        Aspirate a certain volume with a certain flow rate on all pumps.
+
+        Volumes and flows may be scalars or sequences with one value per pump.
+        Returns the achieved start skew in milliseconds.
+        """
+        return self._start("LCP_Aspirate", volumes, flows, check_limits)
+
+
+    def generate_flow(self, flows, check_limits = True):
+        """
+        Generate a continuous flow on all pumps.
+
+        Flows may be a scalar or a sequence with one value per pump. Returns
+        the achieved start skew in milliseconds.
+        """
+        flows = self._broadcast(flows, "flows")
+        if check_limits:
+            self._check_flows(flows)
+        function = pump_api.LCP_GenerateFlow
+        calls = [(function, (pump.handle, ctypes.c_double(flow)))
+            for pump, flow in zip(self.pumps, flows)]
+        return self._fire(calls, "LCP_GenerateFlow")
+
+
+    def stop_pumping(self):
+        """
+        Immediately stop pumping of all pumps of this group.
+
+        Returns the achieved stop skew in milliseconds.
+        """
+        return self._fire(self._stop_calls, "LCP_StopPumping")
+
+
+    def transfer(self, volumes, flows, inlet_positions, outlet_positions,
+        aspirate_flows = None, timeout_s = None):
+        """
+        Runs a transfer on all pumps of this group concurrently.
+
+        All parameters may be scalars or sequences with one value per pump.
+        By default the timeout is derived from the estimated dosing durations
+        (see run_transfers()). Returns the list of timing breakdowns of all
+        pumps.
+        """
+        volumes = self._broadcast(volumes, "volumes")
+        flows = self._broadcast(flows, "flows")
+        aspirate_flows = flows if aspirate_flows is None \
+            else self._broadcast(aspirate_flows, "aspirate_flows")
+        if isinstance(inlet_positions, int):
+            inlet_positions = [inlet_positions] * len(self.pumps)
+        if isinstance(outlet_positions, int):
+            outlet_positions = [outlet_positions] * len(self.pumps)
+        operations = [TransferOperation(*args) for args in zip(self.pumps, volumes, flows,
+            inlet_positions, outlet_positions, aspirate_flows)]
+        return run_transfers(operations, timeout_s)
+
+
+    def is_pumping(self):
+        """
+        Returns true if at least one pump of the group is pumping.
+        """
+        return any(pump.is_pumping() for pump in self.pumps)
+
+
+    def get_start_skew_ms(self):
+        """
+        Returns the time between the first and the last issued call of the
+        last group command in milliseconds.
+        """
+        if not self.issue_timestamps_ns:
+            return 0.0
+        return (max(self.issue_timestamps_ns) - min(self.issue_timestamps_ns)) / 1e6
+
+
+
+class PumpStateReader:
+    """
+    Reads the state of a list of pumps into a NumPy structured array.
+
+    The ctypes buffers and the result array are allocated once and reused
+    for each read. The fields of the array are the fields of the named tuple
+    returned by Pump.read_state(). This class requires NumPy.
+    """
+    def __init__(self, pumps):
+        import numpy as np
+        self.pumps = list(pumps)
+        self.dtype = np.dtype([("pumping", "?"), ("enabled", "?"), ("fault", "?"),
+            ("calibration_finished", "?"), ("fill_level", "f8"), ("flow_is", "f8"),
+            ("dosed_volume", "f8"), ("target_volume", "f8")])
+        self.states = np.zeros(len(self.pumps), dtype=self.dtype)
+        self._handles = [pump.handle for pump in self.pumps]
+        self._buffers = _StateBuffers()
+
+
+    def read(self, out = None):
+        """
+        Reads the state of all pumps.
+
+        The states are written into the given structured array or into the
+        internal array of this reader that is returned. The internal array
+        is overwritten by the next call to read().
+        """
+        states = self.states if out is None else out
+        buffers = self._buffers
+        for i, handle in enumerate(self._handles):
+            states[i] = _read_pump_state(handle, buffers)
+        return states
@@ -0,0 +1,229 @@
+import os
+import glob
+import time
+import numbers
+import threading
+import functools
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Device functions that are recorded as commands by a RecordingProxy
+RECORDED_COMMANDS = frozenset([
+    "pump_volume", "dispense", "aspirate", "generate_flow", "set_fill_level",
+    "stop_pumping", "calibrate", "switch_valve_to_position", "move_to_position",
+    "move_distance", "move_with_velocity", "move_to_postion_xy", "stop_move",
+    "find_home", "write_setpoint", "write_output", "write_on",
+    "enable_control_loop"])
+
+# Number of numeric command arguments stored per command
+COMMAND_VALUES = 3
+
+
+class _ColumnWriter:
+    """
+    Collects rows of a table column wise and writes them in batches.
+
+    If pyarrow is available, each batch is written as row group into one
+    Parquet file. Otherwise each batch is written into its own compressed
+    NumPy .npz file.
+    """
+    def __init__(self, directory, name, columns, dtypes, batch_size, use_parquet):
+        self.directory = directory
+        self.name = name
+        self.columns = columns
+        self.dtypes = dtypes
+        self.batch_size = batch_size
+        self.use_parquet = use_parquet
+        self.row_count = 0
+        self._batch_index = 0
+        self._parquet_writer = None
+        self._data = [[] for column in columns]
+
+    def append(self, row):
+        """
+        Appends one row with one value per column
+        """
+        for column, value in zip(self._data, row):
+            column.append(value)
+        self.row_count += 1
+        if len(self._data[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the collected rows as one batch
+        """
+        if not self._data[0]:
+            return
+        arrays = [np.asarray(column, dtype=dtype) for column, dtype in
+            zip(self._data, self.dtypes)]
+        self._data = [[] for column in self.columns]
+        if self.use_parquet:
+            table = pyarrow.table(dict(zip(self.columns, arrays)))
+            if self._parquet_writer is None:
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(
+                    os.path.join(self.directory, self.name + ".parquet"), table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            self._batch_index += 1
+            path = os.path.join(self.directory, "{}_{:06d}.npz".format(self.name,
+                self._batch_index))
+            np.savez_compressed(path, **dict(zip(self.columns, arrays)))
+
+    def close(self):
+        """
+        Writes the remaining rows and closes the output file
+        """
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+
+class RunRecorder:
+    """
+    Records issued device commands and sampled telemetry of a run.
+
+    Commands are stored with their timestamp, device name, command name and
+    up to three numeric arguments. Telemetry samples are stored with their
+    timestamp and one value per telemetry column. Both tables are collected
+    column wise and written in batches to Parquet files if pyarrow is
+    installed or to compressed NumPy .npz files otherwise. Use load_run()
+    to read a recorded run.
+
+    The recorder can be used as sink of a qmixtelemetry.TelemetrySampler.
+    Commands are recorded by wrapping devices with record_device().
+    """
+    def __init__(self, directory, telemetry_columns = (), batch_size = 10000,
+        use_parquet = None):
+        if use_parquet is None:
+            use_parquet = pyarrow is not None
+        elif use_parquet and pyarrow is None:
+            raise ValueError("Writing Parquet files requires pyarrow")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.telemetry_columns = list(telemetry_columns)
+        self._lock = threading.Lock()
+        value_columns = ["value{}".format(i) for i in range(COMMAND_VALUES)]
+        self._commands = _ColumnWriter(directory, "commands",
+            ["timestamp_ns", "device", "command"] + value_columns,
+            [np.int64, np.str_, np.str_] + [np.float64] * COMMAND_VALUES,
+            batch_size, use_parquet)
+        self._telemetry = _ColumnWriter(directory, "telemetry",
+            ["timestamp_ns"] + self.telemetry_columns,
+            [np.int64] + [np.float64] * len(self.telemetry_columns),
+            batch_size, use_parquet)
+        self._nan_values = [np.nan] * COMMAND_VALUES
+
+    def record_command(self, device, command, *values, timestamp_ns = None):
+        """
+        Records one command with up to three numeric arguments
+        """
+        timestamp_ns = time.monotonic_ns() if timestamp_ns is None else timestamp_ns
+        floats = [float(value) for value in values[:COMMAND_VALUES]]
+        floats += self._nan_values[len(floats):]
+        with self._lock:
+            self._commands.append([timestamp_ns, device, command] + floats)
+
+    def append(self, timestamp_ns, values):
+        """
+        Records one telemetry sample with one value per telemetry column
+        """
+        with self._lock:
+            self._telemetry.append([timestamp_ns, *values])
+
+    def record_device(self, device, name = None):
+        """
+        Returns a proxy for the given device that records all command
+        function calls and forwards all calls to the device.
+        """
+        if name is None:
+            name = device.get_name() if hasattr(device, "get_name") else \
+                device.get_device_name()
+        return RecordingProxy(device, self, name)
+
+    def flush(self):
+        """
+        Writes all collected rows
+        """
+        with self._lock:
+            self._commands.flush()
+            self._telemetry.flush()
+
+    def close(self):
+        """
+        Writes all collected rows and closes the output files
+        """
+        with self._lock:
+            self._commands.close()
+            self._telemetry.close()
+
+
+
+class RecordingProxy:
+    """
+    Forwards all attribute access to a device and records the calls of the
+    command functions listed in RECORDED_COMMANDS.
+
+    The command is recorded with the time it has been issued if the device
+    function did not raise an error. The numeric positional and keyword
+    arguments, including NumPy scalars, are recorded as command values.
+    """
+    def __init__(self, device, recorder, name):
+        self._device = device
+        self._recorder = recorder
+        self._name = name
+
+    def __getattr__(self, attribute):
+        value = getattr(self._device, attribute)
+        if attribute not in RECORDED_COMMANDS:
+            return value
+        recorder = self._recorder
+        name = self._name
+        @functools.wraps(value)
+        def record(*args, **kwargs):
+            timestamp_ns = time.monotonic_ns()
+            result = value(*args, **kwargs)
+            values = [arg for arg in list(args) + list(kwargs.values())
+                if isinstance(arg, numbers.Real)]
+            recorder.record_command(name, attribute, *values, timestamp_ns=timestamp_ns)
+            return result
+        return record
+
+
+
+def load_run(directory):
+    """
+    Loads a recorded run.
+
+    Returns a tuple (commands, telemetry) of dictionaries that map the column
+    names to NumPy arrays. Parquet files are read if present, otherwise the
+    .npz batch files are concatenated.
+    """
+    tables = []
+    for name in ["commands", "telemetry"]:
+        path = os.path.join(directory, name + ".parquet")
+        if os.path.exists(path):
+            if pyarrow is None:
+                raise ValueError("Reading Parquet files requires pyarrow")
+            table = pyarrow.parquet.read_table(path)
+            tables.append({column: table.column(column).to_numpy()
+                for column in table.column_names})
+            continue
+        batches = []
+        for path in sorted(glob.glob(os.path.join(directory, name + "_*.npz"))):
+            with np.load(path) as batch:
+                batches.append({column: batch[column] for column in batch.files})
+        if not batches:
+            tables.append({})
+            continue
+        tables.append({column: np.concatenate([batch[column] for batch in batches])
+            for column in batches[0]})
+    return tables[0], tables[1]
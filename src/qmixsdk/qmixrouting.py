@@ -0,0 +1,187 @@
+import time
+from collections import namedtuple, deque
+from . import qmixvalve
+
+
+Route = namedtuple("route", ["ports", "positions"])
+RoutePlan = namedtuple("route_plan", ["route", "switches"])
+
+
+class ValveNetwork:
+    """
+    Fluid network of valves and tubing modelled as a graph of ports.
+
+    Each valve connects certain pairs of ports in each of its logical valve
+    positions. Tubing connects ports permanently. After all valves and
+    connections have been added, compile() precomputes the shortest routes
+    between all pairs of ports. A route requires each valve on it to be in
+    exactly one position. plan() selects the precomputed route that
+    requires the fewest valve switches for the current valve positions and
+    switch() issues all required switches back to back and waits until all
+    valves reached their positions.
+    """
+    def __init__(self):
+        self.valves = {}
+        self._edges = {}
+        self._routes = {}
+
+    def _add_edge(self, port_a, port_b, requirement):
+        """
+        Adds an undirected edge that requires the given (valve, position)
+        or no valve position if requirement is None
+        """
+        self._edges.setdefault(port_a, []).append((port_b, requirement))
+        self._edges.setdefault(port_b, []).append((port_a, requirement))
+        self._routes = {}
+
+    def add_valve(self, name, valve : qmixvalve.Valve, positions):
+        """
+        Adds a valve to the network.
+
+        The positions parameter is a dictionary that maps each logical valve
+        position to a list of (port_a, port_b) tuples of the ports that are
+        connected in this position.
+        """
+        self.valves[name] = valve
+        for position, port_pairs in positions.items():
+            for port_a, port_b in port_pairs:
+                self._add_edge(port_a, port_b, (name, position))
+
+    def add_connection(self, port_a, port_b):
+        """
+        Adds a permanent connection (i.e. tubing) between two ports
+        """
+        self._add_edge(port_a, port_b, None)
+
+    def get_ports(self):
+        """
+        Returns the list of all ports of the network
+        """
+        return list(self._edges)
+
+    def compile(self, max_routes = None, max_states = 100000):
+        """
+        Precomputes the shortest valid routes between all pairs of ports.
+
+        A breadth first search from each port extends each partial route by
+        one port at a time. Partial routes that visit a port twice or that
+        require two different positions of the same valve are discarded. A
+        partial route is only extended if no shorter partial route reached
+        its last port with the same valve positions. So one route is kept
+        for each combination of valve positions that connects two ports. If
+        max_routes is given, only the max_routes shortest routes are stored
+        for each pair of ports. Raises a ValueError if the search from one
+        port requires more than max_states partial routes.
+        """
+        self._routes = {}
+        for source in self._edges:
+            found = {}
+            visited = {(source, frozenset())}
+            queue = deque([((source,), {})])
+            states = 0
+            while queue:
+                states += 1
+                if states > max_states:
+                    raise ValueError("Route search from port {} exceeds {} states".format(
+                        source, max_states))
+                ports, positions = queue.popleft()
+                for port, requirement in self._edges[ports[-1]]:
+                    if port in ports:
+                        continue
+                    if requirement is not None:
+                        valve, position = requirement
+                        if positions.get(valve, position) != position:
+                            continue
+                        next_positions = dict(positions)
+                        next_positions[valve] = position
+                    else:
+                        next_positions = positions
+                    key = (port, frozenset(next_positions.items()))
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                    next_ports = ports + (port,)
+                    found.setdefault(port, []).append(Route(next_ports, next_positions))
+                    queue.append((next_ports, next_positions))
+            for destination, routes in found.items():
+                self._routes[(source, destination)] = routes[:max_routes]
+
+    def get_routes(self, source, destination):
+        """
+        Returns the precomputed routes from source to destination ordered
+        by their length
+        """
+        if not self._routes:
+            self.compile()
+        return self._routes.get((source, destination), [])
+
+    def get_current_positions(self):
+        """
+        Returns the known positions of all valves.
+
+        The last read actual positions of the valves are used if available
+        to avoid bus accesses. Positions that have only been commanded are
+        not trusted, the actual position of these valves is read.
+        """
+        positions = {}
+        for name, valve in self.valves.items():
+            position = valve.cached_position
+            positions[name] = valve.actual_valve_position() if position is None else position
+        return positions
+
+    def plan(self, source, destination, current_positions = None):
+        """
+        Returns the route plan from source to destination that requires the
+        fewest valve switches for the given current valve positions.
+
+        The switches of the plan are a list of (valve name, position)
+        tuples. Raises a ValueError if there is no route.
+        """
+        routes = self.get_routes(source, destination)
+        if not routes:
+            raise ValueError("No route from {} to {}".format(source, destination))
+        if current_positions is None:
+            current_positions = self.get_current_positions()
+        best = None
+        for route in routes:
+            switches = [(valve, position) for valve, position in route.positions.items()
+                if current_positions.get(valve) != position]
+            if best is None or len(switches) < len(best.switches):
+                best = RoutePlan(route, switches)
+                if not switches:
+                    break
+        return best
+
+    def switch(self, switches, timeout_s = 5, poll_s = 0.01):
+        """
+        Issues all valve switches back to back so that the valves move
+        concurrently and waits until all valves reached their positions or
+        until the timeout occurs. Returns True if all valves reached their
+        positions.
+        """
+        for name, position in switches:
+            self.valves[name].switch_valve_to_position(position)
+        pending = dict(switches)
+        deadline = time.monotonic() + timeout_s
+        while pending:
+            for name, position in list(pending.items()):
+                if self.valves[name].actual_valve_position() == position:
+                    del pending[name]
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_s)
+        return True
+
+    def connect(self, source, destination, timeout_s = 5):
+        """
+        Plans the route from source to destination, switches all required
+        valves and returns the executed route plan. Raises a TimeoutError
+        if the valves did not reach their positions within the timeout.
+        """
+        plan = self.plan(source, destination)
+        if not self.switch(plan.switches, timeout_s):
+            raise TimeoutError("Valves did not reach the positions of route {}".format(
+                plan.route.ports))
+        return plan
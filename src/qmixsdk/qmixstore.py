@@ -0,0 +1,293 @@
+import os
+import json
+import glob
+import mmap
+import numpy as np
+
+
+MAGIC = b"QMIXTLM1"
+VERSION = 1
+HEADER_SIZE = 64
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("columns", "<u4"),
+    ("capacity", "<u8"), ("count", "<u8"), ("first_ns", "<i8"), ("last_ns", "<i8")])
+
+
+def _record_dtype(columns):
+    """
+    Returns the fixed width record type for the given column names
+    """
+    return np.dtype([("timestamp_ns", "<i8")] + [(name, "<f8") for name in columns])
+
+
+def _write_json_atomic(path, data):
+    """
+    Writes a JSON file via a temporary file and an atomic rename
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+
+class _Segment:
+    """
+    One memory mapped segment file of a telemetry store.
+
+    The file starts with a fixed size header followed by the preallocated
+    records. The record count and the time range in the header are updated
+    after the record data has been written. So readers only see complete
+    records - also if the writer crashes.
+    """
+    def __init__(self, path, record_dtype, capacity = 0, writable = False):
+        self.path = path
+        if writable and not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(HEADER_SIZE + capacity * record_dtype.itemsize)
+            create = True
+        else:
+            create = False
+        self._file = open(path, "r+b" if writable else "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0,
+            access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        self.header = np.frombuffer(self._mmap, dtype=_HEADER_DTYPE, count=1)
+        if create:
+            self.header["magic"] = MAGIC
+            self.header["version"] = VERSION
+            self.header["columns"] = len(record_dtype.names) - 1
+            self.header["capacity"] = capacity
+            self.header["count"] = 0
+        elif self.header["magic"][0] != MAGIC:
+            raise ValueError("{} is no telemetry segment file".format(path))
+        self.capacity = int(self.header["capacity"][0])
+        self.records = np.frombuffer(self._mmap, dtype=record_dtype, count=self.capacity,
+            offset=HEADER_SIZE)
+
+    def get_count(self):
+        """
+        Returns the number of committed records
+        """
+        return int(self.header["count"][0])
+
+    def get_time_range(self):
+        """
+        Returns the timestamps of the first and the last record
+        """
+        return int(self.header["first_ns"][0]), int(self.header["last_ns"][0])
+
+    def flush(self):
+        """
+        Flushes the mapped memory to disk
+        """
+        self._mmap.flush()
+
+    def close(self):
+        """
+        Releases the memory mapping and closes the file.
+
+        All views of the records need to be released before.
+        """
+        self.records = None
+        self.header = None
+        self._mmap.close()
+        self._file.close()
+
+
+
+class TelemetryStore:
+    """
+    Append only telemetry store with memory mapped segment files.
+
+    Each record has an int64 timestamp in nanoseconds and one float64 value
+    per column. The records are appended to preallocated segment files of
+    a fixed number of records. If a segment is full, the next segment file
+    is created. The memory usage is constant because only the current
+    segment is mapped. If max_segments is given, the oldest segments are
+    deleted to limit the disk usage. Each segment header contains the time
+    range of its records that is used as time index for range queries.
+    Other processes can read the store with TelemetryStoreReader while it
+    is written.
+
+    A store can be used as sink of a qmixtelemetry.TelemetrySampler or fed
+    directly via append().
+    """
+    def __init__(self, directory, columns, segment_records = 100000,
+        max_segments = None, flush_interval = 1000):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "store.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["columns"] != list(columns):
+                raise ValueError("The columns do not match the existing store")
+            segment_records = meta["segment_records"]
+        else:
+            _write_json_atomic(meta_path, {"columns": list(columns),
+                "segment_records": segment_records})
+        self.columns = list(columns)
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.record_dtype = _record_dtype(self.columns)
+        self._unflushed = 0
+        segments = _segment_paths(directory)
+        self._segment_index = _segment_number(segments[-1]) if segments else 0
+        self._segment = None
+        if segments:
+            self._segment = _Segment(segments[-1], self.record_dtype, writable=True)
+        else:
+            self._open_next_segment()
+
+    def _open_next_segment(self):
+        """
+        Closes the current segment and creates the next segment file
+        """
+        if self._segment is not None:
+            self._segment.flush()
+            self._segment.close()
+        self._segment_index += 1
+        path = os.path.join(self.directory, "segment_{:08d}.qts".format(self._segment_index))
+        self._segment = _Segment(path, self.record_dtype, self.segment_records, writable=True)
+        if self.max_segments is not None:
+            for old_path in _segment_paths(self.directory)[:-self.max_segments]:
+                os.remove(old_path)
+
+    def append(self, timestamp_ns, values):
+        """
+        Appends one record with one value per column
+        """
+        segment = self._segment
+        count = segment.get_count()
+        if count >= segment.capacity:
+            self._open_next_segment()
+            segment = self._segment
+            count = 0
+        segment.records[count] = (timestamp_ns, *values)
+        header = segment.header
+        if count == 0:
+            header["first_ns"] = timestamp_ns
+        header["last_ns"] = timestamp_ns
+        header["count"] = count + 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def append_block(self, timestamps_ns, values):
+        """
+        Appends a block of records given as timestamp array and as 2D value
+        array with one column per store column.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(timestamps_ns), -1)
+        start = 0
+        while start < len(timestamps_ns):
+            segment = self._segment
+            count = segment.get_count()
+            if count >= segment.capacity:
+                self._open_next_segment()
+                continue
+            n = min(segment.capacity - count, len(timestamps_ns) - start)
+            records = segment.records[count:count + n]
+            records["timestamp_ns"] = timestamps_ns[start:start + n]
+            for i, name in enumerate(self.columns):
+                records[name] = values[start:start + n, i]
+            if count == 0:
+                segment.header["first_ns"] = timestamps_ns[start]
+            segment.header["last_ns"] = timestamps_ns[start + n - 1]
+            segment.header["count"] = count + n
+            start += n
+            self._unflushed += n
+            del records
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Flushes the current segment to disk
+        """
+        self._segment.flush()
+        self._unflushed = 0
+
+    def close(self):
+        """
+        Flushes and closes the store
+        """
+        if self._segment is not None:
+            self._segment.flush()
+            self._segment.close()
+            self._segment = None
+
+
+
+def _segment_paths(directory):
+    """
+    Returns the sorted list of segment files of a store directory
+    """
+    return sorted(glob.glob(os.path.join(directory, "segment_*.qts")))
+
+
+def _segment_number(path):
+    """
+    Returns the number of a segment file
+    """
+    return int(os.path.basename(path)[len("segment_"):-len(".qts")])
+
+
+
+class TelemetryStoreReader:
+    """
+    Read only access to a telemetry store.
+
+    The reader may be used while another process is appending to the store.
+    Only records that have been committed by the writer are returned.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "store.json")) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.record_dtype = _record_dtype(self.columns)
+
+    def get_segment_index(self):
+        """
+        Returns the time index of all segments as a list of
+        (path, first_ns, last_ns, count) tuples.
+        """
+        index = []
+        for path in _segment_paths(self.directory):
+            header = np.fromfile(path, dtype=_HEADER_DTYPE, count=1)[0]
+            index.append((path, int(header["first_ns"]), int(header["last_ns"]),
+                int(header["count"])))
+        return index
+
+    def read_range(self, start_ns = None, end_ns = None):
+        """
+        Returns a copy of all records with timestamps in the range
+        start_ns <= timestamp < end_ns as NumPy structured array.
+        """
+        start_ns = np.iinfo(np.int64).min if start_ns is None else start_ns
+        end_ns = np.iinfo(np.int64).max if end_ns is None else end_ns
+        parts = []
+        for path, first_ns, last_ns, count in self.get_segment_index():
+            if count == 0 or last_ns < start_ns or first_ns >= end_ns:
+                continue
+            try:
+                segment = _Segment(path, self.record_dtype)
+            except FileNotFoundError:
+                # The segment has been deleted by the writer in the meantime
+                continue
+            try:
+                count = segment.get_count()
+                timestamps = segment.records["timestamp_ns"][:count]
+                first = np.searchsorted(timestamps, start_ns, side="left")
+                last = np.searchsorted(timestamps, end_ns, side="left")
+                parts.append(segment.records[first:last].copy())
+                del timestamps
+            finally:
+                segment.close()
+        if not parts:
+            return np.zeros(0, dtype=self.record_dtype)
+        return np.concatenate(parts)
@@ -0,0 +1,381 @@
+import math
+import threading
+import time
+import numpy as np
+from collections import namedtuple
+from . import qmixbus
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer for timestamped samples with a fixed number of
+    columns.
+
+    Each sample is stored twice in a buffer of twice the capacity. So the
+    latest samples are always available as one contiguous block and
+    consumers get NumPy views instead of copies. The views share memory
+    with the buffer and are overwritten by new samples after capacity
+    samples have been appended - copy the view if the data needs to be kept.
+    There must be only one writer thread.
+    """
+    def __init__(self, capacity, columns = 1, dtype = np.float64):
+        self.capacity = capacity
+        self.columns = columns
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self.values = np.zeros((2 * capacity, columns), dtype=dtype)
+        self.count = 0
+        self._index = 0
+
+    def append(self, timestamp_ns, values):
+        """
+        Appends one sample with one value per column
+        """
+        index = self._index
+        upper = index + self.capacity
+        self.timestamps[index] = timestamp_ns
+        self.timestamps[upper] = timestamp_ns
+        self.values[index] = values
+        self.values[upper] = values
+        self._index = index + 1 if index + 1 < self.capacity else 0
+        self.count += 1
+
+    def get_size(self):
+        """
+        Returns the number of valid samples in the buffer
+        """
+        return min(self.count, self.capacity)
+
+    def latest(self, n = None):
+        """
+        Returns views of the timestamps and values of the latest n samples.
+
+        The samples are ordered from the oldest to the newest sample. If n is
+        None, all valid samples are returned.
+        """
+        # The count is read only once and incremented by the writer after
+        # the sample data has been written
+        count = self.count
+        size = min(count, self.capacity)
+        n = size if n is None else min(n, size)
+        end = count % self.capacity + self.capacity if count >= self.capacity else count
+        return self.timestamps[end - n:end], self.values[end - n:end]
+
+
+
+class Signal:
+    """
+    A named value that is sampled by calling a read function without
+    parameters, i.e. a bound getter function of a device.
+    """
+    def __init__(self, name, read_function):
+        self.name = name
+        self.read_function = read_function
+
+    def read(self):
+        """
+        Reads the current value of this signal as float
+        """
+        return float(self.read_function())
+
+
+
+def pump_signals(pump, fields = ("fill_level", "flow_is", "dosed_volume")):
+    """
+    Returns the signals for the given state fields of a pump.
+
+    The fields may be fill_level, flow_is, dosed_volume and target_volume.
+    """
+    name = pump.get_pump_name()
+    return [Signal(name + "." + field, getattr(pump, "get_" + field)) for field in fields]
+
+
+def axis_signals(axis):
+    """
+    Returns the actual position and actual velocity signals of an axis
+    """
+    name = axis.get_device_name()
+    return [Signal(name + ".position", axis.get_actual_position),
+        Signal(name + ".velocity", axis.get_actual_velocity)]
+
+
+def analog_in_signal(channel):
+    """
+    Returns the input value signal of an analog input channel
+    """
+    return Signal(channel.get_name(), channel.read_input)
+
+
+def controller_signal(channel):
+    """
+    Returns the actual value signal of a controller channel
+    """
+    return Signal(channel.get_name(), channel.read_actual_value)
+
+
+def digital_in_signal(channel):
+    """
+    Returns the state signal of a digital input channel (0.0 or 1.0)
+    """
+    return Signal(channel.get_name(), channel.is_on)
+
+
+
+class TelemetrySampler:
+    """
+    Samples a number of signals at a fixed rate in a background thread.
+
+    All signals are read in each sample period and the values are written
+    together with a time.monotonic_ns() timestamp into a preallocated ring
+    buffer with one column per signal. Several consumers can read the latest
+    window of samples as zero copy views without accessing the devices.
+    If reading a signal fails, NaN is stored for this signal and the error
+    is counted. Each sample is also passed to the append(timestamp_ns, values)
+    function of all sinks, i.e. a qmixstore.TelemetryStore. Any other error,
+    i.e. of a sink, stops the sampler thread. The error is stored in the
+    error attribute and raised by stop().
+    """
+    def __init__(self, signals, rate_hz = 10, capacity = 10000, spin_s = 0.0,
+        sinks = ()):
+        self.signals = list(signals)
+        self.sinks = list(sinks)
+        self.names = [signal.name for signal in self.signals]
+        self._columns = {name: i for i, name in enumerate(self.names)}
+        self.buffer = RingBuffer(capacity, len(self.signals))
+        self.timer = qmixbus.DeadlineTimer(1.0 / rate_hz, spin_s)
+        self.statistics = qmixbus.LoopStatistics(1.0 / rate_hz)
+        self.error_count = 0
+        self.last_error = None
+        self.error = None
+        self._sample = np.zeros(len(self.signals))
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """
+        Starts the sampler thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self._stop_event.clear()
+        self.statistics.reset()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the sampler thread. If the sampler thread terminated with an
+        error, this error is raised.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.error is not None:
+            raise self.error
+
+    def is_running(self):
+        """
+        Returns true if the sampler thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample_once(self):
+        """
+        Reads all signals once and appends the sample to the ring buffer
+        """
+        sample = self._sample
+        timestamp = time.monotonic_ns()
+        for i, signal in enumerate(self.signals):
+            try:
+                sample[i] = signal.read()
+            except qmixbus.DeviceError as e:
+                sample[i] = math.nan
+                self.error_count += 1
+                self.last_error = e
+        self.buffer.append(timestamp, sample)
+        for sink in self.sinks:
+            sink.append(timestamp, sample)
+
+    def _run(self):
+        """
+        Thread function of the sampler
+        """
+        timer = self.timer
+        timer.start()
+        try:
+            while not self._stop_event.is_set():
+                self.sample_once()
+                tick = timer.tick
+                lateness = timer.wait_next()
+                self.statistics.add(lateness, timer.tick - tick - 1)
+        except Exception as e:
+            self.error = e
+
+    def get_window(self, n = None):
+        """
+        Returns the timestamps and the values of the latest n samples as
+        named tuple of NumPy views. The values have one column per signal.
+        """
+        timestamps, values = self.buffer.latest(n)
+        window = namedtuple("window", ["timestamps_ns", "values"])
+        return window(timestamps, values)
+
+    def get_signal_window(self, name, n = None):
+        """
+        Returns the timestamps and the values of the latest n samples of a
+        single signal as named tuple of NumPy views.
+        """
+        timestamps, values = self.buffer.latest(n)
+        window = namedtuple("window", ["timestamps_ns", "values"])
+        return window(timestamps, values[:, self._columns[name]])
+
+    def get_timing_statistics(self):
+        """
+        Returns the jitter and missed deadline statistics of the sampler loop
+        """
+        return self.statistics.get_statistics()
+
+
+
+class AggregationLevel:
+    """
+    Min, max, mean and last value aggregates of fixed time windows for one
+    resolution.
+
+    The windows are aligned to multiples of the window length. The aggregates
+    of closed windows are stored in a ring buffer. The current window is
+    updated incrementally in O(1) per sample or per merged finer window.
+    """
+    def __init__(self, window_s, columns, capacity):
+        self.window_s = window_s
+        self.window_ns = int(window_s * 1e9)
+        self.columns = columns
+        # Columns of the ring buffer: min, max, mean and last for each signal
+        # and the number of samples in the window
+        self.buffer = RingBuffer(capacity, 4 * columns + 1)
+        self._record = np.zeros(4 * columns + 1)
+        self._window_index = None
+        self._count = 0
+        self._min = np.full(columns, np.inf)
+        self._max = np.full(columns, -np.inf)
+        self._sum = np.zeros(columns)
+        self._last = np.zeros(columns)
+
+    def _close_window(self):
+        """
+        Writes the aggregate of the current window into the ring buffer and
+        returns it. Returns None if the current window is empty.
+        """
+        if not self._count:
+            return None
+        c = self.columns
+        record = self._record
+        record[0:c] = self._min
+        record[c:2 * c] = self._max
+        np.divide(self._sum, self._count, out=record[2 * c:3 * c])
+        record[3 * c:4 * c] = self._last
+        record[4 * c] = self._count
+        timestamp = self._window_index * self.window_ns
+        self.buffer.append(timestamp, record)
+        self._count = 0
+        self._min.fill(np.inf)
+        self._max.fill(-np.inf)
+        self._sum.fill(0.0)
+        return timestamp, record
+
+    def _advance(self, timestamp_ns):
+        """
+        Closes the current window if the timestamp belongs to a later window.
+        Returns the closed window aggregate or None.
+        """
+        window_index = timestamp_ns // self.window_ns
+        closed = None
+        if window_index != self._window_index:
+            if self._window_index is not None:
+                closed = self._close_window()
+            self._window_index = window_index
+        return closed
+
+    def add_sample(self, timestamp_ns, values):
+        """
+        Adds one raw sample and returns the aggregate of the window that has
+        been closed by this sample or None.
+        """
+        closed = self._advance(timestamp_ns)
+        np.minimum(self._min, values, out=self._min)
+        np.maximum(self._max, values, out=self._max)
+        self._sum += values
+        self._last[:] = values
+        self._count += 1
+        return closed
+
+    def add_aggregate(self, timestamp_ns, record):
+        """
+        Merges the aggregate of a closed finer window and returns the
+        aggregate of the window that has been closed by this merge or None.
+        """
+        closed = self._advance(timestamp_ns)
+        c = self.columns
+        count = record[4 * c]
+        np.minimum(self._min, record[0:c], out=self._min)
+        np.maximum(self._max, record[c:2 * c], out=self._max)
+        self._sum += record[2 * c:3 * c] * count
+        self._last[:] = record[3 * c:4 * c]
+        self._count += count
+        return closed
+
+    def get_window(self, n = None):
+        """
+        Returns the aggregates of the latest n closed windows as named tuple
+        of NumPy views. The timestamps are the start times of the windows.
+        """
+        timestamps, values = self.buffer.latest(n)
+        c = self.columns
+        window = namedtuple("window", ["timestamps_ns", "min", "max", "mean", "last", "count"])
+        return window(timestamps, values[:, 0:c], values[:, c:2 * c], values[:, 2 * c:3 * c],
+            values[:, 3 * c:4 * c], values[:, 4 * c])
+
+
+
+class StreamAggregator:
+    """
+    Maintains windowed aggregates of a stream of samples at multiple
+    resolutions, i.e. 1 s, 1 min and 1 h.
+
+    Only the finest resolution is updated by each sample. Each closed window
+    is merged into the next coarser resolution, so the cost per sample is
+    constant. The resolutions need to be ascending and each resolution
+    should be a multiple of the previous one. An aggregator can be used as
+    sink of a TelemetrySampler or fed directly via append(), i.e. from a
+    control loop that polls ControllerChannel.read_actual_value().
+    """
+    def __init__(self, columns = 1, resolutions_s = (1, 60, 3600), capacity = 10000):
+        self.columns = columns
+        self.levels = [AggregationLevel(resolution, columns, capacity)
+            for resolution in sorted(resolutions_s)]
+
+    def append(self, timestamp_ns, values):
+        """
+        Adds one sample with one value per column
+        """
+        closed = self.levels[0].add_sample(timestamp_ns, values)
+        for level in self.levels[1:]:
+            if closed is None:
+                break
+            closed = level.add_aggregate(*closed)
+
+    def get_level(self, resolution_s):
+        """
+        Returns the aggregation level for the given resolution in seconds
+        """
+        for level in self.levels:
+            if level.window_s == resolution_s:
+                return level
+        raise ValueError("No aggregation level with resolution {} s".format(resolution_s))
+
+    def get_window(self, resolution_s, n = None):
+        """
+        Returns the latest n closed window aggregates of the given resolution
+        """
+        return self.get_level(resolution_s).get_window(n)
@@ -0,0 +1,271 @@
+import time
+import numpy as np
+from collections import namedtuple
+
+
+SegmentTiming = namedtuple("segment_timing", ["index", "issue_s", "reached_s",
+    "predicted_s", "move_s", "action_s", "polls"])
+WaypointResult = namedtuple("waypoint_result", ["total_s", "segments"])
+WaypointOrder = namedtuple("waypoint_order", ["order", "travel_s"])
+
+
+def travel_times(from_points, to_points, velocity = np.inf, velocity_max = (np.inf, np.inf),
+    seconds_per_distance = 1.0):
+    """
+    Returns the travel times between pairs of XY points for straight line
+    moves with the given path velocity.
+
+    The path velocity is limited so that no axis exceeds its maximum
+    velocity. So the travel time is the maximum of the path distance divided
+    by the path velocity and the distance of each axis divided by its
+    maximum velocity. The arrays are broadcast against each other.
+    """
+    from_points = np.asarray(from_points, dtype=np.float64)
+    to_points = np.asarray(to_points, dtype=np.float64)
+    dx = np.abs(to_points[..., 0] - from_points[..., 0])
+    dy = np.abs(to_points[..., 1] - from_points[..., 1])
+    times = np.maximum(dx / velocity_max[0], dy / velocity_max[1])
+    if np.isfinite(velocity):
+        times = np.maximum(times, np.hypot(dx, dy) / velocity)
+    return times * seconds_per_distance
+
+
+def _nearest_neighbours(nodes, count, velocity, velocity_max):
+    """
+    Returns an array with the indices of the count nodes with the lowest
+    travel time from each node.
+
+    The squared travel times are compared, which gives the same ranking
+    without square roots.
+    """
+    count = min(count, len(nodes) - 1)
+    x, y = nodes[:, 0], nodes[:, 1]
+    factor_x = 1.0 / velocity_max[0] ** 2
+    factor_y = 1.0 / velocity_max[1] ** 2
+    factor = 1.0 / velocity ** 2
+    neighbours = np.empty((len(nodes), count), dtype=np.intp)
+    for first in range(0, len(nodes), 256):
+        dx = np.subtract.outer(x[first:first + 256], x)
+        dy = np.subtract.outer(y[first:first + 256], y)
+        np.square(dx, out=dx)
+        np.square(dy, out=dy)
+        block = np.maximum(dx * factor_x, dy * factor_y)
+        if factor:
+            dx += dy
+            dx *= factor
+            np.maximum(block, dx, out=block)
+        block[np.arange(len(block)), np.arange(first, first + len(block))] = np.inf
+        neighbours[first:first + 256] = np.argpartition(block, count - 1, axis=1)[:, :count]
+    return neighbours
+
+
+def order_waypoints(points, start = None, velocity = 1.0, velocity_max = (np.inf, np.inf),
+    seconds_per_distance = 1.0, neighbours = 10, max_passes = 100):
+    """
+    Returns the order of the XY points that visits all points with a short
+    total travel time.
+
+    The route starts at the start position or at the first point if no start
+    position is given. A nearest neighbour route is improved by 2-opt moves
+    that reverse parts of the route. Only moves that connect a point with one
+    of its nearest neighbours are evaluated. All candidate moves of a pass
+    are evaluated vectorized and all improving moves that do not overlap are
+    applied together. Returns the indices of the points in visiting order
+    and the total travel time as named tuple.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    fixed_start = start is not None
+    if not fixed_start:
+        start = points[0] if len(points) else (0.0, 0.0)
+    nodes = np.vstack([np.asarray(start, dtype=np.float64).reshape(1, 2), points])
+    n = len(nodes)
+    def cost(a, b):
+        return travel_times(a, b, velocity, velocity_max, seconds_per_distance)
+    if len(points) < 2:
+        return WaypointOrder(np.arange(len(points)), float(np.sum(cost(nodes[:-1], nodes[1:]))))
+
+    # Nearest neighbour construction - the nearest remaining point is searched
+    # in the neighbour list first and only in all points if all neighbours
+    # have been visited
+    candidates = _nearest_neighbours(nodes, neighbours, velocity, velocity_max)
+    route = np.empty(n, dtype=np.intp)
+    route[0] = 0
+    remaining = np.ones(n, dtype=bool)
+    remaining[0] = False
+    if not fixed_start:
+        route[1] = 1
+        remaining[1] = False
+    for i in range(1 if fixed_start else 2, n):
+        current = route[i - 1]
+        near = candidates[current]
+        near = near[remaining[near]]
+        if not len(near):
+            near = np.flatnonzero(remaining)
+        route[i] = near[np.argmin(cost(nodes[current], nodes[near]))]
+        remaining[route[i]] = False
+
+    # 2-opt improvement with neighbour lists
+    first_movable = 1 if fixed_start else 2
+    for _ in range(max_passes):
+        positions = np.empty(n, dtype=np.intp)
+        positions[route] = np.arange(n)
+        a = np.repeat(positions, candidates.shape[1])
+        b = positions[candidates.ravel()]
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        valid = (b > a + 1) & (a + 1 >= first_movable)
+        a, b = a[valid], b[valid]
+        has_next = b + 1 < n
+        next_b = route[np.minimum(b + 1, n - 1)]
+        delta = cost(nodes[route[a]], nodes[route[b]]) \
+            - cost(nodes[route[a]], nodes[route[a + 1]]) \
+            + np.where(has_next, cost(nodes[route[a + 1]], nodes[next_b])
+                - cost(nodes[route[b]], nodes[next_b]), 0.0)
+        improving = np.flatnonzero(delta < -1e-12)
+        if not len(improving):
+            break
+        # Only the best move of each first position is considered
+        improving = improving[np.argsort(delta[improving])]
+        improving = improving[np.unique(a[improving], return_index=True)[1]]
+        touched = np.zeros(n + 1, dtype=bool)
+        for move in improving[np.argsort(delta[improving])]:
+            first, last = a[move], b[move]
+            if touched[first:last + 2].any():
+                continue
+            touched[first:last + 2] = True
+            route[first + 1:last + 1] = route[first + 1:last + 1][::-1].copy()
+    travel_s = float(np.sum(cost(nodes[route[:-1]], nodes[route[1:]])))
+    return WaypointOrder(route[1:] - 1, travel_s)
+
+
+class WaypointStreamer:
+    """
+    Moves an XY axis system through a list of waypoints with minimal
+    overhead per waypoint.
+
+    The travel time of each segment is predicted from the velocity limits
+    and units of the X and Y axis. After a move has been issued, the streamer
+    sleeps until shortly before the predicted arrival and then polls
+    is_target_position_reached() densely, so the next move is issued as soon
+    as the previous target has been reached. The difference between the
+    predicted and the measured travel time (i.e. acceleration phases) is
+    learned while streaming and added to the following predictions.
+    """
+    def __init__(self, axis_system, velocity, lead_s = 0.02, poll_s = 0.001,
+        timeout_s = 10):
+        self.axis_system = axis_system
+        self.axes = [axis_system.get_axis_device(0), axis_system.get_axis_device(1)]
+        self.velocity = abs(velocity)
+        self.lead_s = lead_s
+        self.poll_s = poll_s
+        self.timeout_s = timeout_s
+        self.velocity_max = np.array([axis.get_velocity_max() for axis in self.axes])
+        self.position_min = np.array([axis.get_position_min() for axis in self.axes])
+        self.position_max = np.array([axis.get_position_max() for axis in self.axes])
+        self.seconds_per_distance = self.axes[0].estimate_move_duration(1.0, 1.0)
+        self.overhead_s = 0.0
+
+    def check_limits(self, points):
+        """
+        Raises a ValueError if one of the waypoints is outside of the position
+        limits of the axes
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        outside = np.any((points < self.position_min) | (points > self.position_max), axis=1)
+        if np.any(outside):
+            index = int(np.argmax(outside))
+            raise ValueError("Waypoint {} {} is outside of the position limits".format(
+                index, tuple(points[index].tolist())))
+        return points
+
+    def predict_durations(self, points, start):
+        """
+        Returns the predicted travel time of each segment from the start
+        position through all waypoints without the learned overhead.
+
+        The path velocity of each segment is limited so that no axis exceeds
+        its maximum velocity.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        deltas = np.abs(np.diff(np.vstack([start, points]), axis=0))
+        distances = np.hypot(deltas[:, 0], deltas[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            limits = np.where(deltas > 0, self.velocity_max * distances[:, None] / deltas,
+                np.inf)
+        velocities = np.minimum(self.velocity, limits.min(axis=1))
+        return distances / velocities * self.seconds_per_distance
+
+    def order(self, points, start = None):
+        """
+        Returns the order of the waypoints with a short total travel time
+        from the start position (the actual position if None) and the
+        total travel time as named tuple. See order_waypoints().
+        """
+        points = self.check_limits(points)
+        if start is None:
+            start = tuple(self.axis_system.get_actual_position_xy())
+        return order_waypoints(points, start, self.velocity, self.velocity_max,
+            self.seconds_per_distance)
+
+    def _wait_reached(self, deadline):
+        """
+        Polls the axis system until the target has been reached. Returns the
+        number of polls or None if the deadline expired.
+        """
+        axis_system = self.axis_system
+        polls = 0
+        while True:
+            polls += 1
+            if axis_system.is_target_position_reached():
+                return polls
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_s)
+
+    def run(self, points, actions = None):
+        """
+        Moves through all waypoints and returns the per segment timing.
+
+        points is an array of shape (N, 2) with the XY waypoints. actions is
+        either None, a single function or a list with one function (or None)
+        per waypoint. An action is called with the waypoint index and the
+        waypoint after the waypoint has been reached, i.e. to move the Z axis
+        or to dispense. If a waypoint is not reached within the predicted
+        travel time plus the timeout, the move is stopped and a TimeoutError
+        is raised.
+        """
+        points = self.check_limits(points)
+        if actions is None or callable(actions):
+            actions = [actions] * len(points)
+        elif len(actions) != len(points):
+            raise ValueError("{} actions given for {} waypoints".format(len(actions),
+                len(points)))
+        start = tuple(self.axis_system.get_actual_position_xy())
+        predicted = self.predict_durations(points, start).tolist()
+        axis_system = self.axis_system
+        velocity = self.velocity
+        segments = []
+        start_time = time.monotonic()
+        for index, (x, y) in enumerate(points.tolist()):
+            issue_time = time.monotonic()
+            axis_system.move_to_postion_xy(x, y, velocity)
+            prediction = predicted[index] + self.overhead_s
+            wake_time = issue_time + prediction - self.lead_s
+            delay = wake_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            polls = self._wait_reached(issue_time + prediction + self.timeout_s)
+            reached_time = time.monotonic()
+            if polls is None:
+                axis_system.stop_move()
+                raise TimeoutError("Waypoint {} {} not reached".format(index, (x, y)))
+            move_s = reached_time - issue_time
+            # Exponential average of the difference between the measured and
+            # the predicted travel time
+            self.overhead_s += 0.3 * (move_s - predicted[index] - self.overhead_s)
+            action = actions[index]
+            if action is not None:
+                action(index, (x, y))
+            action_s = time.monotonic() - reached_time
+            segments.append(SegmentTiming(index, issue_time - start_time,
+                reached_time - start_time, prediction, move_s, action_s, polls))
+        return WaypointResult(time.monotonic() - start_time, segments)
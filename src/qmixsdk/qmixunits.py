@@ -0,0 +1,121 @@
+import math
+import functools
+import numpy as np
+from enum import Enum
+from .qmixbus import UnitPrefix, TimeUnit
+from .qmixpump import VolumeUnit
+from .qmixmotion import PositionUnit
+
+
+class Quantity(Enum):
+    """
+    Identifiers of the physical quantities a device unit can be configured for
+    """
+    volume = 0
+    flow = 1
+    position = 2
+    velocity = 3
+
+
+# Conversion factors of the unit identifiers into the base unit of their
+# dimension (litres, meters, radian)
+_BASE_FACTORS = {
+    VolumeUnit.litres: ("volume", 1.0),
+    PositionUnit.meters: ("length", 1.0),
+    PositionUnit.revolutions: ("angle", 2 * math.pi),
+    PositionUnit.degree: ("angle", math.pi / 180),
+    PositionUnit.radian: ("angle", 1.0),
+    PositionUnit.device: ("device", 1.0),
+}
+
+
+# Unit identifiers by their raw identifier value
+_UNIT_IDS = {unitid.value: unitid for unitid in _BASE_FACTORS}
+
+
+@functools.lru_cache(maxsize=None)
+def _base_factor(unit):
+    """
+    Returns the dimension, the factor that converts a value in the given
+    unit without its prefix into the base unit of its dimension and the
+    decimal exponent of the unit prefix.
+
+    The unit is a tuple (prefix, unitid) for volumes and positions or a tuple
+    (prefix, unitid, time_unitid) for flows and velocities, like the named
+    tuples returned by the get_*_unit() functions of the devices. Raw
+    integer identifiers are accepted, unknown identifiers raise a
+    ValueError.
+    """
+    prefix, unitid = unit[0], unit[1]
+    if unitid not in _BASE_FACTORS:
+        if unitid not in _UNIT_IDS:
+            raise ValueError("Unknown unit identifier {}".format(unitid))
+        unitid = _UNIT_IDS[unitid]
+    dimension, factor = _BASE_FACTORS[unitid]
+    if len(unit) > 2:
+        dimension += "/time"
+        factor /= TimeUnit(unit[2]).value
+    return dimension, factor, UnitPrefix(prefix).value
+
+
+@functools.lru_cache(maxsize=None)
+def conversion_factor(from_unit, to_unit):
+    """
+    Returns the factor that converts values from from_unit into to_unit.
+
+    The prefixes are applied as one power of ten of the prefix difference,
+    so conversions between decimal prefixes are exact. Raises a ValueError
+    if both units do not have the same dimension. Device specific position
+    units can only be converted into device units.
+    """
+    from_unit = tuple(from_unit)
+    to_unit = tuple(to_unit)
+    from_dimension, from_factor, from_prefix = _base_factor(from_unit)
+    to_dimension, to_factor, to_prefix = _base_factor(to_unit)
+    if from_dimension != to_dimension:
+        raise ValueError("Cannot convert {} into {}".format(from_unit, to_unit))
+    return from_factor / to_factor * 10.0 ** (from_prefix - to_prefix)
+
+
+def convert(values, from_unit, to_unit, out = None):
+    """
+    Converts a scalar or a NumPy array from from_unit into to_unit.
+
+    Scalars are returned as float. For arrays, the conversion is done as one
+    vectorized multiplication. If an output array is given, the result is
+    written into this array - pass the input array to convert in place.
+    """
+    factor = conversion_factor(tuple(from_unit), tuple(to_unit))
+    if out is None and np.isscalar(values):
+        return float(values) * factor
+    return np.multiply(values, factor, out=out)
+
+
+def get_device_unit(device, quantity : Quantity, refresh = False):
+    """
+    Returns the currently configured unit of a device for the given quantity.
+
+    Each device object remembers the last unit that has been set or queried
+    via this object. The unit is only read from the device if it is not
+    known yet or if refresh is set. The remembered unit is stale if the unit
+    has been changed via another device object or another application - set
+    refresh in this case.
+    """
+    unit = getattr(device, quantity.name + "_unit", None)
+    if unit is None or refresh:
+        unit = getattr(device, "get_" + quantity.name + "_unit")()
+    return unit
+
+
+def convert_from_device(device, quantity : Quantity, values, to_unit, out = None):
+    """
+    Converts values read from a device in its configured unit into to_unit
+    """
+    return convert(values, get_device_unit(device, quantity), to_unit, out)
+
+
+def convert_to_device(device, quantity : Quantity, values, from_unit, out = None):
+    """
+    Converts values given in from_unit into the configured unit of a device
+    """
+    return convert(values, from_unit, get_device_unit(device, quantity), out)
@@ -1,13 +1,38 @@
 import ctypes
+import time
+import weakref
 from . import qmixbus
 from . import _qmixloadlib
 
 valve_api = _qmixloadlib.load_lib("labbCAN_Valve_API")
 
+# Valves with a cached position by handle value - used to invalidate the
+# position cache if a device event is received for a valve
+_cached_valves = weakref.WeakValueDictionary()
+
+
+def invalidate_on_event(event : qmixbus.Event):
+    """
+    Invalidates the position cache of the valve the given event belongs to.
+
+    Pass all events read via qmixbus.Bus.read_event() to this function to
+    ensure that valve errors or reinitialisations clear the position cache.
+    """
+    if not event.is_valid():
+        return
+    handle = event.device.handle
+    valve = _cached_valves.get(getattr(handle, "value", handle))
+    if valve is not None:
+        valve.invalidate_position_cache()
+
 
 class Valve(qmixbus.Device):
     def __init__(self, handle = ctypes.c_longlong()):
         super().__init__(handle)
+        self.invalidate_position_cache()
+        # Smoothed duration of the last valve switches used to predict when
+        # the next switch will be finished
+        self.switch_duration_s = None
 
     #-------------------------------------------------------------------------
     # Initialisaton
@@ -24,6 +49,7 @@ class Valve(qmixbus.Device):
         Initialize internal valve handle using the given name.
         """
         self.handle = ctypes.c_longlong()
+        self.invalidate_position_cache()
         result = valve_api.LCV_LookupValveByName(ctypes.c_char_p(name.encode('ascii')), ctypes.byref(self.handle))
         qmixbus.throw_on_error(result)
 
@@ -34,6 +60,7 @@ class Valve(qmixbus.Device):
         Initialize the internal pump handle using the given index.
         """
         self.handle = ctypes.c_longlong()
+        self.invalidate_position_cache()
         result = valve_api.LCV_GetValveHandle(index, ctypes.byref(self.handle))
         qmixbus.throw_on_error(result)
 
@@ -56,16 +83,87 @@ class Valve(qmixbus.Device):
 
         Each valve position is identified by a logical valve position identifier
         from 0 - number of valve positions - 1. This function returns the logical
-        valve position identifier for the current valve position.
+        valve position identifier for the current valve position. The reading
+        becomes the cached position and a commanded target position that
+        does not match the reading is dropped.
         """
         result = valve_api.LCV_ActualValvePosition(self.handle)
         qmixbus.throw_on_error(result)
+        self.cached_position = result
+        if self.target_position != result:
+            self.target_position = None
+        self._register_cache()
         return result
 
 
-    def switch_valve_to_position(self, logical_valve_position):
+    def _register_cache(self):
+        """
+        Registers the valve for invalidate_on_event() - called whenever the
+        cached actual or target position is written
+        """
+        _cached_valves[getattr(self.handle, "value", self.handle)] = self
+
+
+    def invalidate_position_cache(self):
+        """
+        Clears the cached actual and target valve position.
+
+        The next call of switch_valve_to_position() sends the switch command
+        to the device.
+        """
+        self.cached_position = None
+        self.target_position = None
+
+
+    def switch_valve_to_position(self, logical_valve_position, force = False):
         """
         Switches the valve to a certain logical valve position.
+
+        The command is not sent if the last read actual position, i.e. from
+        actual_valve_position(), equals the requested position. A position
+        that has only been commanded is not trusted because the valve may
+        have been moved by another valve object or externally. Set force to
+        True to always send the command. Returns True if the command has
+        been sent.
         """
+        if not force and self.cached_position == logical_valve_position:
+            return False
+        self.invalidate_position_cache()
         result = valve_api.LCV_SwitchValveToPosition(self.handle, ctypes.c_int(logical_valve_position))
         qmixbus.throw_on_error(result)
+        self.target_position = logical_valve_position
+        self._register_cache()
+        return True
+
+
+    def switch_and_wait(self, logical_valve_position, timeout_s = 5, min_poll_s = 0.005,
+        max_poll_s = 0.1):
+        """
+        Switches the valve to a certain logical valve position and waits until
+        the valve reached this position or until the timeout occurs.
+
+        The function returns immediately if the last read actual position
+        equals the requested position. Otherwise it sleeps for most of the predicted
+        switch duration and then polls the actual position, starting with the
+        minimum poll period and increasing it up to the maximum poll period.
+        Returns True if the valve reached the requested position.
+        """
+        if self.cached_position == logical_valve_position:
+            return True
+        start = time.monotonic()
+        self.switch_valve_to_position(logical_valve_position)
+        deadline = start + timeout_s
+        if self.switch_duration_s is not None:
+            time.sleep(min(self.switch_duration_s * 0.8, timeout_s))
+        poll_s = min_poll_s
+        while True:
+            if self.actual_valve_position() == logical_valve_position:
+                duration = time.monotonic() - start
+                self.switch_duration_s = duration if self.switch_duration_s is None \
+                    else 0.7 * self.switch_duration_s + 0.3 * duration
+                return True
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            time.sleep(min(poll_s, deadline - now))
+            poll_s = min(poll_s * 1.5, max_poll_s)
@@ -0,0 +1,206 @@
+import ctypes
+import threading
+import numpy as np
+from enum import Enum
+from collections import namedtuple
+from . import qmixbus
+from . import qmixanalogio
+
+
+WaveformStatistics = namedtuple("waveform_statistics", ["count", "missed", "rate_hz",
+    "jitter_mean_ms", "jitter_p50_ms", "jitter_p99_ms", "jitter_max_ms", "updates",
+    "writes", "cycles", "triggers"])
+
+
+class PlaybackMode(Enum):
+    """
+    Playback modes of a waveform player
+    """
+    oneshot = 0
+    loop = 1
+    triggered = 2
+
+
+
+class WaveformPlayer:
+    """
+    Streams sampled waveforms to one or more analog output channels via
+    write_output().
+
+    The waveform contains one row per update and one column per channel. A
+    one dimensional waveform is played on all channels. The player thread
+    uses a drift free deadline timer. If the player falls behind, missed
+    updates are coalesced - only the sample of the current deadline is
+    written, so the waveform stays aligned to wall clock time and is not
+    stretched. A value is only written to a channel if it differs from the
+    last value written. In oneshot mode the waveform is played once, in loop
+    mode it is repeated until stop() is called. In triggered mode the
+    waveform is played once after each trigger, i.e. a call of trigger() or
+    a trigger source function that returns true. The trigger source is
+    polled once per update period. Between playbacks the outputs keep their
+    last value. If a stop value is given, it is written to all channels
+    when the player stops.
+    """
+    def __init__(self, channels, waveform, update_rate_hz = 100,
+        mode : PlaybackMode = PlaybackMode.oneshot, trigger_source = None,
+        stop_value = None, spin_s = 0.002):
+        self.channels = list(channels)
+        waveform = np.asarray(waveform, dtype=np.float64)
+        if waveform.ndim == 1:
+            waveform = np.repeat(waveform[:, np.newaxis], len(self.channels), axis=1)
+        if waveform.ndim != 2 or waveform.shape[1] != len(self.channels):
+            raise ValueError("The waveform requires one column per channel")
+        if waveform.shape[0] == 0:
+            raise ValueError("The waveform requires at least one sample")
+        self.waveform = waveform
+        self.period_s = 1.0 / update_rate_hz
+        self.mode = mode
+        self.trigger_source = trigger_source
+        self.stop_value = stop_value
+        self.timer = qmixbus.DeadlineTimer(self.period_s, spin_s)
+        self.statistics = qmixbus.LoopStatistics(self.period_s)
+        self.update_count = 0
+        self.write_count = 0
+        self.cycle_count = 0
+        self.trigger_count = 0
+        self.error = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._trigger_event = threading.Event()
+
+    def get_duration(self):
+        """
+        Returns the duration of one playback of the waveform in seconds
+        """
+        return len(self.waveform) * self.period_s
+
+    def start(self):
+        """
+        Starts the player thread
+        """
+        if self.is_running():
+            return
+        self.error = None
+        self.update_count = 0
+        self.write_count = 0
+        self.cycle_count = 0
+        self.trigger_count = 0
+        self.statistics.reset()
+        self._stop_event.clear()
+        self._trigger_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """
+        Starts the next playback in triggered mode
+        """
+        self._trigger_event.set()
+
+    def stop(self):
+        """
+        Stops the player thread. If the player thread terminated with an
+        error, this error is raised.
+        """
+        self._stop_event.set()
+        self._trigger_event.set()
+        self.wait_finished()
+        if self.error is not None:
+            raise self.error
+
+    def wait_finished(self, timeout_s = None):
+        """
+        Waits until the player finished playing or until the timeout occurs.
+        Returns true if the player finished.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout_s)
+        return not self.is_running()
+
+    def is_running(self):
+        """
+        Returns true if the player thread is running
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _wait_trigger(self):
+        """
+        Waits until the player is triggered. Returns false if the player
+        has been stopped.
+        """
+        while not self._stop_event.is_set():
+            if self._trigger_event.is_set() or \
+                (self.trigger_source is not None and self.trigger_source()):
+                if self._stop_event.is_set():
+                    break
+                self._trigger_event.clear()
+                self.trigger_count += 1
+                return True
+            self._trigger_event.wait(self.period_s)
+        return False
+
+    def _play(self, write, last):
+        """
+        Plays the waveform once or, in loop mode, until the player is stopped
+        """
+        samples = self.waveform.tolist()
+        sample_count = len(samples)
+        loop = self.mode == PlaybackMode.loop
+        timer = self.timer
+        timer.start()
+        index = 0
+        while not self._stop_event.is_set():
+            values = samples[index]
+            for i, value in enumerate(values):
+                if value != last[i]:
+                    write(i, value)
+                    last[i] = value
+            self.update_count += 1
+            if not loop and index + 1 >= sample_count:
+                self.cycle_count += 1
+                break
+            tick = timer.tick
+            lateness = timer.wait_next()
+            self.statistics.add(lateness, timer.tick - tick - 1)
+            if loop:
+                self.cycle_count = timer.tick // sample_count
+                index = timer.tick % sample_count
+            else:
+                index = min(timer.tick, sample_count - 1)
+
+    def _run(self):
+        """
+        Thread function of the waveform player
+        """
+        write_output = qmixanalogio.analogio_api.LCAIO_WriteOutput
+        handles = [channel.handle for channel in self.channels]
+        def write(i, value):
+            qmixbus.throw_on_error(write_output(handles[i], ctypes.c_double(value)),
+                "LCAIO_WriteOutput")
+            self.write_count += 1
+        last = [None] * len(handles)
+        try:
+            if self.mode != PlaybackMode.triggered:
+                self._play(write, last)
+            else:
+                while self._wait_trigger():
+                    self._play(write, last)
+        except qmixbus.DeviceError as e:
+            self.error = e
+        finally:
+            if self.stop_value is not None:
+                for i in range(len(handles)):
+                    try:
+                        write(i, self.stop_value)
+                    except qmixbus.DeviceError:
+                        pass
+
+    def get_statistics(self):
+        """
+        Returns the jitter and missed deadline statistics of the player loop
+        and the number of updates, channel writes, completed playbacks and
+        triggers as named tuple. Missed deadlines are coalesced updates. In
+        triggered mode the rate includes the time between the playbacks.
+        """
+        return WaveformStatistics(*self.statistics.get_statistics(), self.update_count,
+            self.write_count, self.cycle_count, self.trigger_count)
@@ -0,0 +1,55 @@
+import unittest
+import sys
+import numpy as np
+
+from qmixsdk import qmixtelemetry
+
+
+class QmixAggregationTestCase(unittest.TestCase):
+    """
+    Test of the multi resolution stream aggregation - does not require any
+    device
+    """
+    def setUp(self):
+        # 25 s of samples every 250 ms - the values of the second column are
+        # the negated values of the first column
+        self.aggregator = qmixtelemetry.StreamAggregator(columns=2, resolutions_s=(10, 1),
+            capacity=100)
+        self.times_s = np.arange(100) * 0.25
+        for time_s in self.times_s:
+            self.aggregator.append(int(time_s * 1e9), (time_s, -time_s))
+
+
+    def test_finest_level(self):
+        window = self.aggregator.get_window(1)
+        self.assertEqual(len(window.timestamps_ns), 24)
+        np.testing.assert_array_equal(window.timestamps_ns, np.arange(24) * 10**9)
+        np.testing.assert_allclose(window.min[:, 0], np.arange(24))
+        np.testing.assert_allclose(window.max[:, 0], np.arange(24) + 0.75)
+        np.testing.assert_allclose(window.mean[:, 0], np.arange(24) + 0.375)
+        np.testing.assert_allclose(window.last[:, 0], np.arange(24) + 0.75)
+        np.testing.assert_allclose(window.min[:, 1], -(np.arange(24) + 0.75))
+        np.testing.assert_array_equal(window.count, np.full(24, 4))
+
+
+    def test_coarse_level(self):
+        window = self.aggregator.get_window(10)
+        np.testing.assert_array_equal(window.timestamps_ns, [0, 10 * 10**9])
+        for i, start_s in enumerate((0, 10)):
+            samples = self.times_s[(self.times_s >= start_s) & (self.times_s < start_s + 10)]
+            self.assertEqual(window.count[i], len(samples))
+            self.assertAlmostEqual(window.min[i, 0], samples.min())
+            self.assertAlmostEqual(window.max[i, 0], samples.max())
+            self.assertAlmostEqual(window.mean[i, 0], samples.mean())
+            self.assertAlmostEqual(window.last[i, 0], samples[-1])
+            self.assertAlmostEqual(window.mean[i, 1], -samples.mean())
+        self.assertEqual(len(self.aggregator.get_window(10, 1).timestamps_ns), 1)
+
+
+    def test_unknown_level(self):
+        self.assertRaises(ValueError, self.aggregator.get_level, 60)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
@@ -5,6 +5,8 @@ import sys
 
 from qmixsdk import qmixbus
 from qmixsdk import qmixanalogio
+from qmixsdk import qmixacquisition
+from qmixsdk import qmixwaveform
 
 
 class QmixAnalogIoTestCase(test_common.QmixTestBase):
@@ -93,6 +95,54 @@ class QmixAnalogIoTestCase(test_common.QmixTestBase):
         print("Output device: ", outputdevice.get_device_name())
 
 
+    def step09_input_scanner(self):
+        print("Scanning input channels...")
+        self.input.enable_software_scaling(False)
+        raw = self.input.read_input()
+        scanner = qmixanalogio.AnalogInputScanner([self.input, self.input], factors=2.0,
+            offsets=1.0, block_size=4)
+        values = scanner.scan()
+        print("Scanned values: ", values)
+        self.assertAlmostEqual(values[0], raw * 2.0 + 1.0, delta=0.5)
+        self.assertIs(scanner.scan(), values)
+        block = scanner.scan_block(period_s=0.01)
+        print("Scanned block: ", block)
+        self.assertEqual(block.shape, (4, 2))
+
+
+    def step10_acquisition_engine(self):
+        print("Testing acquisition engine...")
+        engine = qmixacquisition.AcquisitionEngine([self.input], rate_hz=100, capacity=1000)
+        engine.start()
+        time.sleep(1)
+        engine.stop()
+        statistics = engine.get_statistics()
+        print("Acquisition statistics: ", statistics)
+        self.assertGreater(statistics.count, 50)
+        window = engine.get_window(10)
+        self.assertEqual(window.values.shape, (10, 1))
+
+
+    def step11_waveform_player(self):
+        print("Playing output waveform...")
+        waveform = [0, 2.5, 5, 2.5]
+        player = qmixwaveform.WaveformPlayer([self.output], waveform, update_rate_hz=20)
+        player.start()
+        self.assertTrue(player.wait_finished(2))
+        print("Waveform statistics: ", player.get_statistics())
+        self.assertEqual(player.get_statistics().cycles, 1)
+        self.assertAlmostEqual(self.output.get_output_vaue(), 2.5, delta=0.1)
+
+        player = qmixwaveform.WaveformPlayer([self.output], waveform, update_rate_hz=20,
+            mode=qmixwaveform.PlaybackMode.triggered, stop_value=0)
+        player.start()
+        player.trigger()
+        time.sleep(0.5)
+        player.stop()
+        self.assertEqual(player.get_statistics().triggers, 1)
+        self.assertAlmostEqual(self.output.get_output_vaue(), 0, delta=0.1)
+
+
     def step25_capi_close(self):
         print("Closing bus...")
         self.bus.stop()
@@ -0,0 +1,66 @@
+import test_common
+import unittest
+import time
+import sys
+
+from qmixsdk import qmixbus
+from qmixsdk import qmixpump
+from qmixsdk import qmixcontiflow
+
+
+class QmixContiFlowTestCase(test_common.QmixTestBase):
+    """
+    Test for testing the continuous flow engine with two syringe pumps
+    that have a valve
+    """
+    def step01_capi_open(self):
+        print("Opening bus with deviceconfig ", deviceconfig)
+        self.bus = qmixbus.Bus()
+        self.bus.open(deviceconfig, 0)
+
+
+    def step02_device_name_lookup(self):
+        print("Looking up devices...")
+        self.pumps = []
+        for name in ["neMESYS_Low_Pressure_1_Pump", "neMESYS_Low_Pressure_2_Pump"]:
+            pump = qmixpump.Pump()
+            pump.lookup_by_name(name)
+            self.pumps.append(pump)
+
+
+    def step03_bus_start(self):
+        print("Starting bus communication...")
+        self.bus.start()
+
+
+    def step04_pump_enable(self):
+        print("Enabling pump drives...")
+        for pump in self.pumps:
+            if pump.is_in_fault_state():
+                pump.clear_fault()
+            if not pump.is_enabled():
+                pump.enable(True)
+            self.assertTrue(pump.is_enabled())
+
+
+    def step05_continuous_flow(self):
+        print("Testing continuous flow...")
+        flow = min(pump.get_flow_rate_max() for pump in self.pumps) / 4
+        engine = qmixcontiflow.ContinuousFlowEngine(self.pumps, flow, 0, 1)
+        engine.start()
+        time.sleep(60)
+        engine.stop()
+        statistics = engine.get_statistics()
+        print("Continuous flow statistics: ", statistics)
+        self.assertGreater(statistics.samples, 0)
+
+
+    def step25_capi_close(self):
+        print("Closing bus...")
+        self.bus.stop()
+        self.bus.close()
+
+if __name__ == '__main__':
+    deviceconfig = sys.argv[1]
+    del sys.argv[1:]
+    unittest.main()
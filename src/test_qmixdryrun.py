@@ -0,0 +1,83 @@
+import unittest
+import sys
+
+from qmixsdk import qmixdryrun
+
+
+class QmixDryRunTestCase(unittest.TestCase):
+    """
+    Test of the dry run timing estimation - does not require any device
+    """
+    def setUp(self):
+        self.dry_run = qmixdryrun.DryRun()
+        self.pump = self.dry_run.add_pump(qmixdryrun.PumpModel("pump", 10, 100,
+            fill_level=50))
+        self.axis = self.dry_run.add_axis(qmixdryrun.AxisModel("axis", 10, 0, 1000,
+            position=500))
+        self.valve = self.dry_run.add_valve(qmixdryrun.ValveModel("valve", 4, 0.5))
+
+
+    def test_dosing_duration(self):
+        def script():
+            self.pump.aspirate(20, 10)
+            while self.pump.is_pumping():
+                self.dry_run.sleep(0.1)
+            self.pump.dispense(70, 5)
+        result = self.dry_run.run(script)
+        self.assertEqual(len(result.timeline), 2)
+        self.assertAlmostEqual(result.duration_s, 16.0, places=6)
+        self.dry_run.sleep(14)
+        self.assertAlmostEqual(self.pump.get_fill_level(), 0.0)
+
+
+    def test_stop_ends_running_command(self):
+        def script():
+            self.pump.generate_flow(1.0)
+            self.dry_run.sleep(5)
+            self.pump.stop_pumping()
+            self.axis.move_with_velocity(1)
+            self.dry_run.sleep(2)
+            self.axis.stop_move()
+        result = self.dry_run.run(script)
+        self.assertAlmostEqual(result.duration_s, 7.0)
+        self.assertAlmostEqual(result.timeline[0].end_s, 5.0)
+        self.assertAlmostEqual(self.pump.get_fill_level(), 45.0)
+        self.assertAlmostEqual(self.axis.get_actual_position(), 502.0)
+
+
+    def test_new_command_ends_running_command(self):
+        def script():
+            self.axis.move_to_position(1000, 1)
+            self.dry_run.sleep(1)
+            self.axis.move_to_position(0, 10)
+            self.valve.switch_valve_to_position(1)
+            self.valve.switch_valve_to_position(2)
+        result = self.dry_run.run(script)
+        self.assertAlmostEqual(result.timeline[0].end_s, 1.0)
+        self.assertAlmostEqual(result.timeline[1].end_s, 1.0 + 50.1)
+        self.assertAlmostEqual(result.timeline[2].end_s, 1.0)
+        self.assertAlmostEqual(result.duration_s, 51.1)
+
+
+    def test_invalid_commands(self):
+        self.assertRaises(ValueError, self.pump.dispense, 10, 0)
+        self.assertRaises(ValueError, self.pump.dispense, 60, 1)
+        self.assertRaises(ValueError, self.pump.aspirate, 10, 20)
+        self.assertRaises(ValueError, self.axis.move_to_position, 800, 0)
+        self.assertRaises(ValueError, self.axis.move_to_position, 2000, 1)
+        self.assertRaises(ValueError, self.valve.switch_valve_to_position, 4)
+        self.axis.move_with_velocity(0)
+        self.assertEqual(self.dry_run.timeline[-1].command, "stop_move")
+
+
+    def test_bus_latency(self):
+        dry_run = qmixdryrun.DryRun(latency_s=0.01)
+        valve = dry_run.add_valve(qmixdryrun.ValveModel("valve", 4, 0.5))
+        valve.switch_valve_to_position(1)
+        self.assertEqual(dry_run.bus_calls, 1)
+        self.assertAlmostEqual(dry_run.now, 0.01)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
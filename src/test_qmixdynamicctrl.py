@@ -6,6 +6,7 @@ import sys
 from qmixsdk import qmixbus
 from qmixsdk import qmixcontroller
 from qmixsdk import qmixanalogio
+from qmixsdk import qmixtelemetry
 
 class QmixDynamicControlTestCase(test_common.QmixTestBase):
     """
@@ -62,6 +63,7 @@ class QmixDynamicControlTestCase(test_common.QmixTestBase):
     
 
         setpoint = 50
+        aggregator = qmixtelemetry.StreamAggregator(resolutions_s=(10, 60))
         self.control_channel.write_setpoint(setpoint)
         self.control_channel.enable_control_loop(True)
         print("Control loop enables. This test runs until the actual value raises above ", 
@@ -69,6 +71,7 @@ class QmixDynamicControlTestCase(test_common.QmixTestBase):
         actual_value = self.control_channel.read_actual_value()
         while actual_value < (setpoint - 1):
             actual_value = self.control_channel.read_actual_value()
+            aggregator.append(time.monotonic_ns(), [actual_value])
             print("Actual value: ", actual_value)
             time.sleep(1)
 
@@ -78,9 +81,14 @@ class QmixDynamicControlTestCase(test_common.QmixTestBase):
             setpoint - 10)
         while actual_value > (setpoint - 10):
             actual_value = self.control_channel.read_actual_value()
+            aggregator.append(time.monotonic_ns(), [actual_value])
             print("Actual value: ", actual_value)
             time.sleep(1)
 
+        minutes = aggregator.get_window(60)
+        print("Actual value per minute (min, max, mean): ", minutes.min[:, 0],
+            minutes.max[:, 0], minutes.mean[:, 0])
+
         
     def step25_capi_close(self):
         print("Closing bus...")
@@ -0,0 +1,89 @@
+import os
+import json
+import tempfile
+import unittest
+import sys
+
+from qmixsdk import qmixpersist
+
+
+class CounterAxis:
+    """
+    Axis replacement with a position counter
+    """
+    def __init__(self, name, counter):
+        self.name = name
+        self.counter = counter
+
+    def get_device_name(self):
+        return self.name
+
+    def get_position_counter(self):
+        return self.counter
+
+    def restore_position_counter(self, counter):
+        self.counter = counter
+
+
+
+class QmixPersistTestCase(unittest.TestCase):
+    """
+    Test of the position counter persistence - does not require any device
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "counters.json")
+        self.axis = CounterAxis("axis_x", 1234)
+        self.store = qmixpersist.PositionCounterStore(self.path, axes=[self.axis])
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_clean_round_trip(self):
+        self.assertIsNone(self.store.load())
+        self.assertTrue(self.store.save(clean=True))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+        self.axis.counter = 0
+        snapshot = self.store.restore()
+        self.assertTrue(snapshot.clean)
+        self.assertEqual(snapshot.axes, {"axis_x": 1234})
+        self.assertEqual(self.axis.counter, 1234)
+
+
+    def test_unclean_snapshot(self):
+        self.assertTrue(self.store.save())
+        self.assertFalse(self.store.save())
+        self.assertEqual(self.store.write_count, 1)
+        self.assertIsNone(self.store.load())
+        snapshot = self.store.load(require_clean=False)
+        self.assertFalse(snapshot.clean)
+        self.assertIsNone(self.store.load(require_clean=False, max_age_s=-1))
+
+
+    def test_corrupted_snapshot(self):
+        self.store.save(clean=True)
+        with open(self.path) as f:
+            data = json.load(f)
+        data["payload"]["axes"]["axis_x"] = 0
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+        self.assertIsNone(self.store.load())
+        with open(self.path, "w") as f:
+            f.write('{"payload": {"version": 1')
+        self.assertIsNone(self.store.restore())
+        self.assertEqual(self.axis.counter, 1234)
+
+
+    def test_periodic_snapshots(self):
+        self.store.interval_s = 0.01
+        self.store.start()
+        self.assertIsNone(self.store.load())
+        self.store.stop()
+        self.assertTrue(self.store.load().clean)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
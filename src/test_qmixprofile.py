@@ -0,0 +1,82 @@
+import test_common
+import unittest
+import sys
+
+from qmixsdk import qmixbus
+from qmixsdk import qmixpump
+from qmixsdk import qmixprofile
+
+
+class QmixFlowProfileTestCase(test_common.QmixTestBase):
+    """
+    Test for testing the flow profile player with a single pump
+    """
+    def step01_capi_open(self):
+        print("Opening bus with deviceconfig ", deviceconfig)
+        self.bus = qmixbus.Bus()
+        self.bus.open(deviceconfig, 0)
+
+
+    def step02_device_name_lookup(self):
+        print("Looking up devices...")
+        self.pump = qmixpump.Pump()
+        self.pump.lookup_by_name("neMESYS_Low_Pressure_1_Pump")
+
+
+    def step03_bus_start(self):
+        print("Starting bus communication...")
+        self.bus.start()
+
+
+    def step04_pump_enable(self):
+        print("Enabling pump drive...")
+        if self.pump.is_in_fault_state():
+            self.pump.clear_fault()
+        if not self.pump.is_enabled():
+            self.pump.enable(True)
+        self.assertTrue(self.pump.is_enabled())
+
+
+    def step05_fill_syringe(self):
+        print("Filling syringe...")
+        self.pump.set_fill_level(self.pump.get_volume_max(), self.pump.get_flow_rate_max())
+        timer = qmixbus.PollingTimer(30000)
+        self.assertTrue(timer.wait_until(self.pump.is_pumping, False))
+
+
+    def step06_flow_ramp(self):
+        print("Testing flow ramp...")
+        max_flow = self.pump.get_flow_rate_max() / 10
+        profile = qmixprofile.FlowProfile.from_points([(0, 0), (5, max_flow), (10, 0)])
+        player = qmixprofile.FlowProfilePlayer([self.pump], profile, update_rate_hz=20)
+        player.start()
+        self.assertTrue(player.wait_finished(20))
+        player.stop()
+        print("Timing statistics: ", player.get_timing_statistics())
+        record = player.get_record()
+        self.assertEqual(record.commanded.shape, record.measured.shape)
+
+
+    def step07_gradient_mixer(self):
+        print("Testing gradient mixer...")
+        max_flow = self.pump.get_flow_rate_max() / 10
+        mixer = qmixprofile.GradientMixer([self.pump], max_flow, [0, 5], [[1], [1]])
+        self.assertRaises(ValueError, qmixprofile.GradientMixer, [self.pump],
+            max_flow, [0, 5], [[1], [0.5]])
+        self.assertRaises(ValueError, qmixprofile.GradientMixer, [self.pump],
+            max_flow, [], [])
+        mixer.start()
+        self.assertTrue(mixer.wait_finished(20))
+        mixer.stop()
+        print("Timing statistics: ", mixer.get_timing_statistics())
+
+
+    def step25_capi_close(self):
+        print("Closing bus...")
+        self.bus.stop()
+        self.bus.close()
+
+if __name__ == '__main__':
+    deviceconfig = sys.argv[1]
+    del sys.argv[1:]
+    unittest.main()
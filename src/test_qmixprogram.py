@@ -0,0 +1,71 @@
+import unittest
+import sys
+
+from qmixsdk import qmixprogram
+
+
+class SetpointRecorder:
+    """
+    Controller channel replacement that records the written setpoints
+    """
+    def __init__(self):
+        self.setpoints = []
+
+    def write_setpoint(self, setpoint):
+        self.setpoints.append(setpoint)
+
+
+
+class QmixProgramTestCase(unittest.TestCase):
+    """
+    Test of the dosing program compilation - does not require any device
+    """
+    def setUp(self):
+        self.heater = SetpointRecorder()
+        self.cooler = SetpointRecorder()
+        self.program = qmixprogram.DosingProgram()
+        self.program.write_setpoint("heat", self.heater, 50, estimate_s=4)
+        self.program.write_setpoint("cool", self.cooler, 10, estimate_s=1)
+        self.program.wait_until("heated", lambda: True, [self.heater], estimate_s=3)
+        self.program.wait_until("mixed", lambda: True, after=["cool"], estimate_s=5)
+        self.program.write_setpoint("off", self.heater, 0, after=["mixed"], estimate_s=0.5)
+
+
+    def test_dependencies(self):
+        dependencies = self.program.get_dependencies()
+        self.assertEqual(dependencies["heat"], set())
+        self.assertEqual(dependencies["cool"], set())
+        self.assertEqual(dependencies["heated"], {"heat"})
+        self.assertEqual(dependencies["mixed"], {"cool"})
+        self.assertEqual(dependencies["off"], {"heated", "mixed"})
+
+
+    def test_critical_path(self):
+        estimated_s, path = self.program.get_critical_path()
+        self.assertAlmostEqual(estimated_s, 7.5)
+        self.assertEqual(path, ["heat", "heated", "off"])
+
+
+    def test_invalid_programs(self):
+        self.assertRaises(ValueError, self.program.wait_until, "heat", lambda: True)
+        program = qmixprogram.DosingProgram()
+        program.wait_until("a", lambda: True, after=["b"])
+        program.wait_until("b", lambda: True, after=["a"])
+        self.assertRaises(ValueError, program.compile)
+        program = qmixprogram.DosingProgram()
+        program.wait_until("a", lambda: True, after=["unknown"])
+        self.assertRaises(ValueError, program.compile)
+
+
+    def test_run(self):
+        result = self.program.run(timeout_s=5)
+        self.assertTrue(result.finished)
+        self.assertAlmostEqual(result.estimated_s, 7.5)
+        self.assertEqual(self.heater.setpoints, [50, 0])
+        self.assertEqual(self.cooler.setpoints, [10])
+        self.assertGreaterEqual(result.steps["off"].start_s, result.steps["mixed"].end_s)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
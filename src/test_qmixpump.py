@@ -2,10 +2,18 @@ import test_common
 import unittest
 import time
 import sys
+import os
+import tempfile
 
 from qmixsdk import qmixbus
 from qmixsdk import qmixpump
 from qmixsdk import qmixvalve
+from qmixsdk import qmixunits
+from qmixsdk import qmixmonitor
+from qmixsdk import qmixrouting
+from qmixsdk import qmixprogram
+from qmixsdk import qmixdryrun
+from qmixsdk import qmixpersist
 from qmixsdk.qmixbus import UnitPrefix, TimeUnit
 
 class CapiNemesysTestCase(test_common.QmixTestBase):
@@ -196,6 +204,195 @@ class CapiNemesysTestCase(test_common.QmixTestBase):
             self.assertEqual(i, valve_pos_is)
 
 
+    def step15_pump_group(self):
+        print("Testing pump group...")
+        group = qmixpump.PumpGroup([self.pump])
+        max_flow = self.pump.get_flow_rate_max() / 2
+        skew = group.generate_flow(max_flow)
+        print("Start skew ms: ", skew)
+        time.sleep(1)
+        self.assertTrue(group.is_pumping())
+        skew = group.stop_pumping()
+        print("Stop skew ms: ", skew)
+        finished = self.wait_dosage_finished(self.pump, 10)
+        self.assertEqual(True, finished)
+
+
+    def step16_unit_conversion(self):
+        print("Testing unit conversion...")
+        self.pump.set_volume_unit(qmixpump.UnitPrefix.milli, qmixpump.VolumeUnit.litres)
+        max_ml = self.pump.get_volume_max()
+        micro_litres = (qmixpump.UnitPrefix.micro, qmixpump.VolumeUnit.litres)
+        max_ul = qmixunits.convert_from_device(self.pump, qmixunits.Quantity.volume,
+            max_ml, micro_litres)
+        self.pump.set_volume_unit(*micro_litres)
+        self.assertAlmostEqual(max_ul, self.pump.get_volume_max())
+        self.assertEqual(1000.0, qmixunits.conversion_factor(
+            (qmixpump.UnitPrefix.milli, qmixpump.VolumeUnit.litres), micro_litres))
+        self.assertRaises(ValueError, qmixunits.conversion_factor, (0, 99), micro_litres)
+
+        self.pump.set_flow_unit(qmixpump.UnitPrefix.milli, qmixpump.VolumeUnit.litres,
+            qmixpump.TimeUnit.per_second)
+        max_ml_s = self.pump.get_flow_rate_max()
+        ml_min = (qmixpump.UnitPrefix.milli, qmixpump.VolumeUnit.litres,
+            qmixpump.TimeUnit.per_minute)
+        self.assertAlmostEqual(max_ml_s * 60, qmixunits.convert(max_ml_s,
+            self.pump.get_flow_unit(), ml_min))
+        self.pump.set_volume_unit(qmixpump.UnitPrefix.milli, qmixpump.VolumeUnit.litres)
+
+
+    def step17_read_state(self):
+        print("Testing pump state reading...")
+        state = self.pump.read_state()
+        print("Pump state: ", state)
+        self.assertEqual(state.enabled, self.pump.is_enabled())
+        self.assertAlmostEqual(state.fill_level, self.pump.get_fill_level())
+        reader = qmixpump.PumpStateReader([self.pump])
+        states = reader.read()
+        self.assertEqual(bool(states["enabled"][0]), state.enabled)
+
+
+    def step18_state_monitor(self):
+        print("Testing state change monitor...")
+        monitor = qmixmonitor.StateChangeMonitor(qmixmonitor.pump_fields(self.pump))
+        monitor.start()
+        self.pump.aspirate(self.pump.get_volume_max() / 10, self.pump.get_flow_rate_max())
+        finished = self.wait_dosage_finished(self.pump, 30)
+        self.assertEqual(True, finished)
+        time.sleep(1)
+        monitor.stop()
+        changes = []
+        change = monitor.get_change(0)
+        while change is not None:
+            print("State change: ", change)
+            changes.append(change)
+            change = monitor.get_change(0)
+        pumping = [change.new for change in changes if change.field == "is_pumping"]
+        self.assertIn(True, pumping)
+        self.assertEqual(False, pumping[-1])
+
+
+    def step19_valve_cache(self):
+        print("Testing valve position cache...")
+        if not self.pump.has_valve():
+            print("no valve installed")
+            return
+
+        valve = self.pump.get_valve()
+        for i in range (valve.number_of_valve_positions()):
+            self.assertTrue(valve.switch_and_wait(i, 5))
+            self.assertEqual(i, valve.actual_valve_position())
+            self.assertFalse(valve.switch_valve_to_position(i))
+            print("Switch duration: ", valve.switch_duration_s)
+        valve.invalidate_position_cache()
+        self.assertTrue(valve.switch_valve_to_position(0))
+        self.assertTrue(valve.switch_and_wait(0, 5))
+
+
+    def step20_valve_routing(self):
+        print("Testing valve routing...")
+        if not self.pump.has_valve():
+            print("no valve installed")
+            return
+
+        network = qmixrouting.ValveNetwork()
+        network.add_valve("pump_valve", self.pump.get_valve(),
+            {0: [("syringe", "inlet")], 1: [("syringe", "outlet")]})
+        network.compile()
+        plan = network.connect("syringe", "outlet")
+        print("Route: ", plan.route.ports, " switches: ", plan.switches)
+        self.assertEqual(1, self.pump.get_valve().actual_valve_position())
+        self.assertEqual([], network.plan("outlet", "syringe").switches)
+        self.assertEqual([("pump_valve", 0)], network.plan("inlet", "syringe").switches)
+
+        selector = qmixrouting.ValveNetwork()
+        positions = {i: [("source", "manifold" + str(i))] for i in range(9)}
+        positions[8].append(("product", "drain"))
+        selector.add_valve("selector", self.pump.get_valve(), positions)
+        for i in range(9):
+            selector.add_connection("manifold" + str(i), "product")
+        self.assertEqual([("selector", 8)],
+            selector.plan("source", "drain", {"selector": 0}).switches)
+        self.assertEqual([], selector.plan("source", "product", {"selector": 8}).switches)
+
+
+    def step21_transfer(self):
+        print("Testing fluid transfer...")
+        if not self.pump.has_valve():
+            print("no valve installed")
+            return
+
+        max_volume = self.pump.get_volume_max() / 10
+        max_flow = self.pump.get_flow_rate_max() / 2
+        timing = self.pump.transfer(max_volume, max_flow, 0, 1, timeout_s=30)
+        print("Transfer timing: ", timing)
+        self.assertTrue(timing.finished)
+        self.assertFalse(self.pump.is_pumping())
+
+
+    def step22_dosing_program(self):
+        print("Testing dosing program...")
+        if not self.pump.has_valve():
+            print("no valve installed")
+            return
+
+        valve = self.pump.get_valve()
+        max_volume = self.pump.get_volume_max() / 10
+        max_flow = self.pump.get_flow_rate_max() / 2
+        program = qmixprogram.DosingProgram()
+        program.switch_valve("inlet", valve, 0)
+        program.aspirate("aspirate", self.pump, max_volume, max_flow)
+        program.switch_valve("outlet", valve, 1)
+        program.dispense("dispense", self.pump, max_volume, max_flow)
+        self.assertEqual(program.get_dependencies()["dispense"], {"aspirate", "outlet"})
+        estimated_s, path = program.get_critical_path()
+        self.assertEqual(path, ["inlet", "aspirate", "outlet", "dispense"])
+        result = program.run(timeout_s=30)
+        print("Program result: ", result)
+        self.assertTrue(result.finished)
+        self.assertFalse(self.pump.is_pumping())
+
+
+    def step23_dry_run(self):
+        print("Testing dry run estimation...")
+        latency_s = qmixdryrun.measure_call_latency(self.pump.is_pumping)
+        print("Bus call latency: ", latency_s)
+        dry_run = qmixdryrun.DryRun(latency_s)
+        model = qmixdryrun.PumpModel.from_pump(self.pump)
+        self.assertAlmostEqual(model.fill_level, self.pump.get_fill_level())
+        model.fill_level = 0.0
+        pump = dry_run.add_pump(model)
+        volume = model.volume_max / 2
+        flow = model.flow_max / 2
+
+        def script(pump):
+            pump.aspirate(volume, flow)
+            while pump.is_pumping():
+                dry_run.sleep(0.1)
+            pump.dispense(volume, flow)
+
+        result = dry_run.run(script, pump)
+        print("Dry run result: ", result)
+        self.assertEqual(len(result.timeline), 2)
+        self.assertGreaterEqual(result.duration_s,
+            2 * self.pump.estimate_dosing_duration(volume, flow))
+
+
+    def step24_counter_persistence(self):
+        print("Testing position counter persistence...")
+        path = os.path.join(tempfile.mkdtemp(), "counters.json")
+        store = qmixpersist.PositionCounterStore(path, [self.pump], interval_s=0.1)
+        store.start()
+        time.sleep(0.3)
+        self.assertIsNone(store.load())
+        store.stop()
+        snapshot = store.restore()
+        print("Restored snapshot: ", snapshot)
+        self.assertTrue(snapshot.clean)
+        self.assertEqual(snapshot.pumps[self.pump.get_pump_name()],
+            self.pump.get_position_counter_value())
+
+
     def step25_capi_close(self):
         print("Closing bus...")
         self.bus.stop()
@@ -5,6 +5,9 @@ import sys
 
 from qmixsdk import qmixbus
 from qmixsdk import qmixmotion
+from qmixsdk import qmixtrajectory
+from qmixsdk import qmixjog
+from qmixsdk import qmixhoming
 from qmixsdk.qmixbus import UnitPrefix, TimeUnit
 from collections import namedtuple
 
@@ -161,6 +164,71 @@ class QmixRotaxysTestCase(test_common.QmixTestBase):
         rotaxys360.set_device_property(0, value)
         self.assertEqual(value, rotaxys360.get_device_property(0))
 
+    def step09_waypoint_streaming(self):
+        print("Streaming waypoints...")
+        self.rotaxys.enable(True)
+        positions = [(-49.51, -121.49), (49.26, -121.49), (-49.51, -58.50), (49.26, -58.50)]
+        reached = []
+        streamer = qmixtrajectory.WaypointStreamer(self.rotaxys, 1)
+        result = streamer.run(positions, lambda index, position: reached.append(index))
+        for segment in result.segments:
+            print("Segment: ", segment)
+        self.assertEqual(reached, [0, 1, 2, 3])
+        self.assertTrue(self.rotaxys.is_target_position_reached())
+        self.rotaxys.enable(False)
+
+    def step10_waypoint_ordering(self):
+        print("Ordering waypoints...")
+        positions = [(-49.51, -121.49), (49.26, -58.50), (-49.51, -58.50), (49.26, -121.49)]
+        streamer = qmixtrajectory.WaypointStreamer(self.rotaxys, 1)
+        order = streamer.order(positions, start=positions[0])
+        print("Order: ", order)
+        self.assertEqual(sorted(order.order), [0, 1, 2, 3])
+        self.assertEqual(order.order[0], 0)
+
+    def step11_axis_state_reader(self):
+        print("Reading axis states...")
+        self.assertIs(self.rotaxys.get_axis_device(0), self.rotaxys.get_axis_device(0))
+        reader = qmixmotion.AxisStateReader([self.rotaxys])
+        states = reader.read()
+        print("Axis states: ", states)
+        self.assertEqual(len(states), self.rotaxys.get_axes_count())
+        self.assertEqual(states["position"][0], self.rotaxys.get_axis_device(0).read_state().position)
+        self.assertIs(reader.read(), states)
+
+    def step12_jog_controller(self):
+        print("Jogging Z axis...")
+        self.rotaxys.enable(True)
+        zaxis = self.rotaxys.get_axis_device(2)
+        jog = qmixjog.JogController(zaxis, update_rate_hz=50, watchdog_s=0.2)
+        jog.start()
+        for i in range(10):
+            jog.set_velocity(-zaxis.get_velocity_max() / 10)
+            time.sleep(0.05)
+        time.sleep(0.5)
+        print("Jog statistics: ", jog.get_statistics())
+        self.assertGreaterEqual(jog.watchdog_stops, 1)
+        jog.stop()
+        self.assertTrue(zaxis.is_stopped())
+        self.rotaxys.enable(False)
+
+    def step13_homing_orchestrator(self):
+        print("Homing with orchestrator...")
+        self.rotaxys.enable(True)
+        orchestrator = qmixhoming.HomingOrchestrator([self.rotaxys], timeout_s=30)
+        results = orchestrator.run()
+        print("Homing results: ", results)
+        self.assertEqual(results[0].action, "homed")
+        self.assertTrue(results[0].finished)
+
+        counters = {axis.get_device_name(): axis.get_position_counter()
+            for axis in self.rotaxys.get_axes()}
+        orchestrator = qmixhoming.HomingOrchestrator([self.rotaxys], saved_counters=counters)
+        results = orchestrator.run()
+        print("Restore results: ", results)
+        self.assertEqual(results[0].action, "restored")
+        self.rotaxys.enable(False)
+
     def step25_capi_close(self):
         print("Closing bus...")
         self.bus.stop()
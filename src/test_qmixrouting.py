@@ -0,0 +1,56 @@
+import unittest
+import sys
+
+from qmixsdk import qmixrouting
+
+
+class QmixRoutingTestCase(unittest.TestCase):
+    """
+    Test of the valve network route planning - does not require any device
+    """
+    def setUp(self):
+        # Selector valve that connects the source to one of nine manifold
+        # ports - position 8 also connects the product port to the drain
+        self.network = qmixrouting.ValveNetwork()
+        positions = {i: [("source", "manifold" + str(i))] for i in range(9)}
+        positions[8].append(("product", "drain"))
+        self.network.add_valve("selector", None, positions)
+        for i in range(9):
+            self.network.add_connection("manifold" + str(i), "product")
+
+
+    def test_shortest_routes(self):
+        routes = self.network.get_routes("source", "product")
+        self.assertEqual(len(routes), 9)
+        self.assertEqual(routes[0].ports, ("source", "manifold0", "product"))
+        self.assertEqual(routes[0].positions, {"selector": 0})
+        self.assertEqual([len(route.ports) for route in routes], [3] * 9)
+
+
+    def test_inconsistent_positions(self):
+        # The drain is only reachable via position 8, which also has to be
+        # the position that connects the source to the manifold
+        routes = self.network.get_routes("source", "drain")
+        self.assertEqual([route.ports for route in routes],
+            [("source", "manifold8", "product", "drain")])
+        self.assertEqual(routes[0].positions, {"selector": 8})
+
+
+    def test_plan_fewest_switches(self):
+        plan = self.network.plan("source", "drain", {"selector": 0})
+        self.assertEqual(plan.switches, [("selector", 8)])
+        plan = self.network.plan("source", "product", {"selector": 5})
+        self.assertEqual(plan.switches, [])
+        self.assertEqual(plan.route.ports, ("source", "manifold5", "product"))
+        self.assertRaises(ValueError, self.network.plan, "source", "unknown", {})
+
+
+    def test_compile_limits(self):
+        self.network.compile(max_routes=2)
+        self.assertEqual(len(self.network.get_routes("source", "product")), 2)
+        self.assertRaises(ValueError, self.network.compile, max_states=5)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+import sys
+import numpy as np
+
+from qmixsdk import qmixstore
+
+
+class QmixStoreTestCase(unittest.TestCase):
+    """
+    Test of the memory mapped telemetry store - does not require any device
+    """
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp_dir.name, "store")
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    def test_round_trip(self):
+        store = qmixstore.TelemetryStore(self.directory, ["fill_level", "flow"],
+            segment_records=4, flush_interval=2)
+        for i in range(3):
+            store.append(i * 10, (i, -i))
+        timestamps = np.arange(3, 10) * 10
+        store.append_block(timestamps, np.column_stack([np.arange(3, 10), -np.arange(3, 10)]))
+        store.close()
+
+        reader = qmixstore.TelemetryStoreReader(self.directory)
+        index = reader.get_segment_index()
+        self.assertEqual([entry[1:] for entry in index],
+            [(0, 30, 4), (40, 70, 4), (80, 90, 2)])
+        records = reader.read_range()
+        np.testing.assert_array_equal(records["timestamp_ns"], np.arange(10) * 10)
+        np.testing.assert_array_equal(records["fill_level"], np.arange(10))
+        np.testing.assert_array_equal(records["flow"], -np.arange(10))
+        records = reader.read_range(25, 75)
+        np.testing.assert_array_equal(records["timestamp_ns"], [30, 40, 50, 60, 70])
+
+
+    def test_reopen(self):
+        store = qmixstore.TelemetryStore(self.directory, ["value"], segment_records=4)
+        store.append(1, (1.0,))
+        store.close()
+        self.assertRaises(ValueError, qmixstore.TelemetryStore, self.directory, ["other"])
+        store = qmixstore.TelemetryStore(self.directory, ["value"], segment_records=100)
+        self.assertEqual(store.segment_records, 4)
+        store.append(2, (2.0,))
+        store.close()
+        records = qmixstore.TelemetryStoreReader(self.directory).read_range()
+        np.testing.assert_array_equal(records["value"], [1.0, 2.0])
+
+
+    def test_max_segments(self):
+        store = qmixstore.TelemetryStore(self.directory, ["value"], segment_records=2,
+            max_segments=2)
+        store.append_block(np.arange(7), np.arange(7))
+        store.close()
+        reader = qmixstore.TelemetryStoreReader(self.directory)
+        self.assertEqual(len(reader.get_segment_index()), 2)
+        np.testing.assert_array_equal(reader.read_range()["timestamp_ns"], [4, 5, 6])
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
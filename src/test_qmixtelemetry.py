@@ -0,0 +1,95 @@
+import test_common
+import unittest
+import time
+import sys
+import tempfile
+import numpy as np
+
+from qmixsdk import qmixbus
+from qmixsdk import qmixpump
+from qmixsdk import qmixtelemetry
+from qmixsdk import qmixstore
+from qmixsdk import qmixrecorder
+
+
+class QmixTelemetryTestCase(test_common.QmixTestBase):
+    """
+    Test for testing the telemetry sampler with the signals of a pump
+    """
+    def step01_capi_open(self):
+        print("Opening bus with deviceconfig ", deviceconfig)
+        self.bus = qmixbus.Bus()
+        self.bus.open(deviceconfig, 0)
+
+
+    def step02_device_name_lookup(self):
+        print("Looking up devices...")
+        self.pump = qmixpump.Pump()
+        self.pump.lookup_by_name("neMESYS_Low_Pressure_1_Pump")
+
+
+    def step03_bus_start(self):
+        print("Starting bus communication...")
+        self.bus.start()
+
+
+    def step04_sampler(self):
+        print("Testing telemetry sampler...")
+        signals = qmixtelemetry.pump_signals(self.pump)
+        self.sampler = qmixtelemetry.TelemetrySampler(signals, rate_hz=20, capacity=100)
+        self.sampler.start()
+        time.sleep(2)
+        self.sampler.stop()
+        window = self.sampler.get_window(10)
+        print("Latest samples: ", window.values)
+        self.assertEqual(len(window.timestamps_ns), 10)
+        self.assertEqual(window.values.shape, (10, len(signals)))
+        print("Timing statistics: ", self.sampler.get_timing_statistics())
+
+
+    def step05_store(self):
+        print("Testing telemetry store...")
+        signals = qmixtelemetry.pump_signals(self.pump)
+        with tempfile.TemporaryDirectory() as directory:
+            store = qmixstore.TelemetryStore(directory, [signal.name for signal in signals],
+                segment_records=10)
+            sampler = qmixtelemetry.TelemetrySampler(signals, rate_hz=20, sinks=[store])
+            sampler.start()
+            time.sleep(2)
+            sampler.stop()
+            store.close()
+            reader = qmixstore.TelemetryStoreReader(directory)
+            records = reader.read_range()
+            print("Stored records: ", len(records))
+            self.assertEqual(len(records), sampler.buffer.count)
+            self.assertGreater(len(reader.get_segment_index()), 1)
+
+
+    def step06_run_recorder(self):
+        print("Testing run recorder...")
+        signals = qmixtelemetry.pump_signals(self.pump)
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = qmixrecorder.RunRecorder(directory, [signal.name for signal in signals])
+            sampler = qmixtelemetry.TelemetrySampler(signals, rate_hz=20, sinks=[recorder])
+            pump = recorder.record_device(self.pump)
+            sampler.start()
+            pump.generate_flow(np.float64(0))
+            pump.stop_pumping()
+            time.sleep(1)
+            sampler.stop()
+            recorder.close()
+            commands, telemetry = qmixrecorder.load_run(directory)
+            self.assertEqual(list(commands["command"]), ["generate_flow", "stop_pumping"])
+            self.assertEqual(commands["value0"][0], 0.0)
+            self.assertEqual(len(telemetry["timestamp_ns"]), sampler.buffer.count)
+
+
+    def step25_capi_close(self):
+        print("Closing bus...")
+        self.bus.stop()
+        self.bus.close()
+
+if __name__ == '__main__':
+    deviceconfig = sys.argv[1]
+    del sys.argv[1:]
+    unittest.main()
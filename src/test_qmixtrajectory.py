@@ -0,0 +1,61 @@
+import unittest
+import sys
+import numpy as np
+
+from qmixsdk import qmixtrajectory
+
+
+class QmixTrajectoryTestCase(unittest.TestCase):
+    """
+    Test of the waypoint ordering - does not require any device
+    """
+    def test_travel_times(self):
+        times = qmixtrajectory.travel_times([(0, 0), (0, 0)], [(3, 4), (3, 0)], velocity=1)
+        np.testing.assert_allclose(times, [5.0, 3.0])
+        times = qmixtrajectory.travel_times((0, 0), (3, 4), velocity_max=(1, 2))
+        self.assertAlmostEqual(float(times), 3.0)
+        times = qmixtrajectory.travel_times((0, 0), (3, 4), velocity=10,
+            velocity_max=(1, 2), seconds_per_distance=2)
+        self.assertAlmostEqual(float(times), 6.0)
+
+
+    def test_points_on_a_line(self):
+        points = [(5, 0), (1, 0), (4, 0), (2, 0), (3, 0)]
+        order = qmixtrajectory.order_waypoints(points, start=(0, 0))
+        self.assertEqual(list(order.order), [1, 3, 4, 2, 0])
+        self.assertAlmostEqual(order.travel_s, 5.0)
+
+
+    def test_crossing_removed(self):
+        # Visiting the corners in the given order crosses the diagonals
+        points = [(0, 0), (1, 1), (1, 0), (0, 1)]
+        order = qmixtrajectory.order_waypoints(points)
+        self.assertEqual(order.order[0], 0)
+        self.assertEqual(sorted(order.order), [0, 1, 2, 3])
+        self.assertAlmostEqual(order.travel_s, 3.0)
+
+
+    def test_random_grid(self):
+        rng = np.random.default_rng(1)
+        points = rng.uniform(0, 100, (300, 2))
+        order = qmixtrajectory.order_waypoints(points, start=(0, 0), neighbours=8)
+        self.assertEqual(sorted(order.order), list(range(len(points))))
+        visited = np.vstack([[(0, 0)], points[order.order]])
+        travel_s = float(np.sum(qmixtrajectory.travel_times(visited[:-1], visited[1:], 1.0)))
+        self.assertAlmostEqual(order.travel_s, travel_s)
+        unordered = np.vstack([[(0, 0)], points])
+        self.assertLess(order.travel_s, 0.2 * float(np.sum(
+            qmixtrajectory.travel_times(unordered[:-1], unordered[1:], 1.0))))
+
+
+    def test_few_points(self):
+        order = qmixtrajectory.order_waypoints([], start=(0, 0))
+        self.assertEqual(len(order.order), 0)
+        order = qmixtrajectory.order_waypoints([(3, 4)], start=(0, 0))
+        self.assertEqual(list(order.order), [0])
+        self.assertAlmostEqual(order.travel_s, 5.0)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])
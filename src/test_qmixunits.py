@@ -0,0 +1,84 @@
+import unittest
+import sys
+import numpy as np
+
+from qmixsdk import qmixunits
+from qmixsdk.qmixbus import UnitPrefix, TimeUnit
+from qmixsdk.qmixpump import VolumeUnit
+from qmixsdk.qmixmotion import PositionUnit
+
+
+class UnitRecorder:
+    """
+    Device replacement that counts the unit queries
+    """
+    def __init__(self, unit):
+        self.unit = unit
+        self.volume_unit = None
+        self.queries = 0
+
+    def get_volume_unit(self):
+        self.queries += 1
+        self.volume_unit = self.unit
+        return self.unit
+
+
+
+class QmixUnitsTestCase(unittest.TestCase):
+    """
+    Test of the unit conversion - does not require any device
+    """
+    millilitres = (UnitPrefix.milli, VolumeUnit.litres)
+    microlitres = (UnitPrefix.micro, VolumeUnit.litres)
+
+    def test_conversion_factor(self):
+        self.assertEqual(qmixunits.conversion_factor(self.millilitres, self.microlitres),
+            1000.0)
+        self.assertEqual(qmixunits.conversion_factor(self.microlitres, self.millilitres),
+            0.001)
+        self.assertEqual(qmixunits.conversion_factor((-3, 68), self.microlitres), 1000.0)
+        millilitres_per_second = self.millilitres + (TimeUnit.per_second,)
+        millilitres_per_minute = self.millilitres + (TimeUnit.per_minute,)
+        self.assertAlmostEqual(qmixunits.conversion_factor(millilitres_per_second,
+            millilitres_per_minute), 60.0)
+        self.assertAlmostEqual(qmixunits.conversion_factor(
+            (UnitPrefix.unit, PositionUnit.revolutions),
+            (UnitPrefix.unit, PositionUnit.degree)), 360.0)
+
+
+    def test_invalid_units(self):
+        self.assertRaises(ValueError, qmixunits.conversion_factor, (0, 99),
+            self.microlitres)
+        self.assertRaises(ValueError, qmixunits.conversion_factor, self.millilitres,
+            (UnitPrefix.milli, PositionUnit.meters))
+        self.assertRaises(ValueError, qmixunits.conversion_factor, self.millilitres,
+            self.millilitres + (TimeUnit.per_second,))
+        self.assertRaises(ValueError, qmixunits.conversion_factor,
+            (UnitPrefix.unit, PositionUnit.device), (UnitPrefix.unit, PositionUnit.meters))
+
+
+    def test_convert(self):
+        self.assertIsInstance(qmixunits.convert(2, self.millilitres, self.microlitres),
+            float)
+        values = np.array([0.5, 1.0, 2.0])
+        converted = qmixunits.convert(values, self.millilitres, self.microlitres)
+        np.testing.assert_array_equal(converted, [500.0, 1000.0, 2000.0])
+        self.assertIs(qmixunits.convert(values, self.millilitres, self.microlitres,
+            out=values), values)
+        np.testing.assert_array_equal(values, converted)
+
+
+    def test_device_unit(self):
+        device = UnitRecorder(self.millilitres)
+        self.assertEqual(qmixunits.convert_from_device(device, qmixunits.Quantity.volume,
+            1.5, self.microlitres), 1500.0)
+        self.assertEqual(qmixunits.convert_to_device(device, qmixunits.Quantity.volume,
+            1500, self.microlitres), 1.5)
+        self.assertEqual(device.queries, 1)
+        qmixunits.get_device_unit(device, qmixunits.Quantity.volume, refresh=True)
+        self.assertEqual(device.queries, 2)
+
+
+if __name__ == '__main__':
+    # run_pytest.sh passes a device configuration that is not required here
+    unittest.main(argv=sys.argv[:1])